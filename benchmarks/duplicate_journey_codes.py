@@ -0,0 +1,120 @@
+"""
+Benchmark the duplicate journey code check on synthetic journeys: the per row
+MD5 of each journey's concatenated, sorted lists it used to group calendars
+by against the 64 bit calendar keys hashed in bulk, checking both find the
+same duplicates.
+
+Runs without AWS or a database:
+
+    python benchmarks/duplicate_journey_codes.py --journeys 100000
+"""
+
+import argparse
+import hashlib
+import sys
+from time import perf_counter
+
+sys.path.append("./src/boilerplate")
+sys.path.append("./src/template")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from duplicate_journey_code import (  # noqa: E402
+    calendar_keys,
+    duplicated_journey_codes,
+)
+
+DAYS_OF_WEEK = [
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday",
+    "Sunday",
+]
+
+
+def synthetic_journeys(journeys: int) -> pd.DataFrame:
+    """
+    Journeys with one or two operating profile days, up to one operating and
+    non operating date exception and serviced organisation each, and "[]"
+    where a lookup found none, as the dataframe holds them
+    """
+    rng = np.random.default_rng(0)
+    days = DAYS_OF_WEEK
+    dates = [str(day.date()) for day in pd.date_range("2024-01-01", periods=30)]
+
+    def pick(pool, low, high):
+        count = rng.integers(low, high)
+        if not count:
+            return "[]"
+        return [str(value) for value in rng.choice(pool, count, replace=False)]
+
+    return pd.DataFrame(
+        {
+            "vehicle_journey_id": np.arange(journeys),
+            "line_ref": rng.choice(["NOCT:PB0001:1", "NOCT:PB0001:2"], journeys),
+            "journey_code": rng.integers(0, 500, journeys).astype(str),
+            "day_of_week": [pick(days, 1, 3) for _ in range(journeys)],
+            "operating_date": [pick(dates[:15], 0, 2) for _ in range(journeys)],
+            "non_operating_date": [pick(dates[15:], 0, 2) for _ in range(journeys)],
+            "serviced_organisation_id": [
+                pick(["1", "2", "3"], 0, 2) for _ in range(journeys)
+            ],
+            "operating_on_working_days": rng.choice([True, None], journeys),
+        }
+    )
+
+
+def legacy_hash(row):
+    return hashlib.md5(
+        str(
+            sorted(
+                list(row["non_operating_date"])
+                + list(row["operating_date"])
+                + list(row["day_of_week"])
+                + list(row["serviced_organisation_id"])
+            )
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+def legacy(df: pd.DataFrame) -> pd.Series:
+    df = df.assign(hash=df.apply(legacy_hash, axis=1))
+    return df.duplicated(
+        subset=["line_ref", "journey_code", "hash", "operating_on_working_days"],
+        keep=False,
+    )
+
+
+def bulk(df: pd.DataFrame) -> pd.Series:
+    return duplicated_journey_codes(df.assign(calendar_key=calendar_keys(df)))
+
+
+def run(label, find, df, repeat):
+    best, duplicates = None, None
+    for _ in range(repeat):
+        start = perf_counter()
+        duplicates = find(df)
+        seconds = perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    print(f"{label:>18}: {best:7.3f}s  {int(duplicates.sum())} duplicates")
+    return duplicates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--journeys", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = synthetic_journeys(args.journeys)
+    print(f"{args.journeys} journeys, best of {args.repeat}")
+    expected = run("apply() MD5", legacy, df, args.repeat)
+    assert run("calendar keys", bulk, df, args.repeat).equals(expected)
+
+
+if __name__ == "__main__":
+    main()
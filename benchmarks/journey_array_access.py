@@ -0,0 +1,92 @@
+"""
+Benchmark JourneyArrays against the vehicle journey dataframe on a synthetic
+file of stop rows: memory, loading each persisted (Parquet against memory
+mapped .npy files) and visiting every journey's stops (groupby against
+slices of the arrays).
+
+Runs without AWS or a database:
+
+    python benchmarks/journey_array_access.py --rows 1000000
+"""
+
+import argparse
+import sys
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+sys.path.append("./src/boilerplate")
+sys.path.append("./benchmarks")
+
+from data_persistence import PersistenceFormat, deserialise, serialise  # noqa: E402
+from dataframes import compact_vehicle_journey_df  # noqa: E402
+from journey_arrays import JourneyArrays  # noqa: E402
+from persisted_data_format import synthetic_vehicle_journeys  # noqa: E402
+
+
+def best(function, repeat):
+    seconds, result = [], None
+    for _ in range(repeat):
+        start = perf_counter()
+        result = function()
+        seconds.append(perf_counter() - start)
+    return min(seconds), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--stops-per-journey", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = synthetic_vehicle_journeys(args.rows, args.stops_per_journey)
+    compact = compact_vehicle_journey_df(df)
+    seconds, arrays = best(lambda: JourneyArrays.from_frame(compact), args.repeat)
+    print(
+        f"{args.rows} stop rows of {len(arrays)} journeys, arrays built in "
+        f"{seconds:.2f}s, best of {args.repeat}"
+    )
+    print(
+        f"memory: frame {df.memory_usage(deep=True).sum() / 2**20:.1f} MiB  "
+        f"compact {compact.memory_usage(deep=True).sum() / 2**20:.1f} MiB  "
+        f"arrays {arrays.nbytes / 2**20:.1f} MiB"
+    )
+
+    data = serialise(compact, PersistenceFormat.PARQUET)
+    parquet, _ = best(lambda: deserialise(data), args.repeat)
+    with TemporaryDirectory() as directory:
+        arrays.save(f"{directory}/arrays")
+        mapped, loaded = best(
+            lambda: JourneyArrays.load(f"{directory}/arrays"), args.repeat
+        )
+        first_stops, _ = best(
+            lambda: loaded.to_frame(loaded.journey_offsets[:-1]), args.repeat
+        )
+    print(
+        f"load: parquet {parquet:.3f}s  memory mapped {mapped:.4f}s, "
+        f"then first stops as a frame {first_stops:.3f}s"
+    )
+
+    def grouped():
+        return sum(
+            int(stops["is_timing_point"].sum())
+            for _, stops in compact.groupby("vehicle_journey_id")
+        )
+
+    def sliced():
+        return sum(
+            int(arrays.journey(journey)["is_timing_point"].sum())
+            for journey in range(len(arrays))
+        )
+
+    grouped_seconds, grouped_count = best(grouped, args.repeat)
+    sliced_seconds, sliced_count = best(sliced, args.repeat)
+    assert grouped_count == sliced_count
+    print(
+        f"timing points of each journey: groupby {grouped_seconds:.3f}s  "
+        f"slices {sliced_seconds:.3f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
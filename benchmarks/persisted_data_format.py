@@ -0,0 +1,160 @@
+"""
+Benchmark the pickle and Parquet formats PersistedData stores the vehicle
+journey dataframe in, on a synthetic file of stop rows: stored size, load
+time and peak memory of a full load and of a load of only the columns a
+check needs, which for Parquet reads only those column chunks.
+
+Runs without AWS or a database, the S3 object is held in memory:
+
+    python benchmarks/persisted_data_format.py --rows 1000000
+"""
+
+import argparse
+import multiprocessing
+import sys
+import tempfile
+from datetime import time
+from os.path import join
+from time import perf_counter
+
+sys.path.append("./src/boilerplate")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from data_persistence import (  # noqa: E402
+    PersistenceFormat,
+    S3ObjectFile,
+    deserialise,
+    pq,
+    serialise,
+)
+
+PROJECTED_COLUMNS = [
+    "atco_code",
+    "common_name",
+    "vehicle_journey_id",
+    "service_pattern_stop_id",
+]
+
+
+class InMemoryS3:
+    """
+    Stands in for S3Client, serving ranged GETs from bytes
+    """
+
+    def __init__(self, data: bytes):
+        self._data = data
+
+    def get_object_range(self, bucket, key, start, end):
+        return self._data[start : end + 1]
+
+
+def synthetic_vehicle_journeys(rows: int, stops_per_journey: int) -> pd.DataFrame:
+    n = np.arange(rows)
+    stops = n % 50000
+    sequence = n % stops_per_journey
+    journeys = n // stops_per_journey
+    departures = [time(5 + minute // 60 % 19, minute % 60) for minute in range(1440)]
+    return pd.DataFrame(
+        {
+            "is_timing_point": n % 3 == 0,
+            "naptan_stop_id": np.where(n % 10 == 0, np.nan, stops),
+            "auto_sequence_number": sequence,
+            "atco_code": "0100BRP" + pd.Series(stops).astype(str),
+            "departure_time": [departures[s * 2 % 1440] for s in sequence],
+            "common_name": "Stop " + pd.Series(stops).astype(str),
+            "service_pattern_stop_id": n,
+            "activity": np.array(["pickUp", "setDown", "pickUpAndSetDown"])[n % 3],
+            "start_time": [departures[j % 720] for j in journeys],
+            "direction": np.where(n % 2 == 0, "outbound", "inbound"),
+            "vehicle_journey_id": journeys,
+            "vehicle_journey_code": pd.Series(journeys).astype(str),
+        }
+    )
+
+
+def peak_rss() -> int:
+    """
+    High water mark of the process's resident memory in bytes. Unlike
+    ru_maxrss it isn't carried over from the parent across exec (Linux only)
+    """
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def load(path, columns, result):
+    """
+    Load the stored object in a fresh process so its peak RSS is the load's
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    baseline = peak_rss()
+    start = perf_counter()
+    bytes_read = len(data)
+    if columns and data[:4] == b"PAR1":
+        source = S3ObjectFile(InMemoryS3(data), "bucket", "key", len(data))
+        df = (
+            pq.ParquetFile(source, pre_buffer=True)
+            .read(columns=columns, use_pandas_metadata=True)
+            .to_pandas()
+        )
+        bytes_read = source.bytes_read
+    else:
+        df = deserialise(data, columns=columns)
+    seconds = perf_counter() - start
+    result.put((seconds, peak_rss() - baseline, bytes_read, len(df)))
+
+
+def measure(path, columns, repeat):
+    """
+    Best wall time and largest peak memory of the load over repeat runs
+    """
+    context = multiprocessing.get_context("spawn")
+    runs = []
+    for _ in range(repeat):
+        result = context.Queue()
+        process = context.Process(target=load, args=(path, columns, result))
+        process.start()
+        runs.append(result.get())
+        process.join()
+    return (
+        min(run[0] for run in runs),
+        max(run[1] for run in runs),
+        runs[0][2],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--stops-per-journey", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = synthetic_vehicle_journeys(args.rows, args.stops_per_journey)
+    print(
+        f"{args.rows} stop rows, frame "
+        f"{df.memory_usage(deep=True).sum() / 2**20:.1f} MiB, best of {args.repeat}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        for persistence_format in PersistenceFormat:
+            data = serialise(df, persistence_format)
+            path = join(directory, persistence_format.value)
+            with open(path, "wb") as f:
+                f.write(data)
+            for label, columns in (("all", None), ("projected", PROJECTED_COLUMNS)):
+                seconds, peak, bytes_read = measure(path, columns, args.repeat)
+                print(
+                    f"{persistence_format.value:>8} {label:>9}: "
+                    f"size {len(data) / 2**20:7.1f} MiB  "
+                    f"read {bytes_read / 2**20:7.1f} MiB  "
+                    f"load {seconds:6.2f}s  peak {peak / 2**20:7.1f} MiB"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Benchmark the six stop sequence checks on a synthetic file: each grouping or
+sorting the vehicle journey dataframe by journey for itself, as they did,
+against one StopSequences the six evaluate together, checking both find the
+same stops.
+
+Runs without AWS or a database:
+
+    python benchmarks/stop_sequence_checks.py --journeys 50000
+"""
+
+import argparse
+import sys
+from time import perf_counter
+
+sys.path.append("./src/boilerplate")
+sys.path.append("./src/template")
+sys.path.append("./benchmarks")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from dataframes import compact_vehicle_journey_df, time_of_day_seconds  # noqa: E402
+from first_stop_is_not_a_timing_point import (  # noqa: E402
+    find_first_stops_not_timing_points,
+)
+from first_stop_is_set_down_only import find_set_down_only_first_stops  # noqa: E402
+from last_stop_is_not_a_timing_point import (  # noqa: E402
+    find_last_stops_not_timing_points,
+)
+from last_stop_is_pick_up_only import find_pick_up_only_last_stops  # noqa: E402
+from missing_journey_code import find_journeys_missing_journey_code  # noqa: E402
+from no_timing_point_for_more_than_15_minutes import timing_point_gaps  # noqa: E402
+from stop_sequences import StopSequences  # noqa: E402
+from timing_point_gaps import synthetic_timing_points  # noqa: E402
+
+FIRST_STOP_ACTIVITIES = ["pickUp", "pickUpDriverRequest", "pickUpAndSetDown"]
+LAST_STOP_ACTIVITIES = ["setDown", "setDownDriverRequest", "pickUpAndSetDown"]
+
+
+def synthetic_stops(journeys: int, stops_per_journey: int) -> pd.DataFrame:
+    """
+    The timing point benchmark's stops in no particular order, with some
+    first and last stops that pick up or set down only and some journeys
+    missing their journey code
+    """
+    rng = np.random.default_rng(0)
+    df = synthetic_timing_points(journeys, stops_per_journey)
+    df["activity"] = rng.choice(
+        ["pickUpAndSetDown", "pickUp", "setDown"], len(df), p=[0.9, 0.05, 0.05]
+    )
+    missing = df["vehicle_journey_id"] % 50 == 0
+    df["vehicle_journey_code"] = df["vehicle_journey_code"].where(~missing, None)
+    return df.sample(frac=1, random_state=0)
+
+
+def missing_journey_code(df: pd.DataFrame) -> pd.Series:
+    return df["vehicle_journey_code"].isnull() | (df["vehicle_journey_code"] == "")
+
+
+def separate(df: pd.DataFrame) -> dict:
+    """
+    The six checks as they were, each grouping the dataframe by journey
+    """
+    first = df.loc[df.groupby("vehicle_journey_id").auto_sequence_number.idxmin()]
+    last = df.loc[df.groupby("vehicle_journey_id").auto_sequence_number.idxmax()]
+    missing = df[
+        df["vehicle_journey_id"].isin(
+            df[missing_journey_code(df)]["vehicle_journey_id"].unique()
+        )
+    ]
+    missing = (
+        missing.sort_values(["vehicle_journey_id", "auto_sequence_number"])
+        .groupby("vehicle_journey_id")
+        .first()
+    )
+    timing_points = df[df["is_timing_point"] == True].sort_values(  # noqa: E712
+        ["vehicle_journey_id", "auto_sequence_number"], kind="stable"
+    )
+    same_journey = timing_points["vehicle_journey_id"].eq(
+        timing_points["vehicle_journey_id"].shift()
+    )
+    time_diff = (
+        time_of_day_seconds(timing_points["departure_time"])
+        .diff()
+        .where(same_journey)
+        .fillna(0)
+    )
+    gap_positions = np.flatnonzero((time_diff > 15 * 60).to_numpy(dtype=bool))
+    gaps = timing_points.iloc[gap_positions]
+    previous = timing_points.iloc[gap_positions - 1].add_prefix("previous_")
+    previous.index = gaps.index
+    return {
+        "first set down only": first[~first["activity"].isin(FIRST_STOP_ACTIVITIES)],
+        "last pick up only": last[~last["activity"].isin(LAST_STOP_ACTIVITIES)],
+        "first not timing point": first[~first["is_timing_point"] == True],  # noqa
+        "last not timing point": last[~last["is_timing_point"] == True],  # noqa
+        "missing journey code": missing["service_pattern_stop_id"],
+        "15 minute gaps": pd.concat([gaps, previous], axis=1),
+    }
+
+
+def fused(df: pd.DataFrame) -> dict:
+    """
+    The six checks evaluated against one StopSequences
+    """
+    sequences = StopSequences(df)
+    return {
+        "first set down only": find_set_down_only_first_stops(sequences),
+        "last pick up only": find_pick_up_only_last_stops(sequences),
+        "first not timing point": find_first_stops_not_timing_points(sequences),
+        "last not timing point": find_last_stops_not_timing_points(sequences),
+        "missing journey code": find_journeys_missing_journey_code(
+            sequences, missing_journey_code(df)
+        ),
+        "15 minute gaps": timing_point_gaps(sequences),
+    }
+
+
+def found(results: dict) -> dict:
+    return {
+        check: (
+            sorted(stops["service_pattern_stop_id"])
+            if isinstance(stops, pd.DataFrame)
+            else sorted(stops)
+        )
+        for check, stops in results.items()
+    }
+
+
+def run(label, checks, df, repeat):
+    best, results = None, None
+    for _ in range(repeat):
+        start = perf_counter()
+        results = checks(df)
+        seconds = perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    counts = ", ".join(str(len(stops)) for stops in results.values())
+    print(f"{label:>28}: {best:7.3f}s  stops found {counts}")
+    return found(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--journeys", type=int, default=50_000)
+    parser.add_argument("--stops-per-journey", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = compact_vehicle_journey_df(
+        synthetic_stops(args.journeys, args.stops_per_journey)
+    )
+    print(f"{args.journeys} journeys, {len(df)} stop rows, best of {args.repeat}")
+    expected = run("six groupbys", separate, df, args.repeat)
+    assert run("one StopSequences", fused, df, args.repeat) == expected
+    ordered = df.sort_values(["vehicle_journey_id", "auto_sequence_number"])
+    assert run("one StopSequences, streamed", fused, ordered, args.repeat) == expected
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Benchmark the no timing point for more than 15 minutes check on a synthetic
+file: the per journey groupby().apply() it used to run against the single
+vectorised pass of find_timing_point_gaps, checking both find the same
+links.
+
+Runs without AWS or a database:
+
+    python benchmarks/timing_point_gaps.py --journeys 50000
+"""
+
+import argparse
+import sys
+from datetime import time, timedelta
+from time import perf_counter
+
+sys.path.append("./src/boilerplate")
+sys.path.append("./src/template")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from dataframes import compact_vehicle_journey_df  # noqa: E402
+from no_timing_point_for_more_than_15_minutes import (  # noqa: E402
+    filter_vehicle_journey,
+)
+
+
+class CountingObservation:
+    def __init__(self):
+        self.observations = []
+
+    def add_observation(self, details, vehicle_journey_id, service_pattern_stop_id):
+        self.observations.append((vehicle_journey_id, service_pattern_stop_id))
+
+
+def synthetic_timing_points(journeys: int, stops_per_journey: int) -> pd.DataFrame:
+    """
+    Stops of the journeys, every other one a timing point, departing 2 to 10
+    minutes after the previous stop so some timing point links are longer
+    than 15 minutes
+    """
+    rng = np.random.default_rng(0)
+    rows = journeys * stops_per_journey
+    sequence = np.tile(np.arange(stops_per_journey), journeys)
+    journey = np.repeat(np.arange(journeys), stops_per_journey)
+    start = 5 * 3600 + (journey * 60) % (16 * 3600)
+    gaps = rng.integers(2, 11, rows) * 60
+    gaps[sequence == 0] = 0
+    offsets = pd.Series(gaps).groupby(journey).cumsum().to_numpy()
+    seconds = (start + offsets) % (24 * 3600)
+    times = [time(s // 3600, s // 60 % 60) for s in range(0, 24 * 3600, 60)]
+    return pd.DataFrame(
+        {
+            "is_timing_point": sequence % 2 == 0,
+            "naptan_stop_id": sequence + 1,
+            "auto_sequence_number": sequence,
+            "atco_code": "0100BRP" + pd.Series(sequence).astype(str),
+            "departure_time": [times[s // 60] for s in seconds],
+            "common_name": "Stop " + pd.Series(sequence).astype(str),
+            "service_pattern_stop_id": np.arange(rows),
+            "activity": "pickUpAndSetDown",
+            "start_time": [times[s // 60] for s in start],
+            "direction": np.where(journey % 2 == 0, "outbound", "inbound"),
+            "vehicle_journey_id": journey,
+            "vehicle_journey_code": pd.Series(journey).astype(str),
+        }
+    )
+
+
+def legacy_filter_vehicle_journey(df: pd.DataFrame, observation) -> bool:
+    """
+    The check as it was, run for each vehicle journey
+    """
+    df["departure_time_new"] = pd.to_datetime(df["departure_time"], format="%H:%M:%S")
+    df["time_diff"] = df["departure_time_new"].diff()
+    df["departure_time"] = df["departure_time"].apply(lambda x: x.strftime("%H:%M"))
+    df["start_time"] = df["start_time"].apply(lambda x: x.strftime("%H:%M"))
+    df = df.reset_index()
+
+    for i in range(1, len(df)):
+        if df.loc[i, "time_diff"] > timedelta(minutes=15):
+            prev_row = df.iloc[i - 1]
+            curr_row = df.iloc[i]
+            details = (
+                f"The link between the {prev_row['departure_time']} {prev_row['common_name']} ({prev_row['atco_code']}) and"
+                f" {curr_row['departure_time']} {curr_row['common_name']} ({curr_row['atco_code']}) timing point stops"
+                f" on the {prev_row['start_time']} {prev_row['direction']} journey is more than 15 minutes apart."
+            )
+            observation.add_observation(
+                details=details,
+                vehicle_journey_id=int(prev_row.vehicle_journey_id),
+                service_pattern_stop_id=int(prev_row.service_pattern_stop_id),
+            )
+
+
+def legacy(df: pd.DataFrame, observation):
+    df = df[df["is_timing_point"] == True]  # noqa: E712
+    df = df.sort_values(by="auto_sequence_number")
+    df.groupby("vehicle_journey_id").apply(legacy_filter_vehicle_journey, observation)
+
+
+def run(label, check, df, repeat):
+    best, observation = None, None
+    for _ in range(repeat):
+        observation = CountingObservation()
+        start = perf_counter()
+        check(df.copy(), observation)
+        seconds = perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    print(f"{label:>22}: {best:7.2f}s  {len(observation.observations)} observations")
+    return sorted(observation.observations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--journeys", type=int, default=50_000)
+    parser.add_argument("--stops-per-journey", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    df = synthetic_timing_points(args.journeys, args.stops_per_journey)
+    print(f"{args.journeys} journeys, {len(df)} stop rows, best of {args.repeat}")
+    expected = run("groupby().apply()", legacy, df, args.repeat)
+    assert run("vectorised", filter_vehicle_journey, df, args.repeat) == expected
+    compact = compact_vehicle_journey_df(df)
+    assert run("vectorised, compact", filter_vehicle_journey, compact, args.repeat) == (
+        expected
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Benchmark the memory of the vehicle journey dataframe as the query returns it
+and after compact_vehicle_journey_df, on a synthetic file of stop rows, with
+the size and load time of each persisted as Parquet.
+
+Runs without AWS or a database:
+
+    python benchmarks/vehicle_journey_dtypes.py --rows 1000000
+"""
+
+import argparse
+import sys
+from time import perf_counter
+
+sys.path.append("./src/boilerplate")
+sys.path.append("./benchmarks")
+
+from data_persistence import PersistenceFormat, deserialise, serialise  # noqa: E402
+from dataframes import compact_vehicle_journey_df  # noqa: E402
+from persisted_data_format import synthetic_vehicle_journeys  # noqa: E402
+
+
+def describe(label, df, repeat):
+    data = serialise(df, PersistenceFormat.PARQUET)
+    seconds = []
+    for _ in range(repeat):
+        start = perf_counter()
+        deserialise(data)
+        seconds.append(perf_counter() - start)
+    print(
+        f"{label:>8}: frame {df.memory_usage(deep=True).sum() / 2**20:7.1f} MiB  "
+        f"parquet {len(data) / 2**20:6.1f} MiB  load {min(seconds):5.2f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--stops-per-journey", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = synthetic_vehicle_journeys(args.rows, args.stops_per_journey)
+    start = perf_counter()
+    compact = compact_vehicle_journey_df(df)
+    print(
+        f"{args.rows} stop rows, compacted in {perf_counter() - start:.2f}s, "
+        f"best of {args.repeat}"
+    )
+    describe("original", df, args.repeat)
+    describe("compact", compact, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
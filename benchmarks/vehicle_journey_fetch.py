@@ -0,0 +1,120 @@
+"""
+Benchmark the SQL (pd.read_sql_query) and COPY fetch backends used by
+get_df_vehicle_journey on a synthetic file of stop rows.
+
+Needs a Postgres database configured through the POSTGRES_* environment
+variables (see .env.template), e.g. the docker-compose database:
+
+    PROJECT_ENV=local python benchmarks/vehicle_journey_fetch.py --rows 1000000
+"""
+
+import argparse
+import sys
+import tracemalloc
+from time import perf_counter
+
+sys.path.append("./src/boilerplate")
+
+import pandas as pd  # noqa: E402
+from sqlalchemy import (  # noqa: E402
+    Boolean,
+    Column,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Time,
+    select,
+    text,
+)
+
+from bods_db import BodsDB  # noqa: E402
+from dataframes import read_sql_copy  # noqa: E402
+
+SYNTHETIC_STOPS_SQL = """
+CREATE TEMP TABLE bench_vehicle_journey AS
+SELECT
+    n % 3 = 0 AS is_timing_point,
+    CASE WHEN n % 10 = 0 THEN NULL ELSE n % 50000 END AS naptan_stop_id,
+    n % :stops_per_journey AS auto_sequence_number,
+    '0100BRP' || (n % 50000) AS atco_code,
+    time '05:00' + (n % :stops_per_journey) * interval '2 minutes'
+        AS departure_time,
+    'Stop ' || (n % 50000) AS common_name,
+    n AS service_pattern_stop_id,
+    (ARRAY['pickUp', 'setDown', 'pickUpAndSetDown'])[1 + n % 3] AS activity,
+    time '05:00' + (n / :stops_per_journey % 720) * interval '1 minute'
+        AS start_time,
+    CASE WHEN n % 2 = 0 THEN 'outbound' ELSE 'inbound' END AS direction,
+    n / :stops_per_journey AS vehicle_journey_id,
+    (n / :stops_per_journey)::text AS vehicle_journey_code
+FROM generate_series(0, :rows - 1) AS n
+"""
+
+bench_vehicle_journey = Table(
+    "bench_vehicle_journey",
+    MetaData(),
+    Column("is_timing_point", Boolean),
+    Column("naptan_stop_id", Integer),
+    Column("auto_sequence_number", Integer),
+    Column("atco_code", String),
+    Column("departure_time", Time),
+    Column("common_name", String),
+    Column("service_pattern_stop_id", Integer),
+    Column("activity", String),
+    Column("start_time", Time),
+    Column("direction", String),
+    Column("vehicle_journey_id", Integer),
+    Column("vehicle_journey_code", String),
+)
+
+
+def measure(fetch, repeat):
+    """
+    Best wall time and peak traced memory of the fetch over repeat runs
+    """
+    timings, peaks, df = [], [], None
+    for _ in range(repeat):
+        df = None
+        tracemalloc.start()
+        start = perf_counter()
+        df = fetch()
+        timings.append(perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return min(timings), max(peaks), df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--stops-per-journey", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    db = BodsDB()
+    connection = db.session.connection()
+    connection.execute(
+        text(SYNTHETIC_STOPS_SQL),
+        {"rows": args.rows, "stops_per_journey": args.stops_per_journey},
+    )
+    statement = select(bench_vehicle_journey)
+
+    results = {
+        "SQL": measure(lambda: pd.read_sql_query(statement, connection), args.repeat),
+        "COPY": measure(lambda: read_sql_copy(statement, connection), args.repeat),
+    }
+    db.session.rollback()
+
+    sql_seconds = results["SQL"][0]
+    print(f"{args.rows} stop rows, best of {args.repeat}")
+    for backend, (seconds, peak, df) in results.items():
+        print(
+            f"{backend:>5}: {seconds:7.2f}s  peak {peak / 2**20:8.1f} MiB  "
+            f"frame {df.memory_usage(deep=True).sum() / 2**20:8.1f} MiB  "
+            f"speed-up x{sql_seconds / seconds:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Benchmark the four vehicle journey lookups of the duplicate journey code
+check (operating profiles, operating and non operating dates, serviced
+organisations) with the journeys given as an IN list of ids, as an
+= ANY(:array) parameter and as a semi-join on the file.
+
+Without a database it times preparing the statements the driver sends, at
+1k, 10k and 100k journeys, and their size:
+
+    python benchmarks/vehicle_journey_lookups.py
+
+Given a database it also times running them for a file, one after another
+and concurrently on separate connections:
+
+    python benchmarks/vehicle_journey_lookups.py --dsn postgresql://... --file-id 1
+"""
+
+import argparse
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from unittest.mock import MagicMock
+
+sys.path.append("./src/boilerplate")
+
+import pandas as pd  # noqa: E402
+from psycopg2.extensions import adapt  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.dialects.postgresql.psycopg2 import PGDialect_psycopg2  # noqa: E402
+
+import dataframes  # noqa: E402
+from dataframes import VEHICLE_JOURNEY_LOOKUPS  # noqa: E402
+
+
+def lookup_statements(check, vehicle_journey_ids, in_list=False):
+    """
+    Statements of the four lookups, capturing them instead of running them
+    """
+    statements = []
+    read_sql_query = dataframes.pd.read_sql_query
+    any_filter = dataframes._vehicle_journey_filter
+    dataframes.pd.read_sql_query = lambda statement, _: statements.append(statement)
+    if in_list:
+        dataframes._vehicle_journey_filter = lambda _, column, ids: column.in_(ids)
+    try:
+        for lookup in VEHICLE_JOURNEY_LOOKUPS:
+            lookup(check, vehicle_journey_ids)
+    finally:
+        dataframes.pd.read_sql_query = read_sql_query
+        dataframes._vehicle_journey_filter = any_filter
+    return statements
+
+
+def prepare(statement) -> str:
+    """
+    Compile the statement and interpolate its parameters as psycopg2 does
+    """
+    compiled = statement.compile(
+        dialect=PGDialect_psycopg2(), compile_kwargs={"render_postcompile": True}
+    )
+    parameters = {
+        name: adapt(value).getquoted().decode("utf-8")
+        for name, value in compiled.params.items()
+    }
+    return compiled.string % parameters
+
+
+def time_preparation(check, vehicle_journey_ids, in_list, repeat):
+    best, size = None, 0
+    for _ in range(repeat):
+        start = perf_counter()
+        sql = [
+            prepare(statement)
+            for statement in lookup_statements(check, vehicle_journey_ids, in_list)
+        ]
+        seconds = perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+        size = sum(len(text) for text in sql)
+    return best, size
+
+
+def time_database(dsn, file_id, repeat):
+    engine = create_engine(dsn, pool_size=len(VEHICLE_JOURNEY_LOOKUPS))
+    check = MagicMock()
+    check.file_id = file_id
+    with engine.connect() as connection:
+        ids = (
+            pd.read_sql_query(dataframes._file_vehicle_journey_ids(check), connection)[
+                "vehicle_journey_id"
+            ]
+            .unique()
+            .tolist()
+        )
+    print(f"file {file_id}: {len(ids)} vehicle journeys")
+
+    def run(statement):
+        with engine.connect() as connection:
+            return pd.read_sql_query(statement, connection)
+
+    cases = {
+        "IN list": lookup_statements(check, ids, in_list=True),
+        "ANY array": lookup_statements(check, ids),
+        "semi-join": lookup_statements(check, None),
+    }
+    for label, statements in cases.items():
+        sequential, concurrent = [], []
+        for _ in range(repeat):
+            start = perf_counter()
+            for statement in statements:
+                run(statement)
+            sequential.append(perf_counter() - start)
+            start = perf_counter()
+            with ThreadPoolExecutor(max_workers=len(statements)) as executor:
+                list(executor.map(run, statements))
+            concurrent.append(perf_counter() - start)
+        print(
+            f"{label:>10}: one after another {min(sequential):6.3f}s  "
+            f"concurrently {min(concurrent):6.3f}s"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--journeys", type=int, nargs="+", default=[1000, 10000, 100000]
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--dsn")
+    parser.add_argument("--file-id", type=int)
+    args = parser.parse_args()
+
+    check = MagicMock()
+    check.file_id = 1
+    dataframes.get_snapshot = lambda _: None
+    print(f"Preparing the four lookup statements, best of {args.repeat}")
+    for journeys in args.journeys:
+        ids = list(range(1_000_000, 1_000_000 + journeys))
+        for label, vehicle_journey_ids, in_list in (
+            ("IN list", ids, True),
+            ("ANY array", ids, False),
+            ("semi-join", None, False),
+        ):
+            seconds, size = time_preparation(
+                check, vehicle_journey_ids, in_list, args.repeat
+            )
+            print(
+                f"{journeys:>7} journeys {label:>10}: {seconds * 1000:8.1f}ms  "
+                f"SQL {size / 1024:8.1f} KiB"
+            )
+    if args.dsn:
+        time_database(args.dsn, args.file_id, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
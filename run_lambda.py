@@ -1,22 +1,22 @@
 import importlib
 import importlib.util
 import sys
-from sqlalchemy import asc, select
-from src.boilerplate.models import DqsChecks as Checks, DqsTaskresults as TaskResults
+from sqlalchemy import select
+from src.boilerplate.models import DqsTaskresults as TaskResults
 
 sys.path.append("./src/boilerplate")
 
 from bods_db import BodsDB
+from dqs_checks import check_registry
 
 db = BodsDB()
 
 
-rs = db.session.query(Checks).order_by(asc(Checks.id)).all()
-lambdas = {row.id: row.observation.lower().replace(" ", "_") for row in rs}
+lambdas = {
+    check.id: name for name, check in check_registry.get_checks(db.session).items()
+}
 lambdas.update({"all": "all"})
 
-rs = db.session.query(Checks).order_by(asc(Checks.id)).all()
-
 from json import dumps
 import argparse
 
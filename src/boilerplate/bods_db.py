@@ -1,24 +1,316 @@
 import os
 import boto3
-import urllib
+from threading import Lock
+from time import monotonic, perf_counter, sleep
 from dqs_logger import logger
+from query_metrics import find_caller, query_metrics, query_metrics_enabled
 from os import environ
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
+from sqlalchemy.pool import Pool, QueuePool
 from sqlalchemy.sql import text
 
+# Engines are shared by every BodsDB instance in the container, keyed by the
+# connection details (without the password) so warm invocations reuse the pool
+_engines = {}
+_engines_lock = Lock()
+
+# Lifetime of a signed RDS IAM auth token, and how long before expiry it is
+# replaced so a connection never presents a token that is about to lapse
+RDS_IAM_TOKEN_LIFETIME = 900
+RDS_IAM_TOKEN_REFRESH_MARGIN = int(environ.get("RDS_IAM_TOKEN_REFRESH_MARGIN", 120))
+
+# statement_timeout given to every new connection opened by this process, set
+# by a worker so no query outlives its Lambda budget
+_statement_timeout_ms = None
+
+# Shared array a worker records the role (0 primary, 1 replica) and backend
+# PID of every connection it checks out in, as pairs, so the parent can
+# cancel their queries when it terminates the worker
+BACKEND_PID_SLOTS = 32
+_backend_pids = None
+
+
+class RdsIamTokenProvider:
+    """
+    Caches the RDS client and the signed IAM auth token per host, port and
+    user so the token is only re-signed when it is close to expiring
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._clients = {}
+        self._tokens = {}
+
+    def _get_client(self, key):
+        if key not in self._clients:
+            self._clients[key] = boto3.session.Session().client(
+                service_name="rds", region_name=environ.get("AWS_REGION")
+            )
+        return self._clients[key]
+
+    def get_token(self, host, port, username) -> str:
+        """
+        Return a valid token, signing a new one if there is none cached or
+        the cached one is within the refresh margin of its expiry
+        """
+        key = (host, str(port), username)
+        with self._lock:
+            token, expires_at = self._tokens.get(key, (None, 0))
+            refresh_at = expires_at - RDS_IAM_TOKEN_REFRESH_MARGIN
+            if token is None or monotonic() >= refresh_at:
+                logger.debug("Generating DB IAM auth token")
+                try:
+                    token = self._get_client(key).generate_db_auth_token(
+                        DBHostname=host, DBUsername=username, Port=port
+                    )
+                except Exception as e:
+                    logger.error(
+                        f"An error occurred while generating the IAM auth token: {e}"
+                    )
+                    raise e
+                expires_at = monotonic() + RDS_IAM_TOKEN_LIFETIME
+                self._tokens[key] = (token, expires_at)
+            return token
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+            self._tokens.clear()
+
+
+rds_iam_token_provider = RdsIamTokenProvider()
+
+
+class MeteredQueuePool(QueuePool):
+    """
+    QueuePool that records how long callers wait to check out a connection
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.checkout_wait_total = 0.0
+        self.checkout_wait_max = 0.0
+
+    def connect(self):
+        start = perf_counter()
+        try:
+            return super().connect()
+        finally:
+            wait = perf_counter() - start
+            self.checkouts += 1
+            self.checkout_wait_total += wait
+            self.checkout_wait_max = max(self.checkout_wait_max, wait)
+
+    def metrics(self) -> dict:
+        """
+        Current pool occupancy and checkout wait statistics
+        """
+        return {
+            "pool_size": self.size(),
+            "checked_in": self.checkedin(),
+            "checked_out": self.checkedout(),
+            "overflow": self.overflow(),
+            "checkouts": self.checkouts,
+            "checkout_wait_avg_ms": (
+                round(1000 * self.checkout_wait_total / self.checkouts, 3)
+                if self.checkouts
+                else 0.0
+            ),
+            "checkout_wait_max_ms": round(1000 * self.checkout_wait_max, 3),
+        }
+
+
+@event.listens_for(Pool, "connect")
+def _record_connection_pid(dbapi_connection, connection_record):
+    connection_record.info["pid"] = os.getpid()
+
+
+@event.listens_for(Pool, "checkout")
+def _guard_connection_pid(dbapi_connection, connection_record, connection_proxy):
+    """
+    Never hand out a connection that was opened by another (parent) process
+    """
+    pid = os.getpid()
+    if connection_record.info.get("pid", pid) != pid:
+        connection_record.dbapi_connection = connection_proxy.dbapi_connection = None
+        raise exc.DisconnectionError(
+            f"Connection record belongs to pid {connection_record.info['pid']}, "
+            f"attempting to check out in pid {pid}"
+        )
+
+
+@event.listens_for(Pool, "checkout")
+def _record_backend_pid(dbapi_connection, connection_record, connection_proxy):
+    """
+    Record the backend PID of each connection checked out, whether by a
+    session, an engine.connect() of a lookup thread or a streaming cursor,
+    once record_backend_pids has been given the array to record them in
+    """
+    get_backend_pid = getattr(dbapi_connection, "get_backend_pid", None)
+    if _backend_pids is None or get_backend_pid is None:
+        return
+    host = getattr(getattr(dbapi_connection, "info", None), "host", None)
+    role = int(bool(host) and host == environ.get("POSTGRES_REPLICA_HOST"))
+    pid = get_backend_pid()
+    with _backend_pids.get_lock():
+        for slot in range(0, len(_backend_pids), 2):
+            if _backend_pids[slot + 1] == pid and _backend_pids[slot] == role:
+                return
+            if not _backend_pids[slot + 1]:
+                _backend_pids[slot], _backend_pids[slot + 1] = role, pid
+                return
+    logger.warning(f"No slot left to record backend PID {pid}")
+
+
+def record_backend_pids(backend_pids):
+    """
+    Record the backend PIDs of the connections this process checks out from
+    now on in the shared array, of 2 * BACKEND_PID_SLOTS integers
+    """
+    global _backend_pids
+    _backend_pids = backend_pids
+
+
+def recorded_backend_pids(backend_pids) -> dict:
+    """
+    PIDs recorded in the shared array, keyed primary and replica
+    """
+    recorded = {"primary": [], "replica": []}
+    for slot in range(0, len(backend_pids), 2):
+        if backend_pids[slot + 1]:
+            role = "replica" if backend_pids[slot] else "primary"
+            recorded[role].append(backend_pids[slot + 1])
+    return recorded
+
+
+@event.listens_for(Engine, "do_connect")
+def _provide_iam_auth_token(dialect, connection_record, cargs, cparams):
+    """
+    Outside local the URL carries no password, so each new physical
+    connection is given the current IAM auth token when it is opened
+    """
+    if (
+        dialect.name == "postgresql"
+        and environ.get("PROJECT_ENV") != "local"
+        and not cparams.get("password")
+    ):
+        cparams["password"] = rds_iam_token_provider.get_token(
+            cparams.get("host"), cparams.get("port"), cparams.get("user")
+        )
+
+
+@event.listens_for(Engine, "do_connect")
+def _apply_statement_timeout(dialect, connection_record, cargs, cparams):
+    if dialect.name == "postgresql" and _statement_timeout_ms:
+        options = f"-c statement_timeout={_statement_timeout_ms}"
+        if cparams.get("options"):
+            options = f"{cparams['options']} {options}"
+        cparams["options"] = options
+
+
+def set_statement_timeout(seconds):
+    """
+    Set the statement_timeout for the connections this process opens from
+    now on. A forked worker only ever opens new connections, so calling this
+    at the start of the worker bounds every query it runs
+    """
+    global _statement_timeout_ms
+    _statement_timeout_ms = int(seconds * 1000) if seconds and seconds > 0 else None
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if query_metrics_enabled():
+        conn.info.setdefault("query_start_time", []).append(perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _record_query_metrics(conn, cursor, statement, parameters, context, executemany):
+    """
+    Records the duration and row count of each statement, with the function
+    that issued it, see query_metrics
+    """
+    start_times = conn.info.get("query_start_time")
+    if not start_times:
+        return
+    duration_ms = (perf_counter() - start_times.pop()) * 1000
+    rows = cursor.rowcount if cursor.rowcount >= 0 else None
+    query_metrics.record(statement, find_caller(), duration_ms, rows)
+
+
+@event.listens_for(Engine, "handle_error")
+def _clear_query_timer(exception_context):
+    """
+    Drop the start time of a statement that raised, which never reaches
+    after_cursor_execute, so it doesn't stay in the connection's info
+    """
+    connection = exception_context.connection
+    if connection is None or exception_context.execution_context is None:
+        return
+    start_times = connection.info.get("query_start_time")
+    if start_times:
+        start_times.pop()
+
+
+def _engine_key(connection_details: dict) -> tuple:
+    return tuple(
+        sorted(
+            (key, str(value))
+            for key, value in connection_details.items()
+            if key != "password"
+        )
+    )
+
+
+def get_pool_metrics() -> dict:
+    """
+    Pool metrics for every engine created in this process
+    """
+    with _engines_lock:
+        return {
+            "{host}/{dbname}".format(**dict(key)): entry["engine"].pool.metrics()
+            for key, entry in _engines.items()
+            if isinstance(entry["engine"].pool, MeteredQueuePool)
+        }
+
+
+def dispose_engines(close=True):
+    """
+    Drop all cached engines. With close=False the pooled connections are left
+    untouched, which is what a forked child must do so it doesn't close the
+    sockets still owned by its parent.
+    """
+    with _engines_lock:
+        for entry in _engines.values():
+            entry["engine"].dispose(close=close)
+        _engines.clear()
+
+
+def _reset_engines_after_fork():
+    global _engines_lock
+    _engines_lock = Lock()
+    dispose_engines(close=False)
+
+
+os.register_at_fork(after_in_child=_reset_engines_after_fork)
+
 
 class BodsDB:
     """
     Class to handle the connection to the BODS database. The class provides properties to access the database session and the database classes.
 
     Properties:
-    session: SqlAlchemy session
+    session: SqlAlchemy session on the primary, used for all writes
+    read_session: SqlAlchemy session on the read replica when POSTGRES_REPLICA_HOST is set, otherwise the primary session
     classes: List of SqlAlchemy classes autogenerated from the database schema
     """
 
     def __init__(self):
         self._session = None
+        self._read_session = None
         # self._classes = None
 
     @property
@@ -30,6 +322,76 @@ class BodsDB:
             self._initialise_database()
         return self._session
 
+    @property
+    def read_session(self):
+        """
+        Property to access the session for read-only queries. This is on the
+        read replica when one is configured, otherwise it is the primary session
+        """
+        if not environ.get("POSTGRES_REPLICA_HOST"):
+            return self.session
+        if self._read_session is None:
+            self._initialise_read_database()
+        return self._read_session
+
+    def fresh_read_session(self):
+        """
+        Method to get a session for reads that must see rows just committed on
+        the primary. The replica is only used once it has replayed the
+        primary's current WAL position, waiting at most
+        POSTGRES_REPLICA_MAX_LAG_MS for it to catch up, otherwise the primary
+        session is returned
+        """
+        if not environ.get("POSTGRES_REPLICA_HOST"):
+            return self.session
+        try:
+            primary_lsn = self.session.execute(
+                text("SELECT pg_current_wal_lsn()")
+            ).scalar()
+            deadline = monotonic() + (
+                int(environ.get("POSTGRES_REPLICA_MAX_LAG_MS", 1000)) / 1000
+            )
+            while True:
+                caught_up = self.read_session.execute(
+                    text("SELECT pg_last_wal_replay_lsn() >= CAST(:lsn AS pg_lsn)"),
+                    {"lsn": primary_lsn},
+                ).scalar()
+                if caught_up:
+                    return self._read_session
+                if monotonic() >= deadline:
+                    break
+                sleep(0.05)
+            logger.warning("Read replica is lagging, reading from the primary")
+        except Exception as e:
+            logger.warning(
+                f"Failed to check read replica lag, reading from the primary: {e}"
+            )
+            if self._read_session is not None:
+                self._read_session.rollback()
+        return self.session
+
+    def cancel_backends(self, backend_pids):
+        """
+        Method to cancel the queries running on the given backend PIDs, e.g.
+        those of a worker that was terminated, so they stop using the database
+
+        Args:
+        backend_pids: dict of lists of PIDs keyed primary and replica
+        """
+        sessions = {"primary": self.session, "replica": self.read_session}
+        for role, pids in backend_pids.items():
+            session = sessions[role]
+            for pid in pids:
+                try:
+                    cancelled = session.execute(
+                        text("SELECT pg_cancel_backend(:pid)"), {"pid": pid}
+                    ).scalar()
+                    session.commit()
+                    logger.info(f"Cancelled {role} backend {pid}: {cancelled}")
+                except Exception as e:
+                    session.rollback()
+                    logger.error(f"Failed to cancel {role} backend {pid}: {e}")
+
     @property
     def classes(self):
         """
@@ -46,17 +408,73 @@ class BodsDB:
         connection_details = self._get_connection_details()
         logger.debug("Connecting to DB with connection string")
         try:
-            sqlalchemy_engine = create_engine(
-                self._generate_connection_string(**connection_details)
-            )
+            sqlalchemy_engine = self._get_engine(connection_details)
             logger.debug("Initiating DB session")
             self._session = Session(sqlalchemy_engine)
             self._session.execute(text("SET SESSION random_page_cost = 1.2"))
             logger.debug("Connected to DB")
+            logger.debug(f"DB pool metrics: {get_pool_metrics()}")
         except Exception as e:
             logger.error("Failed to connect to DB")
             raise e
 
+    def _initialise_read_database(self):
+        """
+        Method to initialise the read-only connection to the read replica
+        """
+        connection_details = self._get_connection_details()
+        connection_details["host"] = environ.get("POSTGRES_REPLICA_HOST")
+        connection_details["port"] = environ.get(
+            "POSTGRES_REPLICA_PORT", connection_details["port"]
+        )
+        logger.debug("Connecting to DB read replica")
+        try:
+            sqlalchemy_engine = self._get_engine(connection_details)
+            self._read_session = Session(sqlalchemy_engine)
+            self._read_session.execute(
+                text("SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY")
+            )
+            self._read_session.execute(text("SET SESSION random_page_cost = 1.2"))
+            logger.debug("Connected to DB read replica")
+        except Exception as e:
+            logger.error("Failed to connect to DB read replica")
+            raise e
+
+    def _get_engine(self, connection_details):
+        """
+        Method to get the process-wide engine for the connection details,
+        creating it with a bounded connection pool on first use
+        """
+        key = _engine_key(connection_details)
+        with _engines_lock:
+            entry = _engines.get(key)
+            if entry is not None and entry["pid"] == os.getpid():
+                logger.debug("Reusing pooled DB engine")
+                return entry["engine"]
+            if entry is not None:
+                entry["engine"].dispose(close=False)
+            engine = create_engine(
+                self._generate_connection_string(**connection_details),
+                poolclass=MeteredQueuePool,
+                pool_size=int(environ.get("POSTGRES_POOL_SIZE", 5)),
+                max_overflow=int(environ.get("POSTGRES_POOL_MAX_OVERFLOW", 5)),
+                pool_timeout=int(environ.get("POSTGRES_POOL_TIMEOUT", 30)),
+                pool_recycle=int(environ.get("POSTGRES_POOL_RECYCLE", 600)),
+                pool_pre_ping=True,
+            )
+            _engines[key] = {"engine": engine, "pid": os.getpid()}
+            return engine
+
+    def release_connection(self):
+        """
+        Method to end the current transaction and return its connection to
+        the pool, e.g. before forking so the child never shares the socket
+        """
+        if self._session is not None:
+            self._session.commit()
+        if self._read_session is not None:
+            self._read_session.commit()
+
     def _get_connection_details(self):
         """
         Method to get the connection details for the database from the environment variables
@@ -68,13 +486,9 @@ class BodsDB:
         connection_details["port"] = environ.get("POSTGRES_PORT")
         try:
             if environ.get("PROJECT_ENV") != "local":
-                logger.debug("Getting DB token")
-                connection_details["password"] = self._generate_rds_iam_auth_token(
-                    connection_details["host"],
-                    connection_details["port"],
-                    connection_details["user"],
-                )
-                logger.debug("Got DB token")
+                # The IAM auth token is supplied when each connection is
+                # opened, see _provide_iam_auth_token
+                logger.debug("Using DB IAM auth token")
                 connection_details["sslmode"] = "require"
             else:
                 logger.debug(
@@ -132,29 +546,3 @@ class BodsDB:
             connection_string += f"?{other_parts[:-1]}"
 
         return connection_string
-
-    def _generate_rds_iam_auth_token(self, host, port, username) -> str:
-        """
-        Generates an AWS RDS IAM authentication token for a given RDS instance.
-
-        Parameters:
-        - hostname (str): The endpoint of the RDS instance.
-        - port (int): The port number for the RDS instance.
-        - username (str): The database username.
-
-        Returns:
-        - str: The generated IAM authentication token if successful.
-        - None: If an error occurs during token generation.
-        """
-        try:
-            session = boto3.session.Session()
-            client = session.client(
-                service_name="rds", region_name=environ.get("AWS_REGION")
-            )
-            token = client.generate_db_auth_token(
-                DBHostname=host, DBUsername=username, Port=port
-            )
-            return urllib.parse.quote_plus(token)
-        except Exception as e:
-            logger.error(f"An error occurred while generating the IAM auth token: {e}")
-            return None
@@ -0,0 +1,168 @@
+from hashlib import sha1
+from os import environ, listdir, makedirs, remove, replace, stat, utime
+from os.path import join
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from time import time
+from typing import Optional
+
+from dqs_logger import logger
+
+# Byte budget of the container's /tmp tier in front of the persistence
+# backend, 0 turns it off. It is the only tier: each check runs in a worker
+# process the TimeOutHandler forks and throws away, so values held in memory
+# never outlived the check that read them. Values on disk expire after
+# CACHE_DISK_TTL seconds, no later than the backend's, so /tmp never serves
+# a value the backend has dropped
+CACHE_DISK_MAX_BYTES = int(environ.get("CACHE_DISK_MAX_BYTES", 256 * 1024 * 1024))
+CACHE_DISK_DIR = environ.get("CACHE_DISK_DIR", "/tmp/dqs-cache")
+CACHE_DISK_TTL = int(
+    environ.get("CACHE_DISK_TTL", environ.get("CACHE_TTL", 24 * 60 * 60))
+)
+
+
+class CacheTier:
+    """
+    A container-local store of serialised values with a byte budget, least
+    recently used values evicted first, counting its hits and misses
+
+    Methods:
+    get: Value of the key, None on a miss
+    put: Store the value, evicting others to stay within the budget
+    contains: Whether the key is stored, without counting a hit or miss
+    stats: Hit and miss counts
+    clear: Remove every value and reset the counts
+    """
+
+    name = None
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key) -> Optional[bytes]:
+        with self._lock:
+            value = self._get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def put(self, key, value: bytes):
+        if len(value) > self.max_bytes:
+            logger.debug(f"Not caching {key} in {self.name}, it's over the budget")
+            return
+        with self._lock:
+            self._put(key, value)
+
+    def contains(self, key) -> bool:
+        with self._lock:
+            return self._contains(key)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class DiskTier(CacheTier):
+    """
+    Values written to files in /tmp, which outlive the worker processes the
+    checks run in and so are shared by every check the warm container runs.
+    A file's modification time is when it was written, and values older
+    than the TTL are removed when read. Recency is its access time, touched
+    on every hit
+    """
+
+    name = "disk"
+
+    def __init__(
+        self,
+        max_bytes: int = CACHE_DISK_MAX_BYTES,
+        directory: str = CACHE_DISK_DIR,
+        ttl: int = CACHE_DISK_TTL,
+    ):
+        super().__init__(max_bytes)
+        self._directory = directory
+        self._ttl = ttl
+
+    def _path(self, key):
+        return join(self._directory, sha1(key.encode("utf-8")).hexdigest())
+
+    def _get(self, key):
+        path = self._path(key)
+        try:
+            written_at = stat(path).st_mtime
+            if time() - written_at >= self._ttl:
+                remove(path)
+                return None
+            with open(path, "rb") as f:
+                value = f.read()
+            utime(path, (time(), written_at))
+            return value
+        except FileNotFoundError:
+            return None
+
+    def _put(self, key, value):
+        try:
+            makedirs(self._directory, exist_ok=True)
+            self._evict(len(value), keep=self._path(key))
+            # Written to a temporary file first so a concurrent reader never
+            # sees part of a value
+            with NamedTemporaryFile(dir=self._directory, delete=False) as f:
+                f.write(value)
+            replace(f.name, self._path(key))
+        except OSError as e:
+            logger.warning(f"Failed to cache {key} on disk: {e}")
+
+    def _files(self):
+        files = []
+        for name in listdir(self._directory):
+            path = join(self._directory, name)
+            try:
+                info = stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((info.st_atime, info.st_size, path))
+        return sorted(files)
+
+    def _evict(self, incoming: int, keep: str):
+        files = [entry for entry in self._files() if entry[2] != keep]
+        size = sum(entry[1] for entry in files)
+        for _, file_size, path in files:
+            if size + incoming <= self.max_bytes:
+                break
+            try:
+                remove(path)
+            except FileNotFoundError:
+                pass
+            size -= file_size
+
+    def _contains(self, key):
+        try:
+            stat(self._path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _clear(self):
+        try:
+            for _, _, path in self._files():
+                remove(path)
+        except FileNotFoundError:
+            pass
+
+
+# Shared by every PersistedData in the process
+disk_tier = DiskTier()
@@ -1,9 +1,12 @@
-from sqlalchemy import select, func
+from sqlalchemy import select, update
+from datetime import datetime, timezone
 from json import loads
 from pydantic import BaseModel
 from bods_db import BodsDB
+from dqs_checks import check_registry
 from dqs_logger import logger
-from models import DqsTaskresults, DqsChecks, DqsReport, OrganisationDatasetrevision
+from enums import DQSTaskResultStatus
+from models import DqsTaskresults, DqsReport, OrganisationDatasetrevision
 
 
 class EventPayload(BaseModel):
@@ -49,14 +52,20 @@ class Check:
     validate_requested_check: Validate the check
     """
 
-    def __init__(self, lambda_event, function_name):
+    # BodsDB of the file whose records an SQS batch is running, shared by the
+    # Checks of those records, see sqs_batch
+    _shared_db = {}
+
+    def __init__(self, lambda_event, function_name, db=None):
         self._lambda_function = function_name
         self._lambda_event = lambda_event
         self._file_id = None
         self._check_id = None
-        self._db = None
+        # A BodsDB can be passed in to share one session between checks
+        self._db = db
         self._result_id = None
         self._result = None
+        self._started_at = None
 
     def __str__(self) -> str:
         return f"CheckId: {self._check_id}, FileId: {self._file_id}, ResultId: {self._result_id}"
@@ -83,9 +92,23 @@ class Check:
         Property to access the database connection object
         """
         if self._db is None:
-            self._db = BodsDB()
+            if self._shared_db:
+                self._db = self._shared_db.get(self.file_id)
+            if self._db is None:
+                self._db = BodsDB()
         return self._db
 
+    @classmethod
+    def share_db(cls, file_id, db: BodsDB):
+        """
+        Method to give the Checks of the file the db rather than their own
+        """
+        cls._shared_db = {file_id: db}
+
+    @classmethod
+    def clear_shared_db(cls):
+        cls._shared_db = {}
+
     @property
     def file_id(self):
         """
@@ -130,12 +153,37 @@ class Check:
         status: str
         """
         try:
-            self.validate_requested_check()
             logger.debug(
-                f"Attempting to set {self.result.id} status from {self.result.status} to {status}"
+                f"Attempting to set {self.result_id} status from PENDING to {status}"
             )
-            self.result.status = status
+            finished_at = datetime.now(timezone.utc)
+            # Compare-and-set, so the status only moves on from PENDING once
+            # even if the check is completed by more than one process
+            updated_id = self.db.session.execute(
+                update(DqsTaskresults)
+                .where(
+                    (DqsTaskresults.id == self.result_id)
+                    & (DqsTaskresults.status == DQSTaskResultStatus.PENDING.value)
+                )
+                .values(status=status, modified=finished_at)
+                .returning(DqsTaskresults.id)
+            ).scalar()
+            if updated_id is None:
+                self.db.session.rollback()
+                logger.error(
+                    f"Unable to set status of {str(self.result_id)}: Record not found or not PENDING"
+                )
+                raise ValueError(
+                    f"Unable to set status of {str(self.result_id)}: Record not found or not PENDING"
+                )
             self.db.session.commit()
+            if self._started_at is not None:
+                logger.info(
+                    f"Check {str(self.result_id)} set to {status} after "
+                    f"{(finished_at - self._started_at).total_seconds():.1f}s "
+                    f"(started {self._started_at.isoformat()}, "
+                    f"finished {finished_at.isoformat()})"
+                )
         except Exception as e:
             logger.error("Failed to set result status")
             raise e
@@ -166,21 +214,17 @@ class Check:
 
     def get_check_id(self):
         logger.debug(f"Retrieving check ID for {self._lambda_function}")
-        check = self.db.session.scalar(
-            select(DqsChecks).where(
-                func.replace(func.lower(DqsChecks.observation), " ", "_")
-                == self._lambda_function
-            )
-        )
-        return check.id if check else 0
+        return check_registry.get_check_id(self.db.session, self._lambda_function)
 
     def get_result_id(self, file_id, check_id):
+        # The whole record is kept so validation needs no further round trip
         result = self.db.session.scalar(
             select(DqsTaskresults).where(
                 (DqsTaskresults.transmodel_txcfileattributes_id == file_id)
                 & (DqsTaskresults.checks_id == check_id)
             )
         )
+        self._result = result
         return result.id if result else 0
 
     def _extract_test_details_from_event(self):
@@ -224,6 +268,7 @@ class Check:
         self._file_id = check_details.file_id
         self._check_id = check_details.check_id
         self._result_id = check_details.result_id
+        self._started_at = datetime.now(timezone.utc)
 
 
 class DQSReport:
@@ -1,11 +1,66 @@
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from os import environ
+from hashlib import md5
+from io import BytesIO, RawIOBase, SEEK_CUR, SEEK_END, SEEK_SET
+from os import environ, getpid
 from pickle import dumps, loads
+from threading import Lock
+from time import perf_counter, time
 
+import pandas as pd
+from cache_tiers import disk_tier
 from dqs_logger import logger
 from common import Check
 from s3 import S3Client
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+PARQUET_MAGIC = b"PAR1"
+PARQUET_COMPRESSION = "zstd"
+PARQUET_ROW_GROUP_SIZE = 100_000
+# A projected read first GETs this much of the end of the object, which is
+# the whole of a smaller object, and otherwise holds the Parquet footer
+RANGED_GET_TAIL_SIZE = int(environ.get("RANGED_GET_TAIL_SIZE", 1024 * 1024))
+
+# Persisted data outlives the report run that created it by a margin, the
+# same as the cache bucket's lifecycle rule does for S3
+CACHE_TTL = int(environ.get("CACHE_TTL", 24 * 60 * 60))
+REDIS_POOL_SIZE = int(environ.get("REDIS_POOL_SIZE", 10))
+REDIS_SOCKET_TIMEOUT = float(environ.get("REDIS_SOCKET_TIMEOUT", 5))
+# Values are split into chunks of this size, and values larger than the
+# maximum aren't persisted at all
+REDIS_CHUNK_SIZE = int(environ.get("REDIS_CHUNK_SIZE", 8 * 1024 * 1024))
+REDIS_MAX_VALUE_SIZE = int(environ.get("REDIS_MAX_VALUE_SIZE", 256 * 1024 * 1024))
+REDIS_CHUNK_MARKER = b"DQS-CHUNKED:"
+
+# A miss is remembered in the container's tiers for this long, so checks
+# asking for a key that isn't persisted don't each go to the backend. Only
+# the tiers remember misses: at the backend a miss is already a single GET,
+# the same request reading a stored marker would take
+CACHE_MISS_TTL = int(environ.get("CACHE_MISS_TTL", 60))
+CACHE_MISS_MARKER = b"DQS-MISS:"
+
+# Saves made with write-behind run on a background thread of the process
+# that made them, and are awaited by flush_persistence
+_write_behind = None
+_write_behind_pid = None
+_pending_saves = []
+_pending_saves_lock = Lock()
+
+# Connection pools are shared by every RedisBackend in the container, keyed
+# by URL, so warm invocations reuse their connections
+_redis_pools = {}
+_redis_pools_lock = Lock()
+
 
 class PersistenceBackend(str, Enum):
 
@@ -13,15 +68,223 @@ class PersistenceBackend(str, Enum):
     REDIS = "REDIS"
 
 
+class PersistenceFormat(str, Enum):
+
+    PICKLE = "PICKLE"
+    PARQUET = "PARQUET"
+
+
 class PersistenceKey(str, Enum):
 
     VEHICLE_JOURNEY = "vehicle_journey"
 
-    def to_check_value(self, check: Check):
+    def to_check_value(self, check: Check, version: str = None):
+        if version:
+            return f"{self.value}-{version}-{check.file_id}"
         return f"{self.value}-{check.file_id}"
 
 
+def statement_version(statement, schema: str = "") -> str:
+    """
+    Short hash of the statement's SQL, the names and types of its columns
+    and the schema the loader converts them to, so data persisted by a
+    different loader is never read back
+    """
+    columns = ",".join(
+        f"{column.name}:{column.type}" for column in statement.selected_columns
+    )
+    return md5(f"{statement}|{columns}|{schema}".encode("utf-8")).hexdigest()[:8]
+
+
+def write_behind_enabled() -> bool:
+    """
+    Saves return before the data is uploaded unless CACHE_WRITE_BEHIND is
+    false
+    """
+    return environ.get("CACHE_WRITE_BEHIND", "true").lower() != "false"
+
+
+def _write_behind_executor() -> ThreadPoolExecutor:
+    """
+    The process's write-behind executor, replacing one inherited from the
+    parent of a forked process as its thread didn't survive the fork
+    """
+    global _write_behind, _write_behind_pid
+    with _pending_saves_lock:
+        if _write_behind is None or _write_behind_pid != getpid():
+            _write_behind = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="write-behind"
+            )
+            _write_behind_pid = getpid()
+            _pending_saves.clear()
+        return _write_behind
+
+
+def flush_persistence() -> None:
+    """
+    Wait for the process's write-behind saves to finish, logging how long
+    each took. A failed save is logged rather than raised as nothing the
+    check did depends on it
+    """
+    with _pending_saves_lock:
+        if _write_behind_pid != getpid():
+            return
+        pending = list(_pending_saves)
+        _pending_saves.clear()
+    for key, future in pending:
+        try:
+            future.result()
+        except Exception as e:
+            logger.error(f"Write-behind save of {key} failed: {e}")
+            logger.exception(e)
+
+
+def _miss_marker() -> bytes:
+    return CACHE_MISS_MARKER + str(time() + CACHE_MISS_TTL).encode()
+
+
+def _is_miss(value: bytes) -> bool:
+    return value.startswith(CACHE_MISS_MARKER)
+
+
+def _is_expired_miss(value: bytes) -> bool:
+    return _is_miss(value) and float(value[len(CACHE_MISS_MARKER) :]) < time()
+
+
+def _projection_key(key, columns) -> str:
+    """
+    Key the given columns of the key's data are cached under in the tiers
+    """
+    return f"{key}[{','.join(columns)}]"
+
+
+def get_persistence_format() -> PersistenceFormat:
+    """
+    Format DataFrames are persisted in, selected with CACHE_FORMAT (PICKLE
+    by default). PARQUET needs pyarrow, which is too large to go in the
+    boilerplate layer alongside pandas and numpy, so it falls back to pickle
+    when pyarrow is not installed
+    """
+    persistence_format = PersistenceFormat(
+        environ.get("CACHE_FORMAT", PersistenceFormat.PICKLE)
+    )
+    if persistence_format == PersistenceFormat.PARQUET and pq is None:
+        logger.warning("pyarrow is not installed, persisting data as pickle")
+        return PersistenceFormat.PICKLE
+    return persistence_format
+
+
+def serialise(data, persistence_format: PersistenceFormat) -> bytes:
+    """
+    Serialise a DataFrame as zstd compressed Parquet, keeping its column
+    types in the Arrow schema. Anything else, or a DataFrame with columns
+    Arrow can't type or without pyarrow installed, is pickled
+    """
+    if (
+        persistence_format == PersistenceFormat.PARQUET
+        and pq is not None
+        and isinstance(data, pd.DataFrame)
+    ):
+        try:
+            buffer = BytesIO()
+            pq.write_table(
+                pa.Table.from_pandas(data),
+                buffer,
+                compression=PARQUET_COMPRESSION,
+                row_group_size=PARQUET_ROW_GROUP_SIZE,
+            )
+            return buffer.getvalue()
+        except (pa.ArrowException, TypeError, ValueError) as e:
+            logger.warning(f"Failed to persist DataFrame as Parquet, pickling: {e}")
+    return dumps(data)
+
+
+def deserialise(data: bytes, columns=None):
+    """
+    Load data saved by serialise, optionally only the given columns of a
+    DataFrame
+    """
+    if data[:4] == PARQUET_MAGIC:
+        return pq.read_table(BytesIO(data), columns=columns).to_pandas()
+    result = loads(data)
+    if columns is not None and isinstance(result, pd.DataFrame):
+        return result[columns]
+    return result
+
+
+class S3ObjectFile(RawIOBase):
+    """
+    Read-only, seekable file over an S3 object where every read is a ranged
+    GET, so a Parquet reader only downloads the footer and the column chunks
+    it needs. Reads from the tail of the object already downloaded, if
+    given, are served from it
+
+    Attributes:
+    size: int, size of the object in bytes
+    bytes_read: int, bytes downloaded so far
+    requests: int, ranged GETs made so far
+    """
+
+    def __init__(
+        self, s3: S3Client, bucket: str, key: str, size: int, tail: bytes = b""
+    ):
+        super().__init__()
+        self._s3 = s3
+        self._bucket = bucket
+        self._key = key
+        self._position = 0
+        self.size = size
+        self._tail = tail
+        self.bytes_read = 0
+        self.requests = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=SEEK_SET):
+        if whence == SEEK_CUR:
+            offset += self._position
+        elif whence == SEEK_END:
+            offset += self.size
+        self._position = max(0, offset)
+        return self._position
+
+    def readinto(self, buffer):
+        end = min(self._position + len(buffer), self.size)
+        if end <= self._position:
+            return 0
+        tail_start = self.size - len(self._tail)
+        data = b""
+        if self._position < tail_start:
+            data = self._s3.get_object_range(
+                bucket=self._bucket,
+                key=self._key,
+                start=self._position,
+                end=min(end, tail_start) - 1,
+            )
+            self.bytes_read += len(data)
+            self.requests += 1
+        if end > tail_start:
+            start = max(self._position, tail_start) - tail_start
+            data += self._tail[start : end - tail_start]
+        buffer[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
 class PersistedData(object):
+    """
+    Data persisted for other checks to reuse. When there is a backend, reads
+    go through the container's /tmp disk tier, then the backend, filling the
+    tier when the backend had the value, and saves are written through to
+    the tier
+    """
 
     def __init__(self):
         backend = environ.get("CACHE_BACKEND")
@@ -31,15 +294,133 @@ class PersistedData(object):
             self.backend = RedisBackend()
         else:
             self.backend = None
+        self._tiers = [tier for tier in (disk_tier,) if tier.enabled]
+
+    def save(self, key, data, ttl=None, wait=False):
+        """
+        Persist the data. It is serialised before returning, so the check is
+        free to modify it, and unless wait is set or write-behind is disabled
+        it is uploaded on a background thread, saved in full by the time
+        flush_persistence returns
+        """
+        if not self.backend:
+            return
+        start = perf_counter()
+        value = serialise(data, get_persistence_format())
+        if wait or not write_behind_enabled():
+            self._save(key, value, ttl, start)
+            return
+        future = _write_behind_executor().submit(self._save, key, value, ttl, start)
+        with _pending_saves_lock:
+            _pending_saves.append((key, future))
 
-    def save(self, key, data):
-        self.backend.save(key, data) if self.backend else None
+    def _save(self, key, value: bytes, ttl, start: float):
+        self.backend.save_value(key, value, ttl=ttl)
+        for tier in self._tiers:
+            tier.put(key, value)
+        logger.info(
+            f"Persisted {key} ({len(value)} bytes) in "
+            f"{(perf_counter() - start) * 1000:.0f}ms"
+        )
 
     def exists(self, key):
-        return self.backend.exists(key) if self.backend else False
+        if not self.backend:
+            return False
+        value, _ = self._read_tiers(key)
+        if value is not None:
+            return not _is_miss(value)
+        return self.backend.exists(key)
 
-    def get(self, key):
-        return self.backend.get(key) if self.backend else None
+    def get(self, key, columns=None):
+        if not self.backend:
+            return None
+        if not self._tiers:
+            return self.backend.get(key, columns=columns)
+        return self._get_through_tiers(key, columns, remember_miss=False)
+
+    def get_or_miss(self, key, columns=None):
+        """
+        Get the data in a single request to the backend rather than asking
+        whether it exists first, None on a miss. Misses are remembered for
+        CACHE_MISS_TTL seconds in the tiers
+        """
+        if not self.backend:
+            return None
+        if not self._tiers:
+            return self.backend.get_or_miss(key, columns=columns)
+        return self._get_through_tiers(key, columns, remember_miss=True)
+
+    def _get_through_tiers(self, key, columns, remember_miss: bool):
+        """
+        The data from the first tier with the whole value or, when only some
+        columns are asked for, with those columns. Otherwise the backend
+        reads just those columns, as it would without the tiers, and they
+        are cached under a key of their own. A key the backend doesn't have
+        is remembered as a miss when remember_miss is set, otherwise the
+        backend raises KeyError
+        """
+        value, missed = self._read_tiers(key)
+        if value is not None and not _is_miss(value):
+            for tier in missed:
+                tier.put(key, value)
+            return deserialise(value, columns=columns)
+        if value is None or not remember_miss:
+            if columns is not None:
+                data = self._get_projection(key, columns, remember_miss)
+                if data is not None:
+                    return data
+            else:
+                value = (
+                    self.backend.find_value(key)
+                    if remember_miss
+                    else self.backend.get_value(key)
+                )
+                if value is not None:
+                    for tier in missed:
+                        tier.put(key, value)
+                    return deserialise(value)
+            logger.debug(f"{key} is not persisted")
+            value = _miss_marker()
+        for tier in missed:
+            tier.put(key, value)
+        return None
+
+    def _get_projection(self, key, columns, remember_miss: bool):
+        projection = _projection_key(key, columns)
+        value, missed = self._read_tiers(projection)
+        if value is not None:
+            for tier in missed:
+                tier.put(projection, value)
+            return deserialise(value)
+        if remember_miss:
+            data = self.backend.get_or_miss(key, columns=columns)
+        else:
+            data = self.backend.get(key, columns=columns)
+        if data is not None:
+            value = serialise(data, get_persistence_format())
+            for tier in missed:
+                tier.put(projection, value)
+        return data
+
+    def _read_tiers(self, key):
+        """
+        The value, or unexpired miss marker, from the first tier with one
+        and the tiers above it, which didn't
+        """
+        missed = []
+        for tier in self._tiers:
+            value = tier.get(key)
+            if value is not None and not _is_expired_miss(value):
+                return value, missed
+            missed.append(tier)
+        return None, missed
+
+    @staticmethod
+    def stats() -> dict:
+        """
+        Hit and miss counts of the container's tiers
+        """
+        return {tier.name: tier.stats() for tier in (disk_tier,)}
 
 
 class S3Backend(object):
@@ -51,29 +432,201 @@ class S3Backend(object):
             raise ValueError(
                 "CACHE_BUCKET is not set in environment for S3 Backend Persistence"
             )
+        self._format = get_persistence_format()
         logger.debug(f"Initialised S3 backend using {self._bucket}")
 
-    def save(self, key, data):
-        self._s3.put_object(bucket=self._bucket, key=key, data=dumps(data))
+    def save(self, key, data, ttl=None):
+        self.save_value(key, serialise(data, self._format), ttl=ttl)
+
+    def save_value(self, key, value: bytes, ttl=None):
+        # Objects expire through the cache bucket's lifecycle rule instead
+        self._s3.put_object(bucket=self._bucket, key=key, data=value)
 
     def exists(self, key):
         return self._s3.object_exists(bucket=self._bucket, key=key)
 
-    def get(self, key):
-        return loads(self._s3.get_object(bucket=self._bucket, key=key))
+    def get(self, key, columns=None):
+        """
+        Get the persisted data. When columns are given and the object is
+        Parquet only its tail and those column chunks are downloaded, with
+        ranged GETs
+        """
+        if columns is None:
+            return deserialise(self.get_value(key))
+        df = self._get_columns(key, columns)
+        if df is None:
+            logger.error(f"{key} is not persisted in S3")
+            raise KeyError(f"{key} is not persisted in S3")
+        return df
+
+    def get_or_miss(self, key, columns=None):
+        """
+        Get the persisted data, or None, where a miss is the NoSuchKey of
+        the first GET rather than the answer to a HEAD
+        """
+        if columns is not None:
+            return self._get_columns(key, columns)
+        value = self.find_value(key)
+        return None if value is None else deserialise(value)
+
+    def get_value(self, key) -> bytes:
+        return self._s3.get_object(bucket=self._bucket, key=key)
+
+    def find_value(self, key):
+        return self._s3.get_object_if_exists(bucket=self._bucket, key=key)
+
+    def _get_columns(self, key, columns):
+        """
+        The columns of the persisted data, None if there is no such object.
+        The first GET is for the object's last RANGED_GET_TAIL_SIZE bytes,
+        which is the whole of a smaller object. A larger Parquet object's
+        footer is read from them and only the column chunks it doesn't hold
+        are fetched, anything else is downloaded whole
+        """
+        tail = self._s3.get_object_tail(
+            bucket=self._bucket, key=key, length=RANGED_GET_TAIL_SIZE
+        )
+        if tail is None:
+            return None
+        data, size = tail
+        if len(data) >= size:
+            return deserialise(data, columns=columns)
+        if pq is None or data[-4:] != PARQUET_MAGIC:
+            return deserialise(self.get_value(key), columns=columns)
+        source = S3ObjectFile(self._s3, self._bucket, key, size, tail=data)
+        parquet_file = pq.ParquetFile(source, pre_buffer=True)
+        df = parquet_file.read(columns=columns, use_pandas_metadata=True).to_pandas()
+        logger.debug(
+            f"Read {len(data) + source.bytes_read} of {size} bytes of {key} "
+            f"in {source.requests + 1} requests"
+        )
+        return df
+
+
+def get_redis_pool(url: str):
+    with _redis_pools_lock:
+        if url not in _redis_pools:
+            _redis_pools[url] = redis.ConnectionPool.from_url(
+                url,
+                max_connections=REDIS_POOL_SIZE,
+                socket_timeout=REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+            )
+        return _redis_pools[url]
+
+
+def _chunk_key(key, index) -> str:
+    return f"{key}:chunk:{index}"
 
 
 class RedisBackend(object):
+    """
+    Persists data in Redis (or anything speaking its protocol, e.g.
+    ElastiCache or Valkey) with a TTL on every key. Values larger than
+    REDIS_CHUNK_SIZE are stored as chunks under their own keys with a marker
+    holding the chunk count under the key itself, and read back in one
+    pipelined round trip
+    """
 
     def __init__(self):
-        logger.error("Redis Backend is not implemented")
-        raise ValueError("Redis Backend is not implemented")
+        if redis is None:
+            logger.error("redis is not installed for Redis Backend Persistence")
+            raise ValueError("redis is not installed for Redis Backend Persistence")
+        url = environ.get("REDIS_URL")
+        if url is None:
+            raise ValueError(
+                "REDIS_URL is not set in environment for Redis Backend Persistence"
+            )
+        self._redis = redis.Redis(connection_pool=get_redis_pool(url))
+        self._format = get_persistence_format()
+        logger.debug("Initialised Redis backend")
 
-    def save(self, key, data):
-        pass
+    def save(self, key, data, ttl=None):
+        self.save_value(key, serialise(data, self._format), ttl=ttl)
+
+    def save_value(self, key, value: bytes, ttl=None):
+        if len(value) > REDIS_MAX_VALUE_SIZE:
+            logger.warning(
+                f"Not persisting {key}, {len(value)} bytes is over the "
+                f"{REDIS_MAX_VALUE_SIZE} byte limit"
+            )
+            return
+        ttl = ttl or CACHE_TTL
+        pipeline = self._redis.pipeline(transaction=True)
+        if len(value) <= REDIS_CHUNK_SIZE:
+            pipeline.set(key, value, ex=ttl)
+        else:
+            chunks = range(0, len(value), REDIS_CHUNK_SIZE)
+            for index, start in enumerate(chunks):
+                pipeline.set(
+                    _chunk_key(key, index),
+                    value[start : start + REDIS_CHUNK_SIZE],
+                    ex=ttl,
+                )
+            pipeline.set(key, REDIS_CHUNK_MARKER + str(len(chunks)).encode(), ex=ttl)
+        try:
+            pipeline.execute()
+        except Exception as e:
+            logger.error(f"Error persisting {key} to Redis: {e}")
+            raise
+
+    def _chunk_count(self, head: bytes):
+        if head.startswith(REDIS_CHUNK_MARKER):
+            return int(head[len(REDIS_CHUNK_MARKER) :])
+        return None
 
     def exists(self, key):
-        pass
+        """
+        The key exists with all of its chunks, any of which may have been
+        evicted on their own
+        """
+        try:
+            head = self._redis.getrange(key, 0, len(REDIS_CHUNK_MARKER) + 10)
+            chunk_count = self._chunk_count(head)
+            if chunk_count is None:
+                return len(head) > 0
+            return (
+                self._redis.exists(
+                    *[_chunk_key(key, index) for index in range(chunk_count)]
+                )
+                == chunk_count
+            )
+        except Exception as e:
+            logger.error(f"Error checking if {key} exists in Redis: {e}")
+            raise
+
+    def get(self, key, columns=None):
+        return deserialise(self.get_value(key), columns=columns)
+
+    def get_or_miss(self, key, columns=None):
+        value = self.find_value(key)
+        return None if value is None else deserialise(value, columns=columns)
+
+    def get_value(self, key) -> bytes:
+        value = self.find_value(key)
+        if value is None:
+            logger.error(f"{key} is not persisted in Redis")
+            raise KeyError(f"{key} is not persisted in Redis")
+        return value
 
-    def get(self, key):
-        pass
+    def find_value(self, key):
+        """
+        The value, None if the key or any of its chunks has expired
+        """
+        try:
+            value = self._redis.get(key)
+            if value is None:
+                return None
+            chunk_count = self._chunk_count(value)
+            if chunk_count is not None:
+                pipeline = self._redis.pipeline(transaction=False)
+                for index in range(chunk_count):
+                    pipeline.get(_chunk_key(key, index))
+                chunks = pipeline.execute()
+                if any(chunk is None for chunk in chunks):
+                    return None
+                value = b"".join(chunks)
+        except Exception as e:
+            logger.error(f"Error getting {key} from Redis: {e}")
+            raise
+        return value
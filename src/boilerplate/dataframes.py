@@ -1,11 +1,36 @@
 from common import Check, DQSReport
+import datetime
+import logging
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
+from enum import Enum
+from io import BytesIO
+from time import perf_counter
+from os import environ
 from sqlalchemy.sql.functions import coalesce
-from typing import List
-from sqlalchemy import and_, func, String, asc
+from typing import Iterator, List, Optional
+from sqlalchemy import (
+    ARRAY,
+    Integer,
+    and_,
+    any_,
+    asc,
+    bindparam,
+    func,
+    select,
+    union,
+    String,
+)
 from dqs_logger import logger
-from data_persistence import PersistedData, PersistenceKey
+from query_metrics import find_caller, record_cursor_query
+from data_persistence import PersistedData, PersistenceKey, statement_version
+from naptan_reference import (
+    get_naptan_reference,
+    get_naptan_reference_version,
+    naptan_reference_enabled,
+)
+from stop_sequences import StopSequences
 from models import (
     TransmodelService as Service,
     TransmodelServicepatternstop as ServicePatternStop,
@@ -28,25 +53,711 @@ from models import (
 )
 
 
-def get_df_vehicle_journey(check: Check, refresh=False) -> pd.DataFrame:
+class FetchBackend(str, Enum):
+
+    SQL = "SQL"
+    COPY = "COPY"
+
+
+def get_fetch_backend() -> FetchBackend:
+    """
+    Backend used to fetch the vehicle journey dataframe, selected with
+    DATAFRAME_FETCH_BACKEND (SQL by default)
     """
-    Get the dataframe containing the vehicle journey and the stop activity
+    return FetchBackend(environ.get("DATAFRAME_FETCH_BACKEND", FetchBackend.SQL))
 
+
+def read_sql_copy(statement, connection) -> pd.DataFrame:
+    """
+    Run the statement as COPY (SELECT ...) TO STDOUT in CSV format and parse
+    the output straight into typed columns with the pandas CSV parser,
+    without building a Python tuple per row. Column types are taken from
+    the statement so that string columns are never inferred as numbers.
     """
+    string_columns, time_columns, date_columns = [], [], []
+    for column in statement.selected_columns:
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            continue
+        if python_type is str:
+            string_columns.append(column.name)
+        elif python_type is datetime.time:
+            time_columns.append(column.name)
+        elif python_type is datetime.date:
+            date_columns.append(column.name)
 
-    persistence = PersistedData()
-    if not refresh and persistence.exists(
-        PersistenceKey.VEHICLE_JOURNEY.to_check_value(check)
+    compiled = statement.compile(dialect=connection.dialect)
+    copy = "COPY ({}) TO STDOUT WITH (FORMAT csv, HEADER true, NULL '\\N')"
+    buffer = BytesIO()
+    # The engine's events never see the cursor's COPY, so it is timed here and
+    # recorded with placeholders rather than values, as they would record it
+    start = perf_counter()
+    with connection.connection.cursor() as cursor:
+        query = cursor.mogrify(str(compiled), compiled.params).decode()
+        cursor.copy_expert(copy.format(query), buffer)
+    duration_ms = (perf_counter() - start) * 1000
+    buffer.seek(0)
+
+    df = pd.read_csv(
+        buffer,
+        dtype={column: "object" for column in string_columns},
+        keep_default_na=False,
+        na_values=["\\N"],
+        true_values=["t"],
+        false_values=["f"],
+        parse_dates=date_columns,
+    )
+    for column in time_columns:
+        df[column] = pd.to_datetime(df[column], format="%H:%M:%S").dt.time
+    for column in date_columns:
+        df[column] = df[column].dt.date
+    record_cursor_query(copy.format(compiled), duration_ms, len(df), find_caller(2))
+    return df
+
+
+# Schema the vehicle journey dataframe is compacted to once it is loaded:
+# categoricals for strings repeated across stops and journeys, seconds since
+# midnight for times, the smallest integers the ids fit and a nullable boolean
+VEHICLE_JOURNEY_CATEGORIES = [
+    "activity",
+    "direction",
+    "atco_code",
+    "common_name",
+    "vehicle_journey_code",
+]
+VEHICLE_JOURNEY_TIMES = ["departure_time", "start_time"]
+VEHICLE_JOURNEY_INTEGERS = [
+    "naptan_stop_id",
+    "auto_sequence_number",
+    "service_pattern_stop_id",
+    "vehicle_journey_id",
+]
+VEHICLE_JOURNEY_BOOLEANS = ["is_timing_point"]
+VEHICLE_JOURNEY_SCHEMA = (
+    f"category:{VEHICLE_JOURNEY_CATEGORIES};seconds:{VEHICLE_JOURNEY_TIMES};"
+    f"integer:{VEHICLE_JOURNEY_INTEGERS};boolean:{VEHICLE_JOURNEY_BOOLEANS}"
+)
+
+
+def _seconds_since_midnight(value):
+    if (
+        value is None
+        or value is pd.NA
+        or (isinstance(value, float) and np.isnan(value))
     ):
-        logger.info(
-            f"Returning persisted vehicle journey dataframe for {check.file_id}"
+        return None
+    if isinstance(value, datetime.time):
+        return value.hour * 3600 + value.minute * 60 + value.second
+    if isinstance(value, datetime.timedelta):
+        return int(value.total_seconds())
+    if isinstance(value, str):
+        hours, minutes, *seconds = value.split(":")
+        return (
+            int(hours) * 3600
+            + int(minutes) * 60
+            + int(float(seconds[0] if seconds else 0))
         )
-        return persistence.get(PersistenceKey.VEHICLE_JOURNEY.to_check_value(check))
+    return int(value)
 
-    logger.info(f"Retrieving vehicle Journey DF for {check.file_id}")
 
-    result = (
-        check.db.session.query(Service)
+def time_of_day_seconds(values: pd.Series) -> pd.Series:
+    """
+    Times of day, as datetime.time, "HH:MM:SS" or already in seconds, as
+    nullable seconds since midnight
+    """
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return values.astype("Int32")
+    # A file has far fewer distinct times than stop rows, so each is only
+    # converted once
+    codes, uniques = pd.factorize(values)
+    seconds = pd.array(
+        [_seconds_since_midnight(value) for value in uniques] + [None], dtype="Int32"
+    )
+    return pd.Series(seconds[codes], index=values.index)
+
+
+def format_time_of_day(value, time_format: str = "%H:%M:%S") -> str:
+    """
+    Format seconds since midnight, or a datetime.time, the way a
+    datetime.time is formatted in observation details. Strings are taken to
+    be formatted already
+    """
+    if isinstance(value, str):
+        return value
+    seconds = _seconds_since_midnight(value)
+    if seconds is None:
+        return str(None)
+    return datetime.time(
+        seconds // 3600 % 24, seconds // 60 % 60, seconds % 60
+    ).strftime(time_format)
+
+
+def format_times_of_day(values: pd.Series) -> pd.Series:
+    """
+    Format every time of day of the series as "HH:MM" at once, "None" where
+    there is no time
+    """
+    seconds = time_of_day_seconds(values)
+    hours = (seconds // 3600 % 24).astype(str).str.zfill(2)
+    minutes = (seconds // 60 % 60).astype(str).str.zfill(2)
+    return (hours + ":" + minutes).where(seconds.notna(), str(None)).astype(object)
+
+
+def _compact_integers(values: pd.Series) -> pd.Series:
+    int32 = np.iinfo(np.int32)
+    if values.notna().any() and (values.min() < int32.min or values.max() > int32.max):
+        return values
+    return values.astype("Int32" if values.isna().any() else "int32")
+
+
+def compact_vehicle_journey_df(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert the vehicle journey dataframe to the compact dtypes of its schema,
+    logging its memory before and after when debugging, as measuring the
+    strings takes longer than converting them. Columns it doesn't have are
+    skipped and strings are only made categorical when they repeat
+    """
+    measure = logger.isEnabledFor(logging.DEBUG)
+    before = df.memory_usage(deep=True).sum() if measure else 0
+    df = df.copy()
+    for column in VEHICLE_JOURNEY_CATEGORIES:
+        if column in df and df[column].nunique() <= len(df) // 2:
+            df[column] = df[column].astype("category")
+    for column in VEHICLE_JOURNEY_TIMES:
+        if column in df:
+            df[column] = time_of_day_seconds(df[column])
+    for column in VEHICLE_JOURNEY_INTEGERS:
+        if column in df:
+            df[column] = _compact_integers(df[column])
+    for column in VEHICLE_JOURNEY_BOOLEANS:
+        if column in df:
+            df[column] = df[column].astype("boolean")
+    if measure:
+        after = df.memory_usage(deep=True).sum()
+        logger.debug(
+            f"Compacted vehicle journey dataframe of {len(df)} rows from "
+            f"{before / 2**20:.1f}MiB to {after / 2**20:.1f}MiB"
+        )
+    return df
+
+
+def _distinct_by_journey(
+    df: pd.DataFrame, column: str, vehicle_journey_ids: Optional[List], to_value=None
+) -> pd.DataFrame:
+    """
+    Sorted distinct values of the column for each of the vehicle journeys, or
+    every journey when there are no ids, as array_agg(DISTINCT ...) grouped
+    by vehicle journey returns them
+    """
+    if vehicle_journey_ids is not None:
+        df = df[df["vehicle_journey_id"].isin(vehicle_journey_ids)]
+    values = df[column] if to_value is None else df[column].map(to_value)
+    grouped = values.groupby(df["vehicle_journey_id"], dropna=True).agg(
+        lambda cells: sorted(set(cells.dropna()))
+        + ([None] if cells.isna().any() else [])
+    )
+    return pd.DataFrame(
+        {
+            column: pd.Series(grouped.values, dtype=object),
+            "vehicle_journey_id": grouped.index.astype("int64"),
+        }
+    )
+
+
+def _format_date(value):
+    return None if pd.isna(value) else value.strftime("%Y-%m-%d")
+
+
+class TransmodelSnapshot:
+    """
+    The transmodel rows of one TXC file, fetching each table slice once so
+    every get_df_* frame of the file can be derived from it in memory rather
+    than by re-running the Service -> ServicePattern -> ServicePatternStop ->
+    VehicleJourney join per frame
+
+    Attributes:
+    file_id: int
+    service_patterns: service_id and servicepattern_id of the file's services
+    stops: service pattern stops of those patterns
+    stop_activities: all stop activities
+    vehicle_journeys: journeys of the patterns or of their stops
+    operating_profiles: day_of_week of the journeys
+    operating_dates: operating date exceptions of the journeys
+    non_operating_dates: non operating date exceptions of the journeys
+    serviced_organisation_vehicle_journeys: serviced organisations of the journeys
+    serviced_organisations: those serviced organisations
+    serviced_organisation_working_days: their working days
+    naptan_stop_points: NaPTAN stops linked to, or with the ATCO code of, the
+    stops, from the NaPTAN reference when it is enabled
+    atco_codes: lower case ATCO codes of the stops
+    """
+
+    def __init__(self, check: Check):
+        self.file_id = check.file_id
+        self._check = check
+        self._load()
+
+    def _read(self, query) -> pd.DataFrame:
+        connection = self._check.db.read_session.connection()
+        if get_fetch_backend() == FetchBackend.COPY:
+            return read_sql_copy(query.statement, connection)
+        return pd.read_sql_query(query.statement, connection)
+
+    def _load(self):
+        logger.info(f"Loading transmodel snapshot for {self.file_id}")
+        session = self._check.db.read_session
+        pattern_ids = (
+            select(ServicePatternService.servicepattern_id)
+            .join(Service, Service.id == ServicePatternService.service_id)
+            .where(Service.txcfileattributes_id == self.file_id)
+        )
+        journey_ids = union(
+            select(VehicleJourney.id).where(
+                VehicleJourney.service_pattern_id.in_(pattern_ids)
+            ),
+            select(ServicePatternStop.vehicle_journey_id).where(
+                ServicePatternStop.service_pattern_id.in_(pattern_ids)
+            ),
+        )
+        serviced_organisation_vj_ids = select(ServicedOrganisationVJ.id).where(
+            ServicedOrganisationVJ.vehicle_journey_id.in_(journey_ids)
+        )
+
+        self.service_patterns = self._read(
+            session.query(
+                ServicePatternService.service_id,
+                ServicePatternService.servicepattern_id,
+            )
+            .join(Service, Service.id == ServicePatternService.service_id)
+            .where(Service.txcfileattributes_id == self.file_id)
+        )
+        self.stops = self._read(
+            session.query(
+                ServicePatternStop.id,
+                ServicePatternStop.service_pattern_id,
+                ServicePatternStop.vehicle_journey_id,
+                ServicePatternStop.naptan_stop_id,
+                ServicePatternStop.stop_activity_id,
+                ServicePatternStop.auto_sequence_number,
+                ServicePatternStop.atco_code,
+                ServicePatternStop.departure_time,
+                ServicePatternStop.is_timing_point,
+                ServicePatternStop.txc_common_name,
+            ).where(ServicePatternStop.service_pattern_id.in_(pattern_ids))
+        )
+        self.stop_activities = self._read(
+            session.query(StopActivity.id, StopActivity.name)
+        )
+        self.vehicle_journeys = self._read(
+            session.query(
+                VehicleJourney.id,
+                VehicleJourney.service_pattern_id,
+                VehicleJourney.start_time,
+                VehicleJourney.direction,
+                VehicleJourney.journey_code,
+                VehicleJourney.line_ref,
+                VehicleJourney.block_number,
+            ).where(VehicleJourney.id.in_(journey_ids))
+        )
+        self.operating_profiles = self._read(
+            session.query(
+                OperatingProfile.vehicle_journey_id, OperatingProfile.day_of_week
+            ).where(OperatingProfile.vehicle_journey_id.in_(journey_ids))
+        )
+        self.operating_dates = self._read(
+            session.query(
+                OperatingDatesExceptions.vehicle_journey_id,
+                OperatingDatesExceptions.operating_date,
+            ).where(OperatingDatesExceptions.vehicle_journey_id.in_(journey_ids))
+        )
+        self.non_operating_dates = self._read(
+            session.query(
+                NonOperatingdatesexceptions.vehicle_journey_id,
+                NonOperatingdatesexceptions.non_operating_date,
+            ).where(NonOperatingdatesexceptions.vehicle_journey_id.in_(journey_ids))
+        )
+        self.serviced_organisation_vehicle_journeys = self._read(
+            session.query(
+                ServicedOrganisationVJ.id,
+                ServicedOrganisationVJ.vehicle_journey_id,
+                ServicedOrganisationVJ.serviced_organisation_id,
+                ServicedOrganisationVJ.operating_on_working_days,
+            ).where(ServicedOrganisationVJ.vehicle_journey_id.in_(journey_ids))
+        )
+        self.serviced_organisations = self._read(
+            session.query(
+                ServicedOrganisation.id,
+                ServicedOrganisation.name,
+                ServicedOrganisation.organisation_code,
+            ).where(
+                ServicedOrganisation.id.in_(
+                    select(ServicedOrganisationVJ.serviced_organisation_id).where(
+                        ServicedOrganisationVJ.vehicle_journey_id.in_(journey_ids)
+                    )
+                )
+            )
+        )
+        self.serviced_organisation_working_days = self._read(
+            session.query(
+                ServiceOrganisationWorkingDays.serviced_organisation_vehicle_journey_id,
+                ServiceOrganisationWorkingDays.start_date,
+                ServiceOrganisationWorkingDays.end_date,
+            ).where(
+                ServiceOrganisationWorkingDays.serviced_organisation_vehicle_journey_id.in_(
+                    serviced_organisation_vj_ids
+                )
+            )
+        )
+        self.atco_codes = set(self.stops["atco_code"].dropna().str.lower())
+        naptan = get_naptan_reference(self._check)
+        if naptan is not None:
+            self.naptan_stop_points = pd.concat(
+                [
+                    naptan.stops_by_id(self.stops["naptan_stop_id"]),
+                    naptan.stops_by_atco_code(self.atco_codes),
+                ]
+            ).drop_duplicates("id", ignore_index=True)
+            return
+        file_stops = select(ServicePatternStop.naptan_stop_id).where(
+            ServicePatternStop.service_pattern_id.in_(pattern_ids)
+        )
+        # ATCO codes are matched ignoring case on both sides, as NaPTAN holds
+        # some with lower case suffixes
+        file_atco_codes = select(func.lower(ServicePatternStop.atco_code)).where(
+            ServicePatternStop.service_pattern_id.in_(pattern_ids)
+        )
+        self.naptan_stop_points = self._read(
+            session.query(
+                NaptanStopPoint.id,
+                NaptanStopPoint.atco_code,
+                NaptanStopPoint.common_name,
+                NaptanStopPoint.stop_type,
+            ).where(
+                NaptanStopPoint.id.in_(file_stops)
+                | func.lower(NaptanStopPoint.atco_code).in_(file_atco_codes)
+            )
+        )
+
+    def _journey_stops(self) -> pd.DataFrame:
+        """
+        Stops of the file's service patterns (once per service using the
+        pattern, as the SQL join returns them) with their vehicle journey
+        """
+        stops = self.stops[self.stops["vehicle_journey_id"].notna()].astype(
+            {"vehicle_journey_id": "int64"}
+        )
+        stops = stops.merge(
+            self.service_patterns[["servicepattern_id"]],
+            left_on="service_pattern_id",
+            right_on="servicepattern_id",
+        )
+        journeys = self.vehicle_journeys.rename(
+            columns={
+                "id": "vehicle_journey_id",
+                "service_pattern_id": "journey_service_pattern_id",
+            }
+        )
+        return stops.merge(journeys, on="vehicle_journey_id")
+
+    def _with_naptan(self, stops: pd.DataFrame, how: str) -> pd.DataFrame:
+        naptan = self.naptan_stop_points.rename(
+            columns={
+                "id": "naptan_stop_id",
+                "atco_code": "naptan_atco_code",
+                "common_name": "naptan_common_name",
+            }
+        )
+        if how == "inner":
+            stops = stops[stops["naptan_stop_id"].notna()]
+        stops = stops.merge(naptan, on="naptan_stop_id", how=how)
+        stops["common_name"] = stops["naptan_common_name"].where(
+            stops["naptan_common_name"].notna(), stops["txc_common_name"]
+        )
+        return stops
+
+    def vehicle_journey_df(self) -> pd.DataFrame:
+        stops = self._journey_stops()
+        stops = stops[stops["stop_activity_id"].notna()].astype(
+            {"stop_activity_id": "int64"}
+        )
+        stops = stops.merge(
+            self.stop_activities.rename(
+                columns={"id": "stop_activity_id", "name": "activity"}
+            ),
+            on="stop_activity_id",
+        )
+        stops = self._with_naptan(stops, how="left").rename(
+            columns={
+                "id": "service_pattern_stop_id",
+                "journey_code": "vehicle_journey_code",
+            }
+        )
+        # In journey and sequence order, as the persisted dataframe is
+        df = compact_vehicle_journey_df(
+            stops[
+                [
+                    "is_timing_point",
+                    "naptan_stop_id",
+                    "auto_sequence_number",
+                    "atco_code",
+                    "departure_time",
+                    "common_name",
+                    "service_pattern_stop_id",
+                    "activity",
+                    "start_time",
+                    "direction",
+                    "vehicle_journey_id",
+                    "vehicle_journey_code",
+                ]
+            ].reset_index(drop=True)
+        )
+        return StopSequences(df).df.reset_index(drop=True)
+
+    def missing_bus_working_number_df(self) -> pd.DataFrame:
+        first_stops = (
+            self.stops.groupby("service_pattern_id", as_index=False)["id"]
+            .min()
+            .rename(columns={"id": "service_pattern_stop_id"})
+        )
+        patterns = self.service_patterns[["servicepattern_id"]].drop_duplicates()
+        journeys = self.vehicle_journeys[
+            self.vehicle_journeys["block_number"].isnull()
+            & self.vehicle_journeys["service_pattern_id"].notna()
+        ].astype({"service_pattern_id": "int64"})
+        df = journeys.merge(
+            patterns, left_on="service_pattern_id", right_on="servicepattern_id"
+        ).merge(first_stops, on="service_pattern_id")
+        return df.rename(columns={"id": "vehicle_journey_id"})[
+            [
+                "vehicle_journey_id",
+                "start_time",
+                "block_number",
+                "direction",
+                "service_pattern_stop_id",
+            ]
+        ].reset_index(drop=True)
+
+    def stop_type_df(self, allowed_stop_types: List) -> pd.DataFrame:
+        stops = self._with_naptan(self._journey_stops(), how="inner")
+        stops = stops[
+            stops["stop_type"].notna() & ~stops["stop_type"].isin(allowed_stop_types)
+        ]
+        return stops.rename(columns={"id": "service_pattern_stop_id"})[
+            [
+                "atco_code",
+                "service_pattern_stop_id",
+                "common_name",
+                "vehicle_journey_id",
+                "stop_type",
+            ]
+        ].reset_index(drop=True)
+
+    def duplicate_journey_code_df(self) -> pd.DataFrame:
+        stops = self._journey_stops().merge(
+            self.serviced_organisation_vehicle_journeys[
+                ["vehicle_journey_id", "operating_on_working_days"]
+            ],
+            on="vehicle_journey_id",
+            how="left",
+        )
+        stops = stops.rename(columns={"id": "service_pattern_stop_id"})
+        return (
+            stops.sort_values(["vehicle_journey_id", "auto_sequence_number"])[
+                [
+                    "line_ref",
+                    "journey_code",
+                    "vehicle_journey_id",
+                    "direction",
+                    "service_pattern_stop_id",
+                    "auto_sequence_number",
+                    "operating_on_working_days",
+                ]
+            ]
+        ).reset_index(drop=True)
+
+    def operating_profile_df(self, vehicle_journey_ids: Optional[List]) -> pd.DataFrame:
+        return _distinct_by_journey(
+            self.operating_profiles, "day_of_week", vehicle_journey_ids
+        )
+
+    def operating_date_exception_df(
+        self, vehicle_journey_ids: Optional[List]
+    ) -> pd.DataFrame:
+        return _distinct_by_journey(
+            self.operating_dates, "operating_date", vehicle_journey_ids, _format_date
+        )
+
+    def non_operating_date_exception_df(
+        self, vehicle_journey_ids: Optional[List]
+    ) -> pd.DataFrame:
+        return _distinct_by_journey(
+            self.non_operating_dates,
+            "non_operating_date",
+            vehicle_journey_ids,
+            _format_date,
+        )
+
+    def serviced_organisation_vehicle_journey_df(
+        self, vehicle_journey_ids: Optional[List]
+    ) -> pd.DataFrame:
+        return _distinct_by_journey(
+            self.serviced_organisation_vehicle_journeys,
+            "serviced_organisation_id",
+            vehicle_journey_ids,
+            lambda value: None if pd.isna(value) else str(int(value)),
+        )
+
+    def serviced_organisation_df(self) -> pd.DataFrame:
+        patterns = self.service_patterns[["servicepattern_id"]]
+        journeys = self.vehicle_journeys[
+            self.vehicle_journeys["service_pattern_id"].notna()
+        ].astype({"service_pattern_id": "int64"})
+        journeys = journeys.merge(
+            patterns, left_on="service_pattern_id", right_on="servicepattern_id"
+        )[["id"]].rename(columns={"id": "vehicle_journey_id"})
+        serviced_organisation_vjs = self.serviced_organisation_vehicle_journeys[
+            self.serviced_organisation_vehicle_journeys["operating_on_working_days"]
+            == True  # noqa: E712
+        ].rename(columns={"id": "serviced_organisation_vehicle_journey_id"})
+        df = (
+            journeys.merge(serviced_organisation_vjs, on="vehicle_journey_id")
+            .merge(
+                self.serviced_organisations.rename(
+                    columns={
+                        "id": "serviced_organisation_id",
+                        "name": "serviced_organisation_name",
+                        "organisation_code": "serviced_organisation_code",
+                    }
+                ),
+                on="serviced_organisation_id",
+            )
+            .merge(
+                self.serviced_organisation_working_days.rename(
+                    columns={
+                        "start_date": "serviced_organisation_start_date",
+                        "end_date": "serviced_organisation_end_date",
+                    }
+                ),
+                on="serviced_organisation_vehicle_journey_id",
+            )
+        )
+        return df[
+            [
+                "vehicle_journey_id",
+                "serviced_organisation_id",
+                "serviced_organisation_name",
+                "serviced_organisation_code",
+                "serviced_organisation_start_date",
+                "serviced_organisation_end_date",
+                "serviced_organisation_vehicle_journey_id",
+            ]
+        ].reset_index(drop=True)
+
+    def naptan_availability_df(self, atco_codes: set) -> pd.DataFrame:
+        naptan = self.naptan_stop_points
+        df = naptan[naptan["atco_code"].str.lower().isin(atco_codes)].copy()
+        df["atco_code_exists"] = df["atco_code"].apply(lambda cell: cell in atco_codes)
+        return df.reset_index(drop=True)
+
+
+# Snapshot of the file being checked, loaded once and reused by every check
+# run for that file in this process and the workers forked from it
+_snapshot = None
+
+
+def load_snapshot(check: Check) -> TransmodelSnapshot:
+    global _snapshot
+    _snapshot = TransmodelSnapshot(check)
+    return _snapshot
+
+
+def get_snapshot(check: Check) -> Optional[TransmodelSnapshot]:
+    """
+    Snapshot of the check's file if one has been loaded, loading it first
+    when DATAFRAME_SNAPSHOT is enabled, otherwise None and the frames are
+    queried individually. The file executor loads it once for every check
+    of the file. It is off by default for the per-check Lambdas, whose
+    forked workers would each load every frame of the file for the one
+    they need and then discard it
+    """
+    if _snapshot is not None and _snapshot.file_id == check.file_id:
+        return _snapshot
+    if environ.get("DATAFRAME_SNAPSHOT", "false").lower() == "true":
+        return load_snapshot(check)
+    return None
+
+
+def clear_snapshot() -> None:
+    global _snapshot
+    _snapshot = None
+
+
+def get_stream_chunk_size() -> int:
+    """
+    Number of rows fetched per server-side cursor round trip when streaming
+    is enabled with DATAFRAME_CHUNK_SIZE, 0 (the default) disables streaming
+    """
+    return int(environ.get("DATAFRAME_CHUNK_SIZE", 0))
+
+
+def stream_vehicle_journey_chunks(
+    check: Check, statement, chunk_size: int
+) -> Iterator[pd.DataFrame]:
+    """
+    Execute the statement on a server-side cursor and yield DataFrames of
+    roughly chunk_size rows. The statement must be ordered by
+    vehicle_journey_id, rows of the journey at the end of a partition are
+    held back so every chunk contains complete vehicle journeys.
+    """
+    result = check.db.read_session.execute(
+        statement,
+        execution_options={"stream_results": True, "yield_per": chunk_size},
+    )
+    columns = list(result.keys())
+    carried = None
+    for rows in result.partitions():
+        df = pd.DataFrame.from_records(rows, columns=columns)
+        if carried is not None:
+            df = pd.concat([carried, df], ignore_index=True)
+        is_last_journey = df["vehicle_journey_id"] == df["vehicle_journey_id"].iloc[-1]
+        carried = df[is_last_journey]
+        if not is_last_journey.all():
+            yield df[~is_last_journey].reset_index(drop=True)
+    if carried is not None and not carried.empty:
+        yield carried.reset_index(drop=True)
+
+
+def get_vehicle_journey_query(check: Check, with_naptan_reference: bool = False):
+    """
+    Query for the vehicle journeys and their stop activity in the file. With
+    the NaPTAN reference, NaPTAN isn't joined and common_name is the TXC
+    common name, to be replaced with naptan.with_common_names
+    """
+    if with_naptan_reference:
+        return _vehicle_journey_query(check).with_entities(
+            *_vehicle_journey_columns(ServicePatternStop.txc_common_name)
+        )
+    return (
+        _vehicle_journey_query(check)
+        .join(
+            NaptanStopPoint,
+            ServicePatternStop.naptan_stop_id == NaptanStopPoint.id,
+            isouter=True,
+        )
+        .with_entities(
+            *_vehicle_journey_columns(
+                coalesce(
+                    NaptanStopPoint.common_name, ServicePatternStop.txc_common_name
+                )
+            )
+        )
+    )
+
+
+def _vehicle_journey_query(check: Check):
+    return (
+        check.db.read_session.query(Service)
         .join(ServicePatternService, Service.id == ServicePatternService.service_id)
         .join(
             ServicePatternStop,
@@ -57,33 +768,99 @@ def get_df_vehicle_journey(check: Check, refresh=False) -> pd.DataFrame:
         .join(
             VehicleJourney, ServicePatternStop.vehicle_journey_id == VehicleJourney.id
         )
-        .join(
-            NaptanStopPoint,
-            ServicePatternStop.naptan_stop_id == NaptanStopPoint.id,
-            isouter=True,
-        )
         .where(Service.txcfileattributes_id == check.file_id)
-        .with_entities(
-            ServicePatternStop.is_timing_point.label("is_timing_point"),
-            ServicePatternStop.naptan_stop_id.label("naptan_stop_id"),
-            ServicePatternStop.auto_sequence_number.label("auto_sequence_number"),
-            ServicePatternStop.atco_code.label("atco_code"),
-            ServicePatternStop.departure_time.label("departure_time"),
-            coalesce(
-                NaptanStopPoint.common_name, ServicePatternStop.txc_common_name
-            ).label("common_name"),
-            ServicePatternStop.id.label("service_pattern_stop_id"),
-            StopActivity.name.label("activity"),
-            VehicleJourney.start_time.label("start_time"),
-            VehicleJourney.direction.label("direction"),
-            VehicleJourney.id.label("vehicle_journey_id"),
-            VehicleJourney.journey_code.label("vehicle_journey_code"),
-        )
     )
-    df = pd.read_sql_query(result.statement, check.db.session.connection())
+
+
+def _vehicle_journey_columns(common_name) -> list:
+    return [
+        ServicePatternStop.is_timing_point.label("is_timing_point"),
+        ServicePatternStop.naptan_stop_id.label("naptan_stop_id"),
+        ServicePatternStop.auto_sequence_number.label("auto_sequence_number"),
+        ServicePatternStop.atco_code.label("atco_code"),
+        ServicePatternStop.departure_time.label("departure_time"),
+        common_name.label("common_name"),
+        ServicePatternStop.id.label("service_pattern_stop_id"),
+        StopActivity.name.label("activity"),
+        VehicleJourney.start_time.label("start_time"),
+        VehicleJourney.direction.label("direction"),
+        VehicleJourney.id.label("vehicle_journey_id"),
+        VehicleJourney.journey_code.label("vehicle_journey_code"),
+    ]
+
+
+def get_df_vehicle_journey(
+    check: Check, refresh=False, columns: List = None, wait_for_save=False
+) -> pd.DataFrame:
+    """
+    Get the dataframe containing the vehicle journey and the stop activity,
+    optionally only the given columns, which is all that is read of the
+    persisted dataframe. A dataframe loaded from the database is persisted
+    in the background unless wait_for_save is set
+
+    """
+
+    snapshot = get_snapshot(check)
+    if not refresh and snapshot is not None:
+        df = snapshot.vehicle_journey_df()
+        return df[columns] if columns else df
+
+    persistence = PersistedData()
+    # Keyed by the NaPTAN version, whose common names the dataframe holds,
+    # and the reference itself only loaded when the dataframe isn't persisted
+    naptan_version = get_naptan_reference_version(check)
+    result = get_vehicle_journey_query(check, naptan_version is not None)
+    schema = VEHICLE_JOURNEY_SCHEMA
+    if naptan_version is not None:
+        schema = f"{schema};naptan:{naptan_version}"
+    key = PersistenceKey.VEHICLE_JOURNEY.to_check_value(
+        check, version=statement_version(result.statement, schema)
+    )
+    if not refresh:
+        df = persistence.get_or_miss(key, columns=columns)
+        if df is not None:
+            logger.info(
+                f"Returning persisted vehicle journey dataframe for {check.file_id}"
+            )
+            return df
+
+    logger.info(f"Retrieving vehicle Journey DF for {check.file_id}")
+
+    if get_fetch_backend() == FetchBackend.COPY:
+        df = read_sql_copy(result.statement, check.db.read_session.connection())
+    else:
+        df = pd.read_sql_query(result.statement, check.db.read_session.connection())
+    if naptan_version is not None:
+        df = get_naptan_reference(check).with_common_names(df)
+    # Persisted in journey and sequence order, so the stop sequence checks
+    # that read it needn't sort it again
+    df = StopSequences(compact_vehicle_journey_df(df)).df.reset_index(drop=True)
     logger.info(f"Persisting Vehicle data DF for {check.file_id}")
-    persistence.save(PersistenceKey.VEHICLE_JOURNEY.to_check_value(check), df)
-    return df
+    persistence.save(key, df, wait=wait_for_save)
+    return df[columns] if columns else df
+
+
+def get_df_vehicle_journey_chunks(check: Check) -> Iterator[pd.DataFrame]:
+    """
+    Yield the vehicle journey dataframe in chunks of complete vehicle
+    journeys when streaming is enabled, otherwise yield the whole (possibly
+    persisted) dataframe from get_df_vehicle_journey as a single chunk
+    """
+    chunk_size = get_stream_chunk_size()
+    if not chunk_size or get_snapshot(check) is not None:
+        yield get_df_vehicle_journey(check)
+        return
+
+    logger.info(f"Streaming vehicle Journey DF for {check.file_id}")
+    with_naptan_reference = naptan_reference_enabled()
+    result = get_vehicle_journey_query(check, with_naptan_reference).order_by(
+        VehicleJourney.id, ServicePatternStop.auto_sequence_number
+    )
+    for df in stream_vehicle_journey_chunks(check, result.statement, chunk_size):
+        if with_naptan_reference:
+            # Only loaded once the file is found to have stops
+            df = get_naptan_reference(check).with_common_names(df)
+        yield compact_vehicle_journey_df(df)
 
 
 def get_df_missing_bus_working_number(check: Check) -> pd.DataFrame:
@@ -92,8 +869,12 @@ def get_df_missing_bus_working_number(check: Check) -> pd.DataFrame:
 
     """
 
+    snapshot = get_snapshot(check)
+    if snapshot is not None:
+        return snapshot.missing_bus_working_number_df()
+
     result = (
-        check.db.session.query(Service)
+        check.db.read_session.query(Service)
         .join(ServicePatternService, Service.id == ServicePatternService.service_id)
         .join(
             ServicePatternStop,
@@ -120,7 +901,7 @@ def get_df_missing_bus_working_number(check: Check) -> pd.DataFrame:
             ),  # Get the first stop for Each Vehicle Journey
         )
     )
-    return pd.read_sql_query(result.statement, check.db.session.connection())
+    return pd.read_sql_query(result.statement, check.db.read_session.connection())
 
 
 def get_df_stop_type(check: Check, allowed_stop_types: List) -> pd.DataFrame:
@@ -129,6 +910,10 @@ def get_df_stop_type(check: Check, allowed_stop_types: List) -> pd.DataFrame:
 
     """
 
+    snapshot = get_snapshot(check)
+    if snapshot is not None:
+        return snapshot.stop_type_df(allowed_stop_types)
+
     columns = [
         "atco_code",
         "service_pattern_stop_id",
@@ -137,8 +922,11 @@ def get_df_stop_type(check: Check, allowed_stop_types: List) -> pd.DataFrame:
         "stop_type",
     ]
 
+    if naptan_reference_enabled():
+        return _stop_type_df_from_reference(check, allowed_stop_types)[columns]
+
     result = (
-        check.db.session.query(Service)
+        check.db.read_session.query(Service)
         .join(ServicePatternService, Service.id == ServicePatternService.service_id)
         .join(
             ServicePatternStop,
@@ -170,13 +958,74 @@ def get_df_stop_type(check: Check, allowed_stop_types: List) -> pd.DataFrame:
     return df
 
 
-def get_df_dqs_observation_results(report: DQSReport) -> pd.DataFrame:
+def _stop_type_df_from_reference(
+    check: Check, allowed_stop_types: List
+) -> pd.DataFrame:
     """
-    Get the dataframe with observation results
+    Stops of the file with a NaPTAN stop, whose stop type and common name are
+    looked up in the NaPTAN reference rather than joined. The reference is
+    only loaded when the file has such stops
     """
+    result = (
+        check.db.read_session.query(Service)
+        .join(ServicePatternService, Service.id == ServicePatternService.service_id)
+        .join(
+            ServicePatternStop,
+            ServicePatternService.servicepattern_id
+            == ServicePatternStop.service_pattern_id,
+        )
+        .join(
+            VehicleJourney, ServicePatternStop.vehicle_journey_id == VehicleJourney.id
+        )
+        .where(
+            and_(
+                ServicePatternStop.naptan_stop_id.isnot(None),
+                Service.txcfileattributes_id == check.file_id,
+            )
+        )
+        .with_entities(
+            ServicePatternStop.atco_code,
+            ServicePatternStop.id,
+            ServicePatternStop.txc_common_name,
+            VehicleJourney.id,
+            ServicePatternStop.naptan_stop_id,
+        )
+    )
+    stops = pd.DataFrame.from_records(
+        result.all(),
+        columns=[
+            "atco_code",
+            "service_pattern_stop_id",
+            "txc_common_name",
+            "vehicle_journey_id",
+            "naptan_stop_id",
+        ],
+    ).astype({"naptan_stop_id": "int64"})
+    if stops.empty:
+        return stops.assign(
+            common_name=stops["txc_common_name"], stop_type=stops["atco_code"]
+        )
+    naptan = get_naptan_reference(check)
+    naptan_stops = naptan.stops_by_id(stops["naptan_stop_id"]).rename(
+        columns={"id": "naptan_stop_id", "atco_code": "naptan_atco_code"}
+    )
+    df = stops.merge(naptan_stops, on="naptan_stop_id")
+    df = df[df["stop_type"].notna() & ~df["stop_type"].isin(allowed_stop_types)]
+    df["common_name"] = df["common_name"].where(
+        df["common_name"].notna(), df["txc_common_name"]
+    )
+    return df.reset_index(drop=True)
 
+
+def get_df_dqs_observation_results(report: DQSReport) -> pd.DataFrame:
+    """
+    Get the dataframe with observation results. The observations are written
+    by the checks just before the report is built, so the replica is only
+    used once it has caught up with the primary
+    """
+    session = report.db.fresh_read_session()
     result = (
-        report.db.session.query(
+        session.query(
             DqsChecks.importance.label("Importance"),
             DqsChecks.category.label("Category"),
             DqsChecks.observation.label("Observation"),
@@ -199,22 +1048,16 @@ def get_df_dqs_observation_results(report: DQSReport) -> pd.DataFrame:
         .filter(DqsReport.id == report.report_id)
     )
 
-    return pd.read_sql_query(result.statement, report.db.session.bind)
+    return pd.read_sql_query(result.statement, session.connection())
 
 
-def get_vj_duplicate_journey_code(check: Check) -> pd.DataFrame:
+def get_vj_duplicate_journey_code_query(check: Check):
     """
-    Get the dataframe containing the vehicle journey and stop point
-    including operating profile, non operating dates, operating dates
-    and serviced organisation
+    Query for the vehicle journeys and stop points with their serviced
+    organisation working days flag, ordered by vehicle journey
     """
-
-    logger.info(
-        f"Retrieving duplicate Journey Code DF {check.file_id}/{check.check_id}"
-    )
-
-    result = (
-        check.db.session.query(Service)
+    return (
+        check.db.read_session.query(Service)
         .join(ServicePatternService, Service.id == ServicePatternService.service_id)
         .join(
             ServicePatternStop,
@@ -245,7 +1088,52 @@ def get_vj_duplicate_journey_code(check: Check) -> pd.DataFrame:
         .order_by(asc(VehicleJourney.id), asc(ServicePatternStop.auto_sequence_number))
     )
 
-    df = pd.read_sql_query(result.statement, check.db.session.connection())
+
+def get_vj_duplicate_journey_code(check: Check) -> pd.DataFrame:
+    """
+    Get the dataframe containing the vehicle journey and stop point
+    including operating profile, non operating dates, operating dates
+    and serviced organisation
+    """
+
+    logger.info(
+        f"Retrieving duplicate Journey Code DF {check.file_id}/{check.check_id}"
+    )
+
+    snapshot = get_snapshot(check)
+    if snapshot is not None:
+        df = snapshot.duplicate_journey_code_df()
+    else:
+        result = get_vj_duplicate_journey_code_query(check)
+        df = pd.read_sql_query(result.statement, check.db.read_session.connection())
+    return build_vj_duplicate_journey_code_df(check, df, whole_file=True)
+
+
+def get_vj_duplicate_journey_code_chunks(check: Check) -> Iterator[pd.DataFrame]:
+    """
+    Yield the duplicate journey code dataframe in chunks of complete vehicle
+    journeys when streaming is enabled, otherwise as a single chunk
+    """
+    chunk_size = get_stream_chunk_size()
+    if not chunk_size or get_snapshot(check) is not None:
+        yield get_vj_duplicate_journey_code(check)
+        return
+
+    logger.info(f"Streaming duplicate Journey Code DF {check.file_id}/{check.check_id}")
+    result = get_vj_duplicate_journey_code_query(check)
+    for df in stream_vehicle_journey_chunks(check, result.statement, chunk_size):
+        yield build_vj_duplicate_journey_code_df(check, df)
+
+
+def build_vj_duplicate_journey_code_df(
+    check: Check, df: pd.DataFrame, whole_file: bool = False
+) -> pd.DataFrame:
+    """
+    Reduce the stop level rows to one row per vehicle journey and add the
+    operating profile, operating dates, non operating dates and serviced
+    organisations of those journeys, which are all of the file's when
+    whole_file is set
+    """
     df.fillna({"operating_on_working_days": np.nan}, inplace=True)
     vehicle_journey_df = (
         df.groupby(
@@ -265,14 +1153,17 @@ def get_vj_duplicate_journey_code(check: Check) -> pd.DataFrame:
         .reset_index()
     )
 
-    vehicle_journey_ids = list(vehicle_journey_df["vehicle_journey_id"])
-    operating_profile_df = get_operating_profile_df(check, vehicle_journey_ids)
-    oprating_date_exp_df = get_operating_date_exception_df(check, vehicle_journey_ids)
-    non_op_date_exp_df = get_non_operating_date_exception_df(check, vehicle_journey_ids)
-
-    serviced_org_df = get_service_ogranisation_vehicle_journey_df(
-        check, vehicle_journey_ids
+    # Every journey of the file is looked up with a join on the file rather
+    # than a list of ids, a chunk's journeys as an array of ids
+    vehicle_journey_ids = (
+        None if whole_file else list(vehicle_journey_df["vehicle_journey_id"])
     )
+    (
+        operating_profile_df,
+        oprating_date_exp_df,
+        non_op_date_exp_df,
+        serviced_org_df,
+    ) = get_vehicle_journey_lookups(check, vehicle_journey_ids)
 
     vehicle_journey_df = (
         vehicle_journey_df.merge(
@@ -301,47 +1192,104 @@ def get_vj_duplicate_journey_code(check: Check) -> pd.DataFrame:
     return vehicle_journey_df
 
 
-def get_operating_profile_df(check: Check, vehicle_journey_ids: List) -> pd.DataFrame:
+def _file_vehicle_journey_ids(check: Check):
+    """
+    Ids of the vehicle journeys with stops in the check's file
+    """
+    return (
+        select(ServicePatternStop.vehicle_journey_id)
+        .join(
+            ServicePatternService,
+            ServicePatternService.servicepattern_id
+            == ServicePatternStop.service_pattern_id,
+        )
+        .join(Service, Service.id == ServicePatternService.service_id)
+        .where(Service.txcfileattributes_id == check.file_id)
+    )
+
+
+def _vehicle_journey_filter(check: Check, column, vehicle_journey_ids: Optional[List]):
+    """
+    Restrict the column to the vehicle journeys, bound as a single array
+    parameter rather than a parameter per journey, or to the journeys of the
+    check's file with a semi-join when no ids are given
+    """
+    if vehicle_journey_ids is None:
+        return column.in_(_file_vehicle_journey_ids(check))
+    return column == any_(
+        bindparam(
+            "vehicle_journey_ids",
+            [int(vehicle_journey_id) for vehicle_journey_id in vehicle_journey_ids],
+            type_=ARRAY(Integer),
+        )
+    )
+
+
+def _read_lookup(check: Check, statement, connection=None) -> pd.DataFrame:
+    return pd.read_sql_query(
+        statement, connection or check.db.read_session.connection()
+    )
+
+
+def get_operating_profile_df(
+    check: Check, vehicle_journey_ids: Optional[List] = None, connection=None
+) -> pd.DataFrame:
     """Get dataframe with the list of operating profile days for
     the list of vehicle journeys
 
     Args:
         check (Check): check object
-        vehicle_journey_ids (List): list of vehicle journey ids
+        vehicle_journey_ids (List): list of vehicle journey ids, None for
+            every vehicle journey of the file
+        connection: connection to run the query on, the check's read
+            session by default
 
     Returns:
         pd.DataFrame: Dataframe with days_of_week list for vehicle journeys
     """
+    snapshot = get_snapshot(check)
+    if snapshot is not None:
+        return snapshot.operating_profile_df(vehicle_journey_ids)
+
     result_op = (
-        check.db.session.query(OperatingProfile)
-        .with_entities(
+        select(
             func.array_agg(func.distinct(OperatingProfile.day_of_week)).label(
                 "day_of_week"
             ),
             OperatingProfile.vehicle_journey_id.label("vehicle_journey_id"),
         )
-        .filter(OperatingProfile.vehicle_journey_id.in_(vehicle_journey_ids))
+        .where(
+            _vehicle_journey_filter(
+                check, OperatingProfile.vehicle_journey_id, vehicle_journey_ids
+            )
+        )
         .group_by(OperatingProfile.vehicle_journey_id)
     )
-    return pd.read_sql_query(result_op.statement, check.db.session.connection())
+    return _read_lookup(check, result_op, connection)
 
 
 def get_operating_date_exception_df(
-    check: Check, vehicle_journey_ids: List
+    check: Check, vehicle_journey_ids: Optional[List] = None, connection=None
 ) -> pd.DataFrame:
     """Get dataframe with the list of operating_date_exceptions for
     the list of vehicle journeys
 
     Args:
         check (Check): Check object
-        vehicle_journey_ids (List): list of vehicle journey ids
+        vehicle_journey_ids (List): list of vehicle journey ids, None for
+            every vehicle journey of the file
+        connection: connection to run the query on, the check's read
+            session by default
 
     Returns:
         pd.DataFrame: Dataframe with Operating_date_exceptions
     """
+    snapshot = get_snapshot(check)
+    if snapshot is not None:
+        return snapshot.operating_date_exception_df(vehicle_journey_ids)
+
     result_op_date_exp = (
-        check.db.session.query(OperatingDatesExceptions)
-        .with_entities(
+        select(
             func.array_agg(
                 func.distinct(
                     func.to_char(OperatingDatesExceptions.operating_date, "YYYY-MM-DD")
@@ -349,30 +1297,39 @@ def get_operating_date_exception_df(
             ).label("operating_date"),
             OperatingDatesExceptions.vehicle_journey_id.label("vehicle_journey_id"),
         )
-        .filter(OperatingDatesExceptions.vehicle_journey_id.in_(vehicle_journey_ids))
+        .where(
+            _vehicle_journey_filter(
+                check, OperatingDatesExceptions.vehicle_journey_id, vehicle_journey_ids
+            )
+        )
         .group_by(OperatingDatesExceptions.vehicle_journey_id)
     )
 
-    return pd.read_sql_query(result_op_date_exp.statement, check.db.session.connection())
+    return _read_lookup(check, result_op_date_exp, connection)
 
 
 def get_non_operating_date_exception_df(
-    check: Check, vehicle_journey_ids: List
+    check: Check, vehicle_journey_ids: Optional[List] = None, connection=None
 ) -> pd.DataFrame:
     """Get dataframe with the list of non_operating_date_exceptions for
     the list of vehicle journeys
 
     Args:
         check (Check): Check object
-        vehicle_journey_ids (List): list of vehicle journies
+        vehicle_journey_ids (List): list of vehicle journies, None for every
+            vehicle journey of the file
+        connection: connection to run the query on, the check's read
+            session by default
 
     Returns:
         pd.DataFrame: dataframe with non_operating_date_exceptions
     """
+    snapshot = get_snapshot(check)
+    if snapshot is not None:
+        return snapshot.non_operating_date_exception_df(vehicle_journey_ids)
 
     result_non_op_date_exp = (
-        check.db.session.query(NonOperatingdatesexceptions)
-        .with_entities(
+        select(
             func.array_agg(
                 func.distinct(
                     func.to_char(
@@ -382,30 +1339,41 @@ def get_non_operating_date_exception_df(
             ).label("non_operating_date"),
             NonOperatingdatesexceptions.vehicle_journey_id.label("vehicle_journey_id"),
         )
-        .filter(NonOperatingdatesexceptions.vehicle_journey_id.in_(vehicle_journey_ids))
+        .where(
+            _vehicle_journey_filter(
+                check,
+                NonOperatingdatesexceptions.vehicle_journey_id,
+                vehicle_journey_ids,
+            )
+        )
         .group_by(NonOperatingdatesexceptions.vehicle_journey_id)
     )
 
-    return pd.read_sql_query(result_non_op_date_exp.statement, check.db.session.connection())
+    return _read_lookup(check, result_non_op_date_exp, connection)
 
 
 def get_service_ogranisation_vehicle_journey_df(
-    check: Check, vehicle_journey_ids: List
+    check: Check, vehicle_journey_ids: Optional[List] = None, connection=None
 ) -> pd.DataFrame:
     """Get dataframe for serviced organisations belonging to
     Vehicle journeys
 
     Args:
         check (Check):
-        vehicle_journey_ids (List): List of vehicle journeys list
+        vehicle_journey_ids (List): List of vehicle journeys list, None for
+            every vehicle journey of the file
+        connection: connection to run the query on, the check's read
+            session by default
 
     Returns:
         pd.DataFrame: Dataframe with serviced organisations
     """
+    snapshot = get_snapshot(check)
+    if snapshot is not None:
+        return snapshot.serviced_organisation_vehicle_journey_df(vehicle_journey_ids)
 
     result_serviced_organisation = (
-        check.db.session.query(ServicedOrganisationVJ)
-        .with_entities(
+        select(
             func.array_agg(
                 func.distinct(
                     func.cast(
@@ -416,23 +1384,61 @@ def get_service_ogranisation_vehicle_journey_df(
             ).label("serviced_organisation_id"),
             ServicedOrganisationVJ.vehicle_journey_id.label("vehicle_journey_id"),
         )
-        .filter(ServicedOrganisationVJ.vehicle_journey_id.in_(vehicle_journey_ids))
+        .where(
+            _vehicle_journey_filter(
+                check, ServicedOrganisationVJ.vehicle_journey_id, vehicle_journey_ids
+            )
+        )
         .group_by(ServicedOrganisationVJ.vehicle_journey_id)
     )
 
-    return pd.read_sql_query(
-        result_serviced_organisation.statement, check.db.session.connection()
-    )
+    return _read_lookup(check, result_serviced_organisation, connection)
 
 
-def get_df_serviced_organisation(check: Check) -> pd.DataFrame:
-    """
-    Get the dataframe containing the serviced organisation
+VEHICLE_JOURNEY_LOOKUPS = [
+    get_operating_profile_df,
+    get_operating_date_exception_df,
+    get_non_operating_date_exception_df,
+    get_service_ogranisation_vehicle_journey_df,
+]
+
 
+def get_vehicle_journey_lookups(
+    check: Check, vehicle_journey_ids: Optional[List] = None
+) -> List[pd.DataFrame]:
     """
+    Get the operating profile, operating dates, non operating dates and
+    serviced organisations of the vehicle journeys. Unless
+    DATAFRAME_CONCURRENT_LOOKUPS is false the queries run at the same time,
+    each on its own pooled connection
+    """
+    if (
+        get_snapshot(check) is not None
+        or environ.get("DATAFRAME_CONCURRENT_LOOKUPS", "true").lower() == "false"
+    ):
+        return [
+            lookup(check, vehicle_journey_ids) for lookup in VEHICLE_JOURNEY_LOOKUPS
+        ]
 
-    result = (
-        check.db.session.query(Service)
+    engine = check.db.read_session.get_bind()
+
+    def run_lookup(lookup):
+        with engine.connect() as connection:
+            return lookup(check, vehicle_journey_ids, connection)
+
+    with ThreadPoolExecutor(
+        max_workers=len(VEHICLE_JOURNEY_LOOKUPS), thread_name_prefix="lookup"
+    ) as executor:
+        return list(executor.map(run_lookup, VEHICLE_JOURNEY_LOOKUPS))
+
+
+def get_serviced_organisation_query(check: Check):
+    """
+    Query for the serviced organisations and their working days of the
+    vehicle journeys in the file
+    """
+    return (
+        check.db.read_session.query(Service)
         .join(ServicePatternService, Service.id == ServicePatternService.service_id)
         .join(
             VehicleJourney,
@@ -473,7 +1479,33 @@ def get_df_serviced_organisation(check: Check) -> pd.DataFrame:
         )
     )
 
-    return pd.read_sql_query(result.statement, check.db.session.connection())
+
+def get_df_serviced_organisation(check: Check) -> pd.DataFrame:
+    """
+    Get the dataframe containing the serviced organisation
+
+    """
+
+    snapshot = get_snapshot(check)
+    if snapshot is not None:
+        return snapshot.serviced_organisation_df()
+
+    result = get_serviced_organisation_query(check)
+    return pd.read_sql_query(result.statement, check.db.read_session.connection())
+
+
+def get_df_serviced_organisation_chunks(check: Check) -> Iterator[pd.DataFrame]:
+    """
+    Yield the serviced organisation dataframe in chunks of complete vehicle
+    journeys when streaming is enabled, otherwise as a single chunk
+    """
+    chunk_size = get_stream_chunk_size()
+    if not chunk_size or get_snapshot(check) is not None:
+        yield get_df_serviced_organisation(check)
+        return
+
+    result = get_serviced_organisation_query(check).order_by(VehicleJourney.id)
+    yield from stream_vehicle_journey_chunks(check, result.statement, chunk_size)
 
 
 def get_naptan_availablilty(check: Check, atco_codes: set[String]) -> pd.DataFrame:
@@ -483,10 +1515,22 @@ def get_naptan_availablilty(check: Check, atco_codes: set[String]) -> pd.DataFra
     otherwise False
     """
 
-    result = check.db.session.query(NaptanStopPoint).where(
-        func.lower(NaptanStopPoint.atco_code).in_(atco_codes)
+    snapshot = get_snapshot(check)
+    if snapshot is not None and atco_codes <= snapshot.atco_codes:
+        return snapshot.naptan_availability_df(atco_codes)
+
+    naptan = get_naptan_reference(check)
+    if naptan is not None:
+        df = naptan.stops_by_atco_code(atco_codes)
+        df["atco_code_exists"] = df["atco_code"].isin(atco_codes)
+        return df
+
+    result = check.db.read_session.query(NaptanStopPoint).where(
+        func.lower(NaptanStopPoint.atco_code).in_(
+            sorted({code.lower() for code in atco_codes})
+        )
     )
 
-    df = pd.read_sql_query(result.statement, check.db.session.connection())
+    df = pd.read_sql_query(result.statement, check.db.read_session.connection())
     df["atco_code_exists"] = df["atco_code"].apply(lambda cell: cell in atco_codes)
     return df
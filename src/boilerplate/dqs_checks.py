@@ -1,8 +1,104 @@
 from dqs_logger import logger
 from bods_db import BodsDB
-from typing import List
+from os import environ
+from threading import Lock
+from time import monotonic
+from typing import Dict, List, Optional
+from pydantic import BaseModel
 from models import DqsChecks as DQChecksModel
 
+# How long the check registry is trusted before it is reloaded from the DB
+CHECK_REGISTRY_TTL = int(environ.get("CHECK_REGISTRY_TTL", 300))
+
+
+def normalise_observation(observation: str) -> str:
+    """
+    Name a check is known by in Lambda modules and events, e.g.
+    "Missing journey code" becomes "missing_journey_code"
+    """
+    return observation.lower().replace(" ", "_")
+
+
+class CheckDetails(BaseModel):
+    """
+    Pydantic model for a row of the dqs_checks table
+
+    Attributes:
+    id: int
+    name: str
+    observation: str
+    importance: str
+    category: str
+    queue_name: str
+    """
+
+    id: int
+    name: str
+    observation: str
+    importance: str
+    category: str
+    queue_name: Optional[str] = None
+
+
+class CheckRegistry:
+    """
+    In-memory registry of the data quality checks keyed by normalised
+    observation name. It is loaded on first use and shared by everything in
+    the container, then reloaded once it is older than the TTL
+
+    Methods:
+    get_checks: All checks keyed by normalised observation name
+    get_check_id: Id of the check with the given name, 0 if there is none
+    get_all_check_ids: Ids of all checks
+    clear: Forget the loaded checks so the next lookup reloads them
+    """
+
+    def __init__(self, ttl: int = CHECK_REGISTRY_TTL):
+        self._ttl = ttl
+        self._lock = Lock()
+        self._checks = None
+        self._loaded_at = 0.0
+
+    def get_checks(self, session) -> Dict[str, CheckDetails]:
+        with self._lock:
+            if self._checks is None or monotonic() - self._loaded_at >= self._ttl:
+                self._checks = self._load(session)
+                self._loaded_at = monotonic()
+            return self._checks
+
+    def get_check_id(self, session, name: str) -> int:
+        check = self.get_checks(session).get(name)
+        return check.id if check else 0
+
+    def get_all_check_ids(self, session) -> List[int]:
+        return [check.id for check in self.get_checks(session).values()]
+
+    def clear(self):
+        with self._lock:
+            self._checks = None
+
+    def _load(self, session) -> Dict[str, CheckDetails]:
+        logger.debug("Loading check registry")
+        try:
+            rows = session.query(DQChecksModel).order_by(DQChecksModel.id).all()
+        except Exception as e:
+            logger.error(f"Failed to load check registry: {e}")
+            raise
+        return {
+            normalise_observation(row.observation): CheckDetails(
+                id=row.id,
+                name=normalise_observation(row.observation),
+                observation=row.observation,
+                importance=row.importance,
+                category=row.category,
+                queue_name=row.queue_name,
+            )
+            for row in rows
+        }
+
+
+check_registry = CheckRegistry()
+
 
 class DQChecks:
     def __init__(self):
@@ -11,10 +107,7 @@ class DQChecks:
 
     def get_all_check_ids(self) -> List[int]:
         try:
-            return [
-                check_id
-                for check_id, in self._db.session.query(self._table_name.id).all()
-            ]
+            return check_registry.get_all_check_ids(self._db.session)
         except Exception as e:
             logger.error(f"Failed to retrieve check ids: {e}")
             raise
@@ -0,0 +1,235 @@
+import json
+from os import makedirs, replace
+from os.path import dirname, exists, join
+from shutil import rmtree
+from tempfile import mkdtemp
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from dataframes import VEHICLE_JOURNEY_CATEGORIES
+from stop_sequences import StopSequences
+
+# Columns of the vehicle journey frame that are properties of the journey
+# rather than its stops, held once per journey when every stop agrees
+JOURNEY_COLUMNS = [
+    "vehicle_journey_id",
+    "start_time",
+    "direction",
+    "vehicle_journey_code",
+]
+
+_METADATA = "journey_arrays.json"
+
+
+def _intern(values: pd.Series) -> tuple:
+    """
+    Codes of the values in a vocabulary of their distinct values, -1 for
+    missing ones. Categoricals keep their categories as the vocabulary
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, vocabulary = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, vocabulary = pd.factorize(values)
+    return codes.astype(np.int32), np.asarray(vocabulary, dtype=str)
+
+
+def _is_nullable(dtype) -> bool:
+    """
+    Whether the dtype is a nullable integer, float or boolean, which holds
+    its values in a NumPy array beside a missing mask
+    """
+    return pd.api.types.is_extension_array_dtype(dtype) and hasattr(
+        dtype, "numpy_dtype"
+    )
+
+
+def _same_for_each_journey(values: np.ndarray, offsets: np.ndarray) -> bool:
+    first = np.repeat(values[offsets[:-1]], np.diff(offsets))
+    return bool((first == values).all())
+
+
+class JourneyArrays:
+    """
+    Stops of a vehicle journey frame as contiguous NumPy arrays in journey
+    and sequence order, compressed sparse row style: journey_offsets holds
+    the position of each journey's first stop, so a journey's stops are a
+    slice of each array. Strings are interned as int32 codes into a
+    vocabulary per column, nullable columns keep their values and a missing
+    mask, and journey properties are held once per journey. The arrays are
+    written as .npy files that are memory mapped when loaded, so processes
+    share one copy
+
+    Methods:
+    from_frame: Arrays of a vehicle journey frame
+    journey: Stop arrays of one journey, as views of the arrays
+    codes: Codes of values in an interned column's vocabulary
+    to_frame: Stops at positions as a vehicle journey frame
+    save: Write the arrays to a directory
+    load: Arrays written to a directory, memory mapped
+    """
+
+    def __init__(
+        self,
+        journey_offsets: np.ndarray,
+        journeys: Dict[str, np.ndarray],
+        stops: Dict[str, np.ndarray],
+        missing: Dict[str, np.ndarray],
+        vocabularies: Dict[str, np.ndarray],
+        dtypes: Dict[str, str],
+        columns: list,
+    ):
+        self.journey_offsets = journey_offsets
+        self.journeys = journeys
+        self.stops = stops
+        self.missing = missing
+        self.vocabularies = vocabularies
+        self.dtypes = dtypes
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.journey_offsets) - 1
+
+    @property
+    def stop_count(self) -> int:
+        return int(self.journey_offsets[-1])
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            sum(
+                array.nbytes
+                for arrays in (
+                    self.journeys,
+                    self.stops,
+                    self.missing,
+                    self.vocabularies,
+                )
+                for array in arrays.values()
+            )
+            + self.journey_offsets.nbytes
+        )
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "JourneyArrays":
+        sequences = StopSequences(df)
+        offsets = sequences.offsets.astype(np.int64)
+        journeys, stops, missing, vocabularies, dtypes = {}, {}, {}, {}, {}
+        for column in df.columns:
+            values = df[column]
+            dtypes[column] = str(values.dtype)
+            if (
+                column in VEHICLE_JOURNEY_CATEGORIES
+                or values.dtype == object
+                or isinstance(values.dtype, pd.CategoricalDtype)
+            ):
+                array, vocabularies[column] = _intern(values)
+            elif _is_nullable(values.dtype):
+                array = values.to_numpy(dtype=values.dtype.numpy_dtype, na_value=0)
+                missing[column] = values.isna().to_numpy()[sequences.order]
+            else:
+                array = values.to_numpy()
+            array = array[sequences.order]
+            if column in JOURNEY_COLUMNS and _same_for_each_journey(array, offsets):
+                journeys[column] = array[offsets[:-1]]
+                if column in missing:
+                    missing[column] = missing[column][offsets[:-1]]
+            else:
+                stops[column] = array
+        return cls(
+            offsets, journeys, stops, missing, vocabularies, dtypes, list(df.columns)
+        )
+
+    def journey(self, journey: int) -> Dict[str, np.ndarray]:
+        """
+        Views of the stop arrays over the journey's stops, which copy nothing
+        """
+        start, end = self.journey_offsets[journey], self.journey_offsets[journey + 1]
+        return {column: array[start:end] for column, array in self.stops.items()}
+
+    def codes(self, column: str, values: Iterable) -> np.ndarray:
+        """
+        Code of each value in the column's vocabulary, -1 for values not in it
+        """
+        vocabulary = pd.Index(self.vocabularies[column])
+        return vocabulary.get_indexer(list(values)).astype(np.int32)
+
+    def journey_of_stops(self) -> np.ndarray:
+        return np.repeat(np.arange(len(self)), np.diff(self.journey_offsets))
+
+    def to_frame(self, positions: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """
+        Stops at the positions, every stop by default, with the columns and
+        dtypes of the frame they were made from, strings as categoricals
+        """
+        if positions is None:
+            positions = np.arange(self.stop_count)
+        positions = np.asarray(positions, dtype=np.int64)
+        journeys = np.searchsorted(self.journey_offsets, positions, side="right") - 1
+        data = {}
+        for column in self.columns:
+            rows = journeys if column in self.journeys else positions
+            array = (self.journeys if column in self.journeys else self.stops)[column]
+            values = np.asarray(array[rows])
+            if column in self.vocabularies:
+                data[column] = pd.Categorical.from_codes(
+                    values, categories=self.vocabularies[column].astype(object)
+                )
+            elif column in self.missing:
+                dtype = pd.api.types.pandas_dtype(self.dtypes[column])
+                data[column] = dtype.construct_array_type()(
+                    values, np.asarray(self.missing[column][rows])
+                )
+            else:
+                data[column] = values
+        return pd.DataFrame(data)
+
+    def save(self, directory: str):
+        """
+        Write each array to an .npy file in the directory, which replaces
+        the directory once every file is written
+        """
+        parent = dirname(directory.rstrip("/")) or "."
+        makedirs(parent, exist_ok=True)
+        staging = mkdtemp(dir=parent)
+        metadata = {
+            "columns": self.columns,
+            "dtypes": self.dtypes,
+            "journeys": list(self.journeys),
+            "stops": list(self.stops),
+            "missing": list(self.missing),
+            "vocabularies": list(self.vocabularies),
+        }
+        np.save(join(staging, "journey_offsets.npy"), self.journey_offsets)
+        for kind in ("journeys", "stops", "missing", "vocabularies"):
+            for column, array in getattr(self, kind).items():
+                np.save(join(staging, f"{kind}.{column}.npy"), np.asarray(array))
+        with open(join(staging, _METADATA), "w") as f:
+            json.dump(metadata, f)
+        if exists(directory):
+            rmtree(directory)
+        replace(staging, directory)
+
+    @classmethod
+    def load(cls, directory: str, mmap_mode: Optional[str] = "r") -> "JourneyArrays":
+        with open(join(directory, _METADATA)) as f:
+            metadata = json.load(f)
+
+        def arrays(kind: str) -> Dict[str, np.ndarray]:
+            return {
+                column: np.load(
+                    join(directory, f"{kind}.{column}.npy"), mmap_mode=mmap_mode
+                )
+                for column in metadata[kind]
+            }
+
+        return cls(
+            np.load(join(directory, "journey_offsets.npy"), mmap_mode=mmap_mode),
+            arrays("journeys"),
+            arrays("stops"),
+            arrays("missing"),
+            arrays("vocabularies"),
+            metadata["dtypes"],
+            metadata["columns"],
+        )
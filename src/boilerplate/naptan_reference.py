@@ -0,0 +1,428 @@
+from math import ceil, log
+from os import environ, listdir, makedirs, remove, replace
+from os.path import getmtime, join
+from random import uniform
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from time import monotonic, time
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func
+
+from common import Check
+from data_persistence import (
+    PersistedData,
+    deserialise,
+    get_persistence_format,
+    serialise,
+)
+from dqs_logger import logger
+from models import NaptanStoppoint as NaptanStopPoint
+
+# Seconds between checks that the loaded reference is still the published
+# NaPTAN version, and the longest a reference is kept in memory or /tmp
+# before it is loaded again, give or take a jitter so containers don't all
+# reload it at once
+NAPTAN_REFERENCE_CHECK_INTERVAL = int(
+    environ.get("NAPTAN_REFERENCE_CHECK_INTERVAL", 300)
+)
+NAPTAN_REFERENCE_MAX_AGE = int(environ.get("NAPTAN_REFERENCE_MAX_AGE", 6 * 60 * 60))
+NAPTAN_REFERENCE_DIR = environ.get("NAPTAN_REFERENCE_DIR", "/tmp/dqs-naptan")
+NAPTAN_BLOOM_FALSE_POSITIVE_RATE = float(
+    environ.get("NAPTAN_BLOOM_FALSE_POSITIVE_RATE", 0.01)
+)
+
+NAPTAN_REFERENCE_KEY = "naptan_reference"
+# Key the scheduled publisher saves the current version under
+NAPTAN_REFERENCE_VERSION_KEY = f"{NAPTAN_REFERENCE_KEY}-version"
+NAPTAN_REFERENCE_COLUMNS = ["id", "atco_code", "common_name", "stop_type"]
+
+# Fraction of NAPTAN_REFERENCE_MAX_AGE a process's max age is jittered by
+_MAX_AGE_JITTER = 0.25
+_VERSION_FILE = "version"
+
+# Key of the hash the Bloom filter's bit positions are made from
+_BLOOM_HASH_KEY = "dqs-naptan-bloom"
+
+
+def naptan_reference_enabled() -> bool:
+    return environ.get("NAPTAN_REFERENCE", "false").lower() == "true"
+
+
+def _lower_codes(atco_codes: Iterable) -> np.ndarray:
+    if not isinstance(atco_codes, pd.Series):
+        atco_codes = pd.Series(list(atco_codes), dtype=object)
+    return atco_codes.str.lower().to_numpy(dtype=object)
+
+
+class BloomFilter:
+    """
+    Set membership that can answer "definitely not a member" without a
+    lookup, and "possibly a member" for members and a false positive rate of
+    the rest
+
+    Methods:
+    build: Filter of the keys with the given false positive rate
+    might_contain: Whether each key is possibly a member
+    """
+
+    def __init__(self, bits: np.ndarray, size: int, hash_count: int):
+        self.bits = bits
+        self.size = size
+        self.hash_count = hash_count
+
+    @classmethod
+    def build(cls, keys: np.ndarray, false_positive_rate: float) -> "BloomFilter":
+        count = max(len(keys), 1)
+        size = max(ceil(-count * log(false_positive_rate) / log(2) ** 2), 8)
+        hash_count = max(round(size / count * log(2)), 1)
+        bloom = cls(np.zeros(ceil(size / 8), dtype=np.uint8), size, hash_count)
+        flags = np.zeros(size, dtype=bool)
+        flags[bloom._positions(keys).ravel()] = True
+        bloom.bits = np.packbits(flags)
+        return bloom
+
+    def _positions(self, keys: np.ndarray) -> np.ndarray:
+        """
+        Bit positions of each key, by double hashing with the two halves of
+        one 64 bit hash
+        """
+        hashes = pd.util.hash_array(
+            np.asarray(keys, dtype=object), hash_key=_BLOOM_HASH_KEY
+        )
+        first, second = hashes >> np.uint64(32), hashes & np.uint64(0xFFFFFFFF)
+        rounds = np.arange(self.hash_count, dtype=np.uint64)
+        return (first[:, None] + rounds * second[:, None]) % np.uint64(self.size)
+
+    def might_contain(self, keys: np.ndarray) -> np.ndarray:
+        if not len(keys):
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(keys)
+        set_bits = (self.bits[positions >> np.uint64(3)] >> (7 - positions % 8)) & 1
+        return set_bits.astype(bool).all(axis=1)
+
+
+class NaptanReference:
+    """
+    ATCO code, stop type and common name of every NaPTAN stop point, held as
+    arrays sorted by lower case ATCO code and by id so a file's stops are
+    looked up in memory rather than with an IN list against
+    naptan_stoppoint. A Bloom filter of the codes answers most lookups of
+    codes that aren't in NaPTAN without a search
+
+    Methods:
+    contains: Whether each ATCO code is in NaPTAN, ignoring case
+    stops_by_atco_code: Stops with any of the ATCO codes, ignoring case
+    stops_by_id: Stops with any of the ids
+    with_common_names: Replace common names with NaPTAN's where the stop has one
+    """
+
+    def __init__(self, stops: pd.DataFrame, version: str):
+        self.version = version
+        # Persisted with the lower case codes and in their order, so a
+        # loaded reference is neither converted nor sorted again
+        if "atco_code_lower" not in stops:
+            stops = stops.assign(atco_code_lower=_lower_codes(stops["atco_code"]))
+        if not stops["atco_code_lower"].is_monotonic_increasing:
+            stops = stops.sort_values("atco_code_lower", ignore_index=True)
+        self.stops = stops.astype({"stop_type": "category"})
+        self._codes = stops["atco_code_lower"].to_numpy(dtype=object)
+        self._ids = self.stops["id"].to_numpy()
+        self._id_order = np.argsort(self._ids, kind="stable")
+        self._bloom = BloomFilter.build(self._codes, NAPTAN_BLOOM_FALSE_POSITIVE_RATE)
+
+    def __len__(self):
+        return len(self.stops)
+
+    def _positions_of_codes(self, atco_codes: Iterable) -> np.ndarray:
+        """
+        Row of each ATCO code, -1 for codes that aren't in NaPTAN
+        """
+        codes = _lower_codes(atco_codes)
+        rows = np.full(len(codes), -1)
+        maybe = self._bloom.might_contain(codes)
+        if maybe.any() and len(self._codes):
+            candidates = codes[maybe]
+            found = np.searchsorted(self._codes, candidates).clip(max=len(self) - 1)
+            rows[maybe] = np.where(self._codes[found] == candidates, found, -1)
+        return rows
+
+    def contains(self, atco_codes: Iterable) -> np.ndarray:
+        return self._positions_of_codes(atco_codes) >= 0
+
+    def stops_by_atco_code(self, atco_codes: Iterable) -> pd.DataFrame:
+        rows = self._positions_of_codes(atco_codes)
+        return self.stops.take(np.unique(rows[rows >= 0])).reset_index(drop=True)
+
+    def stops_by_id(self, ids: Iterable) -> pd.DataFrame:
+        ids = pd.Series(list(ids), dtype="float64").dropna().astype("int64").unique()
+        if not len(ids) or not len(self):
+            return self.stops.iloc[:0]
+        sorted_ids = self._ids[self._id_order]
+        found = np.searchsorted(sorted_ids, ids).clip(max=len(self) - 1)
+        rows = self._id_order[found[sorted_ids[found] == ids]]
+        return self.stops.take(np.unique(rows)).reset_index(drop=True)
+
+    def with_common_names(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        The dataframe's common_name, which is the TXC common name, replaced by
+        the NaPTAN common name of its naptan_stop_id where there is one, as
+        the SQL coalesce would
+        """
+        stops = self.stops_by_id(df["naptan_stop_id"])
+        names = pd.Series(
+            stops["common_name"].to_numpy(), index=stops["id"].astype("float64")
+        )
+        naptan_names = df["naptan_stop_id"].astype("float64").map(names)
+        df["common_name"] = naptan_names.where(naptan_names.notna(), df["common_name"])
+        return df
+
+
+def get_naptan_version(session) -> str:
+    """
+    Version of the NaPTAN table's reference columns: its row count, largest
+    id and a checksum of every stop's id, ATCO code, common name and stop
+    type, so any edit to what the reference holds gives a new version. It
+    scans the whole table, so it is computed by publish_naptan_reference on
+    a schedule rather than by each container
+    """
+    checksum = func.sum(
+        func.hashtext(
+            func.concat_ws(
+                "|",
+                *(
+                    getattr(NaptanStopPoint, column)
+                    for column in NAPTAN_REFERENCE_COLUMNS
+                ),
+            )
+        )
+    )
+    count, max_id, total = session.query(
+        func.count(NaptanStopPoint.id), func.max(NaptanStopPoint.id), checksum
+    ).one()
+    return f"{count}-{max_id}-{int(total or 0) % 2**32:08x}"
+
+
+def _build_naptan_reference(session) -> pd.DataFrame:
+    logger.info("Building NaPTAN reference")
+    try:
+        statement = session.query(
+            *(getattr(NaptanStopPoint, column) for column in NAPTAN_REFERENCE_COLUMNS)
+        ).statement
+        return pd.read_sql_query(statement, session.connection())
+    except Exception as e:
+        logger.error(f"Failed to build NaPTAN reference: {e}")
+        raise
+
+
+def publish_naptan_reference(session) -> str:
+    """
+    Build the reference of NaPTAN's current version, save it to the
+    persistence backend and then publish the version for the containers'
+    loaders to read
+    """
+    backend = PersistedData().backend
+    if backend is None:
+        logger.error("No persistence backend to publish the NaPTAN reference to")
+        raise ValueError("No persistence backend to publish the NaPTAN reference to")
+    version = get_naptan_version(session)
+    stops = _build_naptan_reference(session)
+    backend.save_value(
+        f"{NAPTAN_REFERENCE_KEY}-{version}",
+        serialise(stops, get_persistence_format()),
+    )
+    backend.save_value(NAPTAN_REFERENCE_VERSION_KEY, version.encode())
+    logger.info(f"Published NaPTAN reference {version} of {len(stops)} stops")
+    return version
+
+
+class NaptanReferenceLoader:
+    """
+    The container's NaPTAN reference, loaded on first use from /tmp, which
+    outlives the worker processes the checks run in, then from the
+    persistence backend and only then built from the database. Its version
+    is the one publish_naptan_reference last saved to the backend, read at
+    most every NAPTAN_REFERENCE_CHECK_INTERVAL seconds by the processes of
+    the container, which share it through /tmp, and a new version loaded
+    the same way. Without a backend the version is queried from NaPTAN.
+    Each process keeps a reference for its own jittered max age
+
+    Methods:
+    version: Current NaPTAN version, without loading the reference
+    get: Reference of the current NaPTAN version
+    clear: Forget the loaded reference so the next get checks the version
+    """
+
+    def __init__(
+        self,
+        check_interval: int = NAPTAN_REFERENCE_CHECK_INTERVAL,
+        directory: str = NAPTAN_REFERENCE_DIR,
+        max_age: int = NAPTAN_REFERENCE_MAX_AGE,
+    ):
+        self._check_interval = check_interval
+        self._directory = directory
+        self._max_age = max_age * uniform(1 - _MAX_AGE_JITTER, 1 + _MAX_AGE_JITTER)
+        self._lock = Lock()
+        self._reference = None
+        self._loaded_at = 0.0
+        self._version = None
+        self._checked_at = 0.0
+
+    def version(self, session) -> str:
+        with self._lock:
+            return self._current_version(session)
+
+    def get(self, session) -> NaptanReference:
+        with self._lock:
+            version = self._current_version(session)
+            if (
+                self._reference is None
+                or self._reference.version != version
+                or monotonic() - self._loaded_at >= self._max_age
+            ):
+                self._reference = self._load(session, version)
+                self._loaded_at = monotonic()
+            return self._reference
+
+    def clear(self):
+        with self._lock:
+            self._reference = None
+            self._version = None
+
+    def _current_version(self, session) -> str:
+        if (
+            self._version is None
+            or monotonic() - self._checked_at >= self._check_interval
+        ):
+            version = self._read_version()
+            if version is None:
+                version = self._published_version(session)
+                self._write_version(version)
+            self._version = version
+            self._checked_at = monotonic()
+        return self._version
+
+    def _published_version(self, session) -> str:
+        backend = PersistedData().backend
+        if backend is None:
+            return get_naptan_version(session)
+        value = backend.find_value(NAPTAN_REFERENCE_VERSION_KEY)
+        if value is not None:
+            return value.decode()
+        if self._version is not None:
+            logger.warning(
+                f"No NaPTAN reference version is published, keeping {self._version}"
+            )
+            return self._version
+        logger.warning("No NaPTAN reference version is published, querying NaPTAN")
+        return get_naptan_version(session)
+
+    def _read_version(self) -> Optional[str]:
+        """
+        Version another process of the container queried within the check
+        interval
+        """
+        path = join(self._directory, _VERSION_FILE)
+        try:
+            if time() - getmtime(path) >= self._check_interval:
+                return None
+            with open(path) as f:
+                return f.read() or None
+        except OSError:
+            return None
+
+    def _write_version(self, version: str):
+        try:
+            makedirs(self._directory, exist_ok=True)
+            with NamedTemporaryFile(
+                "w", dir=self._directory, delete=False, prefix=_VERSION_FILE
+            ) as f:
+                f.write(version)
+            replace(f.name, join(self._directory, _VERSION_FILE))
+        except OSError as e:
+            logger.warning(f"Failed to write NaPTAN version {version}: {e}")
+
+    def _path(self, version: str) -> str:
+        return join(self._directory, f"{NAPTAN_REFERENCE_KEY}-{version}")
+
+    def _load(self, session, version: str) -> NaptanReference:
+        start = monotonic()
+        key = f"{NAPTAN_REFERENCE_KEY}-{version}"
+        value = self._read_file(version)
+        source = "/tmp"
+        if value is None:
+            backend = PersistedData().backend
+            value = backend.find_value(key) if backend else None
+            source = "the persistence backend"
+            if value is None:
+                # Only the publisher saves to the backend, the checks can't
+                reference = NaptanReference(self._build(session), version)
+                value = serialise(reference.stops, get_persistence_format())
+                source = "the database"
+            self._write_file(version, value)
+        if source != "the database":
+            reference = NaptanReference(deserialise(value), version)
+        logger.info(
+            f"Loaded NaPTAN reference {version} of {len(reference)} stops from "
+            f"{source} in {(monotonic() - start) * 1000:.0f}ms"
+        )
+        return reference
+
+    def _build(self, session) -> pd.DataFrame:
+        return _build_naptan_reference(session)
+
+    def _read_file(self, version: str) -> Optional[bytes]:
+        """
+        The reference written to /tmp, unless it is older than the max age
+        """
+        try:
+            if time() - getmtime(self._path(version)) >= self._max_age:
+                return None
+            with open(self._path(version), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_file(self, version: str, value: bytes):
+        """
+        Write the reference for the other processes of the container,
+        removing those of older versions
+        """
+        try:
+            makedirs(self._directory, exist_ok=True)
+            with NamedTemporaryFile(dir=self._directory, delete=False) as f:
+                f.write(value)
+            replace(f.name, self._path(version))
+            for name in listdir(self._directory):
+                path = join(self._directory, name)
+                if name.startswith(NAPTAN_REFERENCE_KEY) and path != self._path(
+                    version
+                ):
+                    remove(path)
+        except OSError as e:
+            logger.warning(f"Failed to write NaPTAN reference {version}: {e}")
+
+
+naptan_references = NaptanReferenceLoader()
+
+
+def get_naptan_reference(check: Check) -> Optional[NaptanReference]:
+    """
+    The NaPTAN reference when NAPTAN_REFERENCE is enabled, otherwise None
+    and NaPTAN is queried
+    """
+    if not naptan_reference_enabled():
+        return None
+    return naptan_references.get(check.db.read_session)
+
+
+def get_naptan_reference_version(check: Check) -> Optional[str]:
+    """
+    Version of the NaPTAN reference when NAPTAN_REFERENCE is enabled,
+    without loading the reference, otherwise None
+    """
+    if not naptan_reference_enabled():
+        return None
+    return naptan_references.version(check.db.read_session)
@@ -1,14 +1,107 @@
+from enum import Enum
+from io import StringIO
+from os import environ
+from time import perf_counter
+
+import pandas as pd
+from psycopg2.extras import execute_values
+from sqlalchemy import insert
+
 from common import Check
 from dqs_logger import logger
 from models import DqsObservationresults
+from query_metrics import record_cursor_query
+
+# Observations are buffered as plain tuples of these columns and written in
+# batches of at most OBSERVATION_BATCH_SIZE rows, so memory stays flat however
+# many observations a check finds
+OBSERVATION_COLUMNS = (
+    "details",
+    "taskresults_id",
+    "vehicle_journey_id",
+    "service_pattern_stop_id",
+    "serviced_organisation_vehicle_journey_id",
+)
+OBSERVATION_BATCH_SIZE = int(environ.get("OBSERVATION_BATCH_SIZE", 10000))
+OBSERVATION_VALUES_PAGE_SIZE = 1000
+
+
+class WriteBackend(str, Enum):
+
+    COPY = "COPY"
+    VALUES = "VALUES"
+
+
+def get_write_backend() -> WriteBackend:
+    """
+    Backend used to write observations, selected with
+    OBSERVATION_WRITE_BACKEND (COPY by default)
+    """
+    return WriteBackend(environ.get("OBSERVATION_WRITE_BACKEND", WriteBackend.COPY))
+
+
+def _optional_id(value):
+    if value is None or pd.isna(value):
+        return None
+    return int(value)
+
+
+def _copy_text(value) -> str:
+    """
+    Value as a field of COPY's text format, with \\N for NULL
+    """
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def copy_observations(cursor, rows: list):
+    """
+    Write the rows with one COPY dqs_observationresults (...) FROM STDIN,
+    timed here as the engine's events don't see it
+    """
+    buffer = StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_text(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    statement = (
+        f"COPY {DqsObservationresults.__tablename__} "
+        f"({', '.join(OBSERVATION_COLUMNS)}) FROM STDIN"
+    )
+    start = perf_counter()
+    cursor.copy_expert(statement, buffer)
+    record_cursor_query(statement, (perf_counter() - start) * 1000, len(rows))
+
+
+def insert_observation_values(cursor, rows: list):
+    """
+    Write the rows with multi-row INSERT ... VALUES statements, timed here
+    as the engine's events don't see them
+    """
+    statement = (
+        f"INSERT INTO {DqsObservationresults.__tablename__} "
+        f"({', '.join(OBSERVATION_COLUMNS)}) VALUES %s"
+    )
+    start = perf_counter()
+    execute_values(cursor, statement, rows, page_size=OBSERVATION_VALUES_PAGE_SIZE)
+    record_cursor_query(statement, (perf_counter() - start) * 1000, len(rows))
 
 
 class ObservationResult:
     """
-    Class to handle the observation result table in database.
+    Class to handle the observation result table in database. Observations
+    are buffered as tuples and written in bounded batches with COPY, or
+    multi-row INSERTs where COPY fails, rather than as one ORM object each
 
     Attributes:
-    observations: list
+    observations: list of observations not yet written
 
     Properties:
     task_results: dqs_taskresults table
@@ -22,6 +115,9 @@ class ObservationResult:
         self._check = check
         self.observations = []
         self._table = DqsObservationresults
+        self._validated = False
+        self._written = 0
+        self._backend = get_write_backend()
 
     def add_observation(
         self,
@@ -31,7 +127,8 @@ class ObservationResult:
         serviced_organisation_vehicle_journey_id=None,
     ):
         """
-        Method to add an observation to the check
+        Method to add an observation to the check, writing the buffered
+        observations once there are OBSERVATION_BATCH_SIZE of them
 
         Args:
         details: str, optional
@@ -40,19 +137,20 @@ class ObservationResult:
         serviced_organisation_id: int, optional
         """
         try:
-            self._check.validate_requested_check()
-            logger.debug(
-                f"Attempting to add observation for check_id = {str(self._check.check_id)}"
-            )
-            observation = self._table(
-                details=details,
-                taskresults_id=self._check.result_id,
-                vehicle_journey_id=vehicle_journey_id,
-                service_pattern_stop_id=service_pattern_stop_id,
-                serviced_organisation_vehicle_journey_id=serviced_organisation_vehicle_journey_id,
+            if not self._validated:
+                self._check.validate_requested_check()
+                self._validated = True
+            self.observations.append(
+                (
+                    details,
+                    self._check.result_id,
+                    _optional_id(vehicle_journey_id),
+                    _optional_id(service_pattern_stop_id),
+                    _optional_id(serviced_organisation_vehicle_journey_id),
+                )
             )
-            self._check.db.session.add(observation)
-            self.observations.append(observation)
+            if len(self.observations) >= OBSERVATION_BATCH_SIZE:
+                self._write_batch()
         except Exception as e:
             logger.error(
                 f"Failed to add observation for check_id = {str(self._check.check_id)}",
@@ -60,21 +158,57 @@ class ObservationResult:
             )
             raise e
 
+    def _write_batch(self):
+        """
+        Write the buffered observations in the session's transaction, which
+        write_observations commits
+        """
+        rows, self.observations = self.observations, []
+        session = self._check.db.session
+        connection = session.connection()
+        if connection.dialect.driver != "psycopg2":
+            connection.execute(
+                insert(self._table),
+                [dict(zip(OBSERVATION_COLUMNS, row)) for row in rows],
+            )
+        elif self._backend == WriteBackend.COPY:
+            try:
+                # A savepoint, so a failed COPY leaves the transaction usable
+                with session.begin_nested():
+                    with connection.connection.cursor() as cursor:
+                        copy_observations(cursor, rows)
+            except Exception as e:
+                logger.warning(
+                    f"COPY of observations failed, falling back to INSERT: {e}"
+                )
+                self._backend = WriteBackend.VALUES
+                with connection.connection.cursor() as cursor:
+                    insert_observation_values(cursor, rows)
+        else:
+            with connection.connection.cursor() as cursor:
+                insert_observation_values(cursor, rows)
+        self._written += len(rows)
+        logger.debug(
+            f"Wrote {len(rows)} observation(s) for check_id = {str(self._check.check_id)}"
+        )
+
     def write_observations(self):
         """
         Method to write the added observations to the database
         """
         try:
-            if len(self.observations) < 1:
+            if len(self.observations) < 1 and self._written < 1:
                 logger.info(
                     f"No observations to write for check_id = {str(self._check.check_id)}"
                 )
                 return
             logger.debug(
-                f"Attempting to add {str(len(self.observations))} observation(s) for check_id = {str(self._check.check_id)}"
+                f"Attempting to add {str(len(self.observations) + self._written)} observation(s) for check_id = {str(self._check.check_id)}"
             )
-            self._check.db.session.flush()
+            if self.observations:
+                self._write_batch()
             self._check.db.session.commit()
+            self._written = 0
             logger.info("Observations written in DB")
         except Exception as e:
             logger.error(
@@ -16,10 +16,17 @@ class OrganisationTxcFileAttributes:
 
     Methods:
     validate_noc_code: Validate the NOC in the organisation_operatorcode table
+    share: Load the attributes for a file once for every check run for it
     """
 
+    # Attributes loaded once by the file executor, keyed by file id
+    _shared = {}
+
     def __init__(self, check: Check):
         self._check = check
+        if check.file_id in self._shared:
+            self.__dict__.update(self._shared[check.file_id])
+            return
         self.revision_id = None
         self.dataset_id = None
         self.organisation_id = None
@@ -31,6 +38,20 @@ class OrganisationTxcFileAttributes:
         self._get_organisation_dataset()
         self._get_organisation_id()
 
+    @classmethod
+    def share(cls, check: Check):
+        """
+        Method to load the attributes of the check's file so later instances
+        for the same file reuse them rather than querying again
+        """
+        attributes = vars(cls(check)).copy()
+        attributes.pop("_check")
+        cls._shared = {check.file_id: attributes}
+
+    @classmethod
+    def clear_shared(cls):
+        cls._shared = {}
+
     def _initialize_txc_fileattribute(self):
         """
         Method to get the organisation_txcfileattributes objects on id
@@ -0,0 +1,188 @@
+import re
+import sys
+import sysconfig
+from hashlib import md5
+from json import dumps
+from os import environ
+from os.path import basename
+from threading import Lock
+from time import time
+from dqs_logger import logger
+
+EMF_NAMESPACE = "DQS/Queries"
+STATEMENT_PREVIEW_LENGTH = 200
+
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\?|(?<!:):\w+|\$\d+")
+_PLACEHOLDER_LIST = re.compile(r"\?(\s*,\s*\?)+")
+_NUMBER = re.compile(r"\b\d+\b")
+_WHITESPACE = re.compile(r"\s+")
+_IGNORED_PATHS = (
+    sysconfig.get_paths()["stdlib"],
+    sysconfig.get_paths()["purelib"],
+    sysconfig.get_paths()["platlib"],
+)
+_IGNORED_MODULES = ("bods_db.py", "query_metrics.py")
+
+
+def query_metrics_enabled() -> bool:
+    """
+    Per-query instrumentation is on unless QUERY_METRICS_ENABLED is false
+    """
+    return environ.get("QUERY_METRICS_ENABLED", "true").lower() != "false"
+
+
+def normalise_statement(statement: str) -> str:
+    """
+    Reduce a statement to its shape, replacing bound parameters and literal
+    numbers with ? and collapsing expanded IN lists, so the same query with
+    different values always has the same fingerprint
+    """
+    normalised = _WHITESPACE.sub(" ", statement).strip()
+    normalised = _PLACEHOLDER.sub("?", normalised)
+    normalised = _NUMBER.sub("?", normalised)
+    return _PLACEHOLDER_LIST.sub("?...", normalised)
+
+
+def fingerprint_statement(statement: str) -> str:
+    """
+    Short, stable identifier for the normalised statement
+    """
+    return md5(normalise_statement(statement).encode("utf-8")).hexdigest()[:12]
+
+
+def find_caller(depth: int = 1) -> str:
+    """
+    Name of the function that issued the query. A function in dataframes.py
+    is preferred, otherwise the nearest application frame is used, looking
+    from depth frames above this one
+    """
+    frame = sys._getframe(depth)
+    fallback = None
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        module = basename(filename)
+        if module == "dataframes.py":
+            return frame.f_code.co_name
+        if (
+            fallback is None
+            and module not in _IGNORED_MODULES
+            and not filename.startswith(_IGNORED_PATHS)
+        ):
+            fallback = f"{module[:-3]}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return fallback or "unknown"
+
+
+class QueryMetrics:
+    """
+    Collects the duration and row count of each statement sent to the
+    database, aggregated by statement fingerprint and calling function
+
+    Methods:
+    set_tags: Set the check_id and file_id the following queries belong to
+    record: Record one executed statement and emit it as an EMF log line
+    summary: Aggregated statistics, slowest total first
+    log_summary: Log the summary for the invocation and reset the statistics
+    reset: Clear the statistics and tags
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._stats = {}
+        self._tags = {}
+
+    def set_tags(self, **tags):
+        with self._lock:
+            self._tags.update(tags)
+
+    def record(self, statement, caller, duration_ms, rows):
+        fingerprint = fingerprint_statement(statement)
+        with self._lock:
+            stats = self._stats.setdefault(
+                (fingerprint, caller),
+                {
+                    "fingerprint": fingerprint,
+                    "caller": caller,
+                    "statement": normalise_statement(statement)[
+                        :STATEMENT_PREVIEW_LENGTH
+                    ],
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "rows": 0,
+                },
+            )
+            stats["count"] += 1
+            stats["total_ms"] += duration_ms
+            stats["max_ms"] = max(stats["max_ms"], duration_ms)
+            stats["rows"] += rows or 0
+            tags = dict(self._tags)
+        self._emit(fingerprint, caller, duration_ms, rows, tags)
+
+    def _emit(self, fingerprint, caller, duration_ms, rows, tags):
+        """
+        Write a CloudWatch Embedded Metric Format record to stdout, which the
+        Lambda runtime ships to CloudWatch Logs and extracts as metrics
+        """
+        metrics = [{"Name": "QueryDuration", "Unit": "Milliseconds"}]
+        record = {
+            "FunctionName": environ.get("AWS_LAMBDA_FUNCTION_NAME", "local"),
+            "Caller": caller,
+            "Fingerprint": fingerprint,
+            "CheckId": tags.get("check_id"),
+            "FileId": tags.get("file_id"),
+            "QueryDuration": round(duration_ms, 3),
+        }
+        if rows is not None:
+            metrics.append({"Name": "QueryRows", "Unit": "Count"})
+            record["QueryRows"] = rows
+        record["_aws"] = {
+            "Timestamp": int(time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": EMF_NAMESPACE,
+                    "Dimensions": [["FunctionName", "Caller"]],
+                    "Metrics": metrics,
+                }
+            ],
+        }
+        sys.stdout.write(dumps(record, default=str) + "\n")
+
+    def summary(self) -> list:
+        with self._lock:
+            stats = [dict(entry) for entry in self._stats.values()]
+        return sorted(stats, key=lambda entry: entry["total_ms"], reverse=True)
+
+    def log_summary(self):
+        summary = self.summary()
+        if summary:
+            total_ms = sum(entry["total_ms"] for entry in summary)
+            logger.info(
+                f"Query summary: {sum(entry['count'] for entry in summary)} "
+                f"queries in {total_ms:.1f}ms for {self._tags}"
+            )
+            for entry in summary:
+                logger.info(
+                    f"{entry['total_ms']:.1f}ms over {entry['count']} "
+                    f"(max {entry['max_ms']:.1f}ms, {entry['rows']} rows) "
+                    f"from {entry['caller']} [{entry['fingerprint']}]: "
+                    f"{entry['statement']}"
+                )
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._tags.clear()
+
+
+query_metrics = QueryMetrics()
+
+
+def record_cursor_query(statement: str, duration_ms: float, rows, caller=None):
+    """
+    Record a statement run on a DBAPI cursor directly, such as COPY, which
+    the engine's before and after_cursor_execute events never see
+    """
+    if query_metrics_enabled():
+        query_metrics.record(statement, caller or find_caller(2), duration_ms, rows)
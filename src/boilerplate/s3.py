@@ -30,9 +30,57 @@ class S3Client:
             logger.error(f"Error putting object: {e}")
             raise
 
+    def get_object_tail(self, bucket, key, length):
+        """
+        Get the last length bytes of the object, or all of a smaller one,
+        with a single suffix ranged GET. Returns them with the size of the
+        object, None if there is no such object
+        """
+        try:
+            response = self._s3_client.get_object(
+                Bucket=bucket, Key=key, Range=f"bytes=-{length}"
+            )
+            data = response.get("Body").read()
+        except self._s3_client.exceptions.NoSuchKey:
+            return None
+        except Exception as e:
+            logger.error(f"Error getting object tail: {e}")
+            raise
+        content_range = response.get("ContentRange")
+        size = int(content_range.rsplit("/", 1)[1]) if content_range else len(data)
+        return data, size
+
+    def get_object_range(self, bucket, key, start, end):
+        """
+        Get bytes start to end (inclusive) of the object with a ranged GET
+        """
+        try:
+            return (
+                self._s3_client.get_object(
+                    Bucket=bucket, Key=key, Range=f"bytes={start}-{end}"
+                )
+                .get("Body")
+                .read()
+            )
+        except Exception as e:
+            logger.error(f"Error getting object range: {e}")
+            raise
+
     def get_object(self, bucket, key):
         try:
             return self._s3_client.get_object(Bucket=bucket, Key=key).get("Body").read()
         except Exception as e:
             logger.error(f"Error getting object: {e}")
             raise
+
+    def get_object_if_exists(self, bucket, key):
+        """
+        Get the object in a single GET, None if there is no such object
+        """
+        try:
+            return self._s3_client.get_object(Bucket=bucket, Key=key).get("Body").read()
+        except self._s3_client.exceptions.NoSuchKey:
+            return None
+        except Exception as e:
+            logger.error(f"Error getting object: {e}")
+            raise
@@ -0,0 +1,101 @@
+from itertools import groupby
+from json import loads
+from bods_db import BodsDB
+from common import Check
+from dqs_logger import logger
+from organisation_txcfileattributes import OrganisationTxcFileAttributes
+from time_out_handler import get_timeout
+
+# Milliseconds get_timeout keeps back for the handler after its timeout
+_HANDLER_MARGIN_MS = 15000
+
+
+def _record_file_id(record) -> str:
+    try:
+        return str(loads(record["body"]).get("file_id", ""))
+    except Exception:
+        return ""
+
+
+class BatchRecordContext:
+    """
+    Lambda context of one record of an SQS batch, whose remaining time is an
+    equal share of the invocation's remaining time between the records left
+    to run, so a slow record can't use up the time of those after it
+    """
+
+    def __init__(self, context, records_left: int):
+        self._context = context
+        remaining_ms = context.get_remaining_time_in_millis() - _HANDLER_MARGIN_MS
+        self._remaining_ms = remaining_ms // records_left + _HANDLER_MARGIN_MS
+
+    def get_remaining_time_in_millis(self):
+        return min(self._remaining_ms, self._context.get_remaining_time_in_millis())
+
+    def __getattr__(self, name):
+        return getattr(self._context, name)
+
+
+def _share_file(file_id: str, event, record):
+    """
+    Share one BodsDB and the file's attributes between the checks of the
+    file's records, returning the BodsDB
+    """
+    db = BodsDB()
+    Check.share_db(int(file_id), db)
+    try:
+        OrganisationTxcFileAttributes.share(Check({**event, "Records": [record]}, ""))
+    except Exception as e:
+        # Each check loads its own instead
+        logger.error(f"Failed to load shared inputs for file {file_id}: {e}")
+        logger.exception(e)
+    return db
+
+
+def _clear_shared_file():
+    Check.clear_shared_db()
+    OrganisationTxcFileAttributes.clear_shared()
+
+
+def process_sqs_batch(event, context, handler):
+    """
+    Run the handler for every record of an SQS batch as if each had been
+    delivered on its own, with an equal share of the remaining time. Records
+    for the same file run back to back sharing one BodsDB and the file's
+    attributes. Records that raise, or that there is no time left to run,
+    are returned as batchItemFailures so SQS only redelivers those.
+
+    Events that don't come from SQS, e.g. from the state machine, are passed
+    straight to the handler and its result returned.
+    """
+    if not event or "Records" not in event:
+        return handler(event, context)
+
+    records = sorted(event["Records"], key=_record_file_id)
+    logger.info(f"Processing batch of {len(records)} SQS records")
+    failures = []
+    records_left = len(records)
+    for file_id, file_records in groupby(records, key=_record_file_id):
+        file_records = list(file_records)
+        shared = len(file_records) > 1 and file_id.isdigit()
+        if shared:
+            _share_file(file_id, event, file_records[0])
+        try:
+            for record in file_records:
+                message_id = record.get("messageId")
+                record_context = BatchRecordContext(context, records_left)
+                records_left -= 1
+                if get_timeout(record_context) <= 0:
+                    logger.warning(f"No time left to process record {message_id}")
+                    failures.append({"itemIdentifier": message_id})
+                    continue
+                try:
+                    handler({**event, "Records": [record]}, record_context)
+                except Exception as e:
+                    logger.error(f"Failed to process record {message_id}: {e}")
+                    logger.exception(e)
+                    failures.append({"itemIdentifier": message_id})
+        finally:
+            if shared:
+                _clear_shared_file()
+    return {"batchItemFailures": failures}
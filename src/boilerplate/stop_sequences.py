@@ -0,0 +1,172 @@
+from functools import cached_property
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+def _as_mask(mask) -> np.ndarray:
+    if isinstance(mask, pd.Series):
+        return mask.to_numpy(dtype=bool, na_value=False)
+    return np.asarray(mask, dtype=bool)
+
+
+def _is_sorted(journeys: np.ndarray, sequences: np.ndarray) -> bool:
+    """
+    Whether the stops are in journey and sequence number order, with stops
+    missing their sequence number last in their journey
+    """
+    journey_steps = np.diff(journeys)
+    in_sequence = (np.diff(sequences) >= 0) | np.isnan(sequences[1:])
+    return bool(((journey_steps > 0) | ((journey_steps == 0) & in_sequence)).all())
+
+
+def _ranks(values: np.ndarray) -> tuple:
+    """
+    Offset of each value from the lowest, with missing values after the
+    highest, and the number of offsets
+    """
+    present = ~np.isnan(values)
+    if not present.any():
+        return np.zeros(len(values), dtype=np.int64), 1
+    lowest, highest = values[present].min(), values[present].max()
+    missing = highest - lowest + 1
+    ranks = np.where(present, values - lowest, missing).astype(np.int64)
+    return ranks, int(missing) + 1
+
+
+def _sort_order(journeys: np.ndarray, sequences: np.ndarray) -> np.ndarray:
+    """
+    Order of the stops by journey and sequence number, missing ones last, and
+    by position for ties, as a stable lexsort would give it. The journey and
+    sequence number, as offsets from the lowest of each, are packed with the
+    position into one int64, which sorts several times faster and, being
+    unique, needn't be a stable sort. Keys too large to pack fall back to
+    the lexsort
+    """
+    count = len(journeys)
+    journey_ranks, journey_range = _ranks(journeys)
+    sequence_ranks, sequence_range = _ranks(sequences)
+    if journey_range * sequence_range * count >= 2**63:
+        return np.lexsort((sequences, journeys))
+    keys = (journey_ranks * sequence_range + sequence_ranks) * count
+    return np.sort(keys + np.arange(count)) % count
+
+
+class StopSequences:
+    """
+    Stops of a vehicle journey dataframe ordered once by vehicle journey and
+    auto sequence number, with the offset of each journey's first stop, so
+    the stop sequence checks find first and last stops and consecutive stops
+    in one pass over the rows rather than grouping by journey. Frames that
+    are already in that order, as streamed chunks are, aren't sorted, and
+    only the rows and columns a check asks for are taken from the frame
+
+    Attributes:
+    frame: The stops as given
+    order: Position in frame of each stop in journey and sequence order
+    journey_ids: Vehicle journey id of each journey, in ascending order
+    offsets: Position in order of each journey's first stop, then len(order)
+    df: The stops in journey and sequence order, with their index
+
+    Methods:
+    rows: Stops at positions of the order
+    column: Values of a column in the order
+    first_stops: Stop with the lowest sequence number of each journey
+    last_stops: Stop with the highest sequence number of each journey
+    journeys_with: Whether each journey has a stop in a mask of frame's rows
+    same_journey_as_previous: Whether each stop follows a stop of its journey
+    subset: Stops in a mask of frame's rows, sharing the frame and order
+    segment: Stops of one journey
+    """
+
+    def __init__(self, df: pd.DataFrame, order: Optional[np.ndarray] = None):
+        """
+        Order the frame's stops, unless their order is given, as it is for a
+        subset of stops already ordered
+        """
+        journeys = df["vehicle_journey_id"].to_numpy(dtype="float64", na_value=np.nan)
+        sequences = df["auto_sequence_number"].to_numpy(
+            dtype="float64", na_value=np.nan
+        )
+        self.frame = df
+        self._frame_in_order = order is None and _is_sorted(journeys, sequences)
+        if self._frame_in_order:
+            order = np.arange(len(df))
+        elif order is None:
+            order = _sort_order(journeys, sequences)
+        self.order = order
+        self._journeys = journeys[order]
+        self._sequences = sequences[order]
+        starts = np.flatnonzero(np.diff(self._journeys, prepend=np.nan) != 0)
+        self.journey_ids = df["vehicle_journey_id"].to_numpy()[order[starts]]
+        self.offsets = np.append(starts, len(order))
+
+    def __len__(self):
+        return len(self.journey_ids)
+
+    @cached_property
+    def df(self) -> pd.DataFrame:
+        if self._frame_in_order:
+            return self.frame
+        return self.rows(np.arange(len(self.order)))
+
+    def rows(self, positions: np.ndarray) -> pd.DataFrame:
+        """
+        Stops at the positions of the journey and sequence order
+        """
+        return self.frame.take(self.order[positions])
+
+    def column(self, name: str) -> pd.Series:
+        """
+        Values of the column in the journey and sequence order
+        """
+        return self.frame[name].take(self.order)
+
+    @property
+    def first_positions(self) -> np.ndarray:
+        """
+        Position of each journey's first stop, which has its lowest sequence
+        number as stops without one are ordered last
+        """
+        return self.offsets[:-1]
+
+    @cached_property
+    def last_positions(self) -> np.ndarray:
+        """
+        Position of the first of the stops with each journey's highest
+        sequence number, as idxmax finds it, skipping stops without one. A
+        journey without any sequence numbers has its first stop
+        """
+        if not len(self):
+            return self.offsets[:-1]
+        starts = self.offsets[:-1]
+        numbered = np.add.reduceat(~np.isnan(self._sequences), starts, dtype=np.int64)
+        ends = starts + np.maximum(numbered - 1, 0)
+        new_run = (np.diff(self._journeys, prepend=np.nan) != 0) | (
+            np.diff(self._sequences, prepend=np.nan) != 0
+        )
+        run_starts = np.maximum.accumulate(
+            np.where(new_run, np.arange(len(self.order)), 0)
+        )
+        return run_starts[ends]
+
+    def first_stops(self) -> pd.DataFrame:
+        return self.rows(self.first_positions)
+
+    def last_stops(self) -> pd.DataFrame:
+        return self.rows(self.last_positions)
+
+    def journeys_with(self, mask) -> np.ndarray:
+        if not len(self):
+            return np.zeros(0, dtype=bool)
+        return np.logical_or.reduceat(_as_mask(mask)[self.order], self.offsets[:-1])
+
+    def same_journey_as_previous(self) -> np.ndarray:
+        return np.diff(self._journeys, prepend=np.nan) == 0
+
+    def subset(self, mask) -> "StopSequences":
+        return StopSequences(self.frame, self.order[_as_mask(mask)[self.order]])
+
+    def segment(self, journey: int) -> pd.DataFrame:
+        return self.rows(np.arange(self.offsets[journey], self.offsets[journey + 1]))
@@ -1,5 +1,13 @@
 from dqs_logger import logger
 from dqs_exception import LambdaTimeOutError
+from query_metrics import query_metrics
+from bods_db import (
+    BACKEND_PID_SLOTS,
+    record_backend_pids,
+    recorded_backend_pids,
+    set_statement_timeout,
+)
+from data_persistence import flush_persistence
 import multiprocessing
 
 
@@ -13,6 +21,7 @@ class TimeOutHandler:
         self._event = event
         self._check = check
         self._timeout = timeout
+        self._backend_pids = None
 
     def run(self, target_function, *args):
         """
@@ -24,9 +33,14 @@ class TimeOutHandler:
                 multiprocessing.set_start_method("fork")
             except Exception:
                 pass
+            # Hand the parent's DB connection back to the pool so the forked
+            # child checks out its own rather than sharing the socket
+            self._check.db.release_connection()
+            # Filled in by the child with the backend PIDs of its connections
+            self._backend_pids = multiprocessing.Array("i", 2 * BACKEND_PID_SLOTS)
             process = multiprocessing.Process(
-                target=target_function,
-                args=(self._event, self._check),
+                target=self._run_instrumented,
+                args=(target_function,),
             )
             # Start the process
             process.start()
@@ -36,7 +50,37 @@ class TimeOutHandler:
             if process.is_alive():
                 logger.warning("Terminating execution, time exceeded timeout limit.")
                 process.terminate()
+                self._cancel_child_queries()
                 raise LambdaTimeOutError("Exiting due to timed out")
         except Exception as e:
             logger.error(f"Error: {e}")
             raise e
+        finally:
+            query_metrics.log_summary()
+
+    def _run_instrumented(self, target_function):
+        """
+        Run the target in the child process, tagging its queries with the
+        check and logging the child's query summary when it finishes
+        """
+        # The child starts with a copy of the parent's statistics
+        query_metrics.reset()
+        query_metrics.set_tags(
+            check_id=self._check.check_id, file_id=self._check.file_id
+        )
+        set_statement_timeout(self._timeout)
+        record_backend_pids(self._backend_pids)
+        try:
+            target_function(self._event, self._check)
+        finally:
+            # The child exits once the target returns, taking any background
+            # uploads with it
+            flush_persistence()
+            query_metrics.log_summary()
+
+    def _cancel_child_queries(self):
+        """
+        Cancel whatever the terminated child was running on the database, as
+        the server carries on with a query after its client process is killed
+        """
+        self._check.db.cancel_backends(recorded_backend_pids(self._backend_pids))
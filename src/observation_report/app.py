@@ -5,6 +5,8 @@ from dqs_logger import logger
 from common import DQSReport
 from enums import DQSReportStatus
 from dataframes import get_df_dqs_observation_results
+from sqs_batch import process_sqs_batch
+from query_metrics import query_metrics
 from io import StringIO
 
 # Initialize S3 client
@@ -14,7 +16,7 @@ s3_client = boto3.client("s3")
 S3_BUCKET_NAME = environ.get("S3_BUCKET_DQS_CSV_REPORT", "bodds-dev-dqs-reports")
 
 
-def lambda_handler(event, context):
+def handle_event(event, context):
     today_date = datetime.now().strftime("%Y%m%d")
     status = DQSReportStatus.REPORT_GENERATED.value
 
@@ -45,5 +47,10 @@ def lambda_handler(event, context):
     finally:
         report.set_status(status, CSV_FILE_NAME)
         logger.info("Check status updated in DB")
+        query_metrics.log_summary()
 
     return
+
+
+def lambda_handler(event, context):
+    return process_sqs_batch(event, context, handle_event)
@@ -2,6 +2,7 @@ from common import Check
 from enums import DQSTaskResultStatus
 from dqs_logger import logger
 from time_out_handler import TimeOutHandler, get_timeout
+from sqs_batch import process_sqs_batch
 from dqs_exception import LambdaTimeOutError
 
 
@@ -20,7 +21,7 @@ def lambda_worker(event, check) -> None:
     return
 
 
-def lambda_handler(event, context):
+def handle_event(event, context):
     try:
         # Get timeout from context reduced by 15 sec
         timeout = get_timeout(context)
@@ -36,3 +37,7 @@ def lambda_handler(event, context):
         status = DQSTaskResultStatus.FAILED.value
         logger.error(f"Check status failed due to {e}")
         check.set_status(status)
+
+
+def lambda_handler(event, context):
+    return process_sqs_batch(event, context, handle_event)
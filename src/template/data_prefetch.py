@@ -1,8 +1,15 @@
 from common import Check
+from data_persistence import flush_persistence
 from dataframes import get_df_vehicle_journey
+from query_metrics import query_metrics
 
 
 def lambda_handler(event, context):
     check = Check(event, "")
-
-    get_df_vehicle_journey(check, refresh=True)
+    query_metrics.set_tags(file_id=event.get("file_id"))
+    try:
+        # Checks are started once this returns, so the frame must be saved
+        get_df_vehicle_journey(check, refresh=True, wait_for_save=True)
+    finally:
+        flush_persistence()
+        query_metrics.log_summary()
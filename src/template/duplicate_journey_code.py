@@ -1,11 +1,23 @@
+import numpy as np
+import pandas as pd
 from dqs_logger import logger
 from common import Check
 from enums import DQSTaskResultStatus
 from dataframes import get_vj_duplicate_journey_code
 from observation_results import ObservationResult
-import hashlib
 from dqs_exception import LambdaTimeOutError
 from time_out_handler import TimeOutHandler, get_timeout
+from sqs_batch import process_sqs_batch
+
+# Lists whose elements make up a journey's calendar key, which pools them as
+# one list, as the MD5 the check used to group calendars by did
+_CALENDAR_COLUMNS = (
+    "non_operating_date",
+    "operating_date",
+    "day_of_week",
+    "serviced_organisation_id",
+)
+_EMPTY_LIST = "[]"
 
 
 def lambda_worker(event, check):
@@ -18,19 +30,8 @@ def lambda_worker(event, check):
         if not df.empty:
             df = df[df["journey_code"].notna() & (df["journey_code"] != "")]
             logger.debug(f"Looking in the Dataframes: {df.size}")
-            df["hash"] = df.apply(create_df_row_hash, axis=1)
-
-            duplicates = df[
-                df.duplicated(
-                    subset=[
-                        "line_ref",
-                        "journey_code",
-                        "hash",
-                        "operating_on_working_days",
-                    ],
-                    keep=False,
-                )
-            ]
+            df = df.assign(calendar_key=calendar_keys(df))
+            duplicates = df[duplicated_journey_codes(df)]
             if not duplicates.empty:
                 logger.debug(f"Found duplicate in the Dataframes: {duplicates.size}")
                 for row in duplicates.itertuples():
@@ -56,20 +57,54 @@ def lambda_worker(event, check):
     return
 
 
-def create_df_row_hash(row):
-    return hashlib.md5(
-        str(
-            sorted(
-                list(row["non_operating_date"])
-                + list(row["operating_date"])
-                + list(row["day_of_week"])
-                + list(row["serviced_organisation_id"])
-            )
-        ).encode("utf-8")
-    ).hexdigest()
+def _element_hashes(elements: pd.Series) -> np.ndarray:
+    """
+    Stable 64 bit hash of the str() of each element, where a "[]" standing
+    in for a journey with none of a list hashes as its two brackets, as
+    list() of it gave them
+    """
+    values = elements.astype(str).to_numpy(dtype=object)
+    brackets = pd.util.hash_array(np.array(list(_EMPTY_LIST), dtype=object)).sum()
+    return np.where(values == _EMPTY_LIST, brackets, pd.util.hash_array(values))
 
 
-def lambda_handler(event, context):
+def calendar_keys(df: pd.DataFrame) -> pd.Series:
+    """
+    Stable 64 bit key of each vehicle journey's calendar, a hash of the sum
+    of the hashes of the elements of its pooled lists. Like the MD5 of their
+    sorted str() the check used to group calendars by, it depends on neither
+    the order of the lists nor which list an element is in
+    """
+    cells = pd.concat(
+        [df[column].reset_index(drop=True) for column in _CALENDAR_COLUMNS]
+    )
+    elements = cells[cells.str.len() > 0].explode()
+    keys = np.zeros(len(df), dtype=np.uint64)
+    np.add.at(keys, elements.index.to_numpy(), _element_hashes(elements))
+    return pd.Series(pd.util.hash_array(keys), index=df.index)
+
+
+def duplicated_journey_codes(df: pd.DataFrame) -> pd.Series:
+    """
+    Whether each journey shares its line, journey code, calendar and
+    operating on working days with another journey, comparing integer codes
+    of each
+    """
+    keys = pd.DataFrame(
+        {
+            "line_ref": pd.factorize(df["line_ref"])[0],
+            "journey_code": pd.factorize(df["journey_code"])[0],
+            "calendar_key": df["calendar_key"].to_numpy(),
+            "operating_on_working_days": pd.factorize(df["operating_on_working_days"])[
+                0
+            ],
+        },
+        index=df.index,
+    )
+    return keys.duplicated(keep=False)
+
+
+def handle_event(event, context):
     try:
         # Get timeout from context reduced by 15 sec
         timeout = get_timeout(context)
@@ -86,3 +121,7 @@ def lambda_handler(event, context):
         logger.error(f"Check status failed due to {e}")
         logger.exception(e)
         check.set_status(status)
+
+
+def lambda_handler(event, context):
+    return process_sqs_batch(event, context, handle_event)
@@ -0,0 +1,142 @@
+import importlib
+import importlib.util
+from json import dumps
+from os import environ
+from sqlalchemy import select
+from bods_db import BodsDB
+from common import Check
+from dataframes import clear_snapshot, load_snapshot
+from dqs_checks import check_registry
+from dqs_exception import LambdaTimeOutError
+from dqs_logger import logger
+from enums import DQSTaskResultStatus
+from models import DqsTaskresults
+from naptan_reference import get_naptan_reference
+from organisation_txcfileattributes import OrganisationTxcFileAttributes
+from time_out_handler import TimeOutHandler, get_timeout
+
+# Longest a single check may run, matching the run time of a check Lambda,
+# and the shortest share of the remaining time worth starting a check with
+CHECK_TIMEOUT = int(environ.get("FILE_EXECUTOR_CHECK_TIMEOUT", 120))
+MIN_CHECK_TIMEOUT = int(environ.get("FILE_EXECUTOR_MIN_CHECK_TIMEOUT", 10))
+
+# Check modules sit beside this one, in the Lambda root or in src.template
+_PACKAGE = __name__.rpartition(".")[0]
+
+
+def get_check_worker(name: str):
+    """
+    Get the lambda_worker of the module named after the check, falling back
+    to the vanilla app module for checks that don't have their own
+    """
+    for module_name in (name, "app"):
+        module_path = f"{_PACKAGE}.{module_name}" if _PACKAGE else module_name
+        if importlib.util.find_spec(module_path):
+            return importlib.import_module(module_path).lambda_worker
+
+
+def get_pending_checks(db: BodsDB, file_id: int) -> list:
+    """
+    Get the name, event and Check of each pending task result of the file,
+    the checks all sharing the db
+    """
+    check_names = {
+        check.id: name for name, check in check_registry.get_checks(db.session).items()
+    }
+    results = db.session.execute(
+        select(DqsTaskresults.id, DqsTaskresults.checks_id)
+        .where(
+            (DqsTaskresults.transmodel_txcfileattributes_id == file_id)
+            & (DqsTaskresults.status == DQSTaskResultStatus.PENDING.value)
+        )
+        .order_by(DqsTaskresults.checks_id)
+    ).all()
+    checks = []
+    for result_id, check_id in results:
+        event = {
+            "Records": [
+                {
+                    "body": dumps(
+                        {
+                            "file_id": file_id,
+                            "check_id": check_id,
+                            "result_id": result_id,
+                        }
+                    )
+                }
+            ]
+        }
+        name = check_names.get(check_id, "app")
+        checks.append((name, event, Check(event, name, db=db)))
+    return checks
+
+
+def get_check_timeout(context, checks_left: int) -> int:
+    """
+    Equal share of the invocation's remaining time for each of the checks
+    left to run, at most CHECK_TIMEOUT, so a slow check can't use up the
+    time of those after it
+    """
+    return min(get_timeout(context) // checks_left, CHECK_TIMEOUT)
+
+
+def run_check(name: str, event, check: Check, timeout: int) -> None:
+    """
+    Run one check in its own process with its own timeout and set its status,
+    as the check's own Lambda would, without letting it affect the others
+    """
+    try:
+        check.validate_requested_check()
+        TimeOutHandler(event, check, timeout).run(get_check_worker(name))
+    except LambdaTimeOutError:
+        status = DQSTaskResultStatus.TIMEOUT.value
+        logger.info(f"Set {name} status to {status}")
+        check.set_status(status)
+    except Exception as e:
+        status = DQSTaskResultStatus.FAILED.value
+        logger.error(f"Check {name} failed due to {e}")
+        logger.exception(e)
+        check.set_status(status)
+
+
+def lambda_handler(event, context):
+    """
+    Run every pending check for the file in this one invocation, loading the
+    inputs the checks share once rather than once per check. Checks there is
+    no time left to start are left PENDING. The executor isn't wired into the
+    state machine yet, which still sends every check to its own Lambda
+    """
+    file_id = event.get("file_id")
+    db = BodsDB()
+    checks = get_pending_checks(db, file_id)
+    logger.info(f"Running {len(checks)} checks for file {file_id}")
+    if checks:
+        try:
+            # Loaded before the checks are forked so they all inherit it
+            get_naptan_reference(checks[0][2])
+            load_snapshot(checks[0][2])
+            OrganisationTxcFileAttributes.share(checks[0][2])
+        except Exception as e:
+            # Each check loads its own inputs instead
+            logger.error(f"Failed to load shared inputs for file {file_id}: {e}")
+            logger.exception(e)
+    ran, pending = [], []
+    try:
+        for index, (name, check_event, check) in enumerate(checks):
+            timeout = get_check_timeout(context, len(checks) - index)
+            if timeout < MIN_CHECK_TIMEOUT:
+                pending = [name for name, _, _ in checks[index:]]
+                logger.warning(
+                    f"No time left to run {len(pending)} checks for file "
+                    f"{file_id}, leaving them PENDING: {pending}"
+                )
+                break
+            try:
+                run_check(name, check_event, check, timeout)
+            except Exception as e:
+                logger.error(f"Failed to set status of {name} for {check}: {e}")
+            ran.append(name)
+    finally:
+        clear_snapshot()
+        OrganisationTxcFileAttributes.clear_shared()
+    return {"file_id": file_id, "checks": ran, "pending": pending}
@@ -5,6 +5,7 @@ from enums import DQSTaskResultStatus, DQSReportStatus
 from monitor_utils import map_pipeline_status, send_sqs_messages
 import pandas as pd
 from utils import update_dq_report_status
+from query_metrics import query_metrics
 
 
 def lambda_handler(event, context):
@@ -103,4 +104,5 @@ def lambda_handler(event, context):
         logger.exception(e)
 
     finally:
+        query_metrics.log_summary()
         logger.info("lambda_handler completed successfully.")
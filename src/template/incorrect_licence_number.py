@@ -6,6 +6,7 @@ from dqs_logger import logger
 from enums import IgnoredLicenceFormat
 from dqs_exception import LambdaTimeOutError
 from time_out_handler import TimeOutHandler, get_timeout
+from sqs_batch import process_sqs_batch
 
 
 def lambda_worker(event, check) -> None:
@@ -41,7 +42,7 @@ def lambda_worker(event, check) -> None:
     return
 
 
-def lambda_handler(event, context):
+def handle_event(event, context):
     try:
         # Get timeout from context reduced by 15 sec
         timeout = get_timeout(context)
@@ -58,3 +59,7 @@ def lambda_handler(event, context):
         logger.error(f"Check status failed due to {e}")
         logger.exception(e)
         check.set_status(status)
+
+
+def lambda_handler(event, context):
+    return process_sqs_batch(event, context, handle_event)
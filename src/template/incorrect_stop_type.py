@@ -4,6 +4,7 @@ from dqs_logger import logger
 from observation_results import ObservationResult
 from dataframes import get_df_stop_type
 from time_out_handler import TimeOutHandler, get_timeout
+from sqs_batch import process_sqs_batch
 from dqs_exception import LambdaTimeOutError
 
 # List of allowed stop type for first stop
@@ -57,7 +58,7 @@ def lambda_worker(event, check) -> None:
     return
 
 
-def lambda_handler(event, context):
+def handle_event(event, context):
     try:
         # Get timeout from context reduced by 15 sec
         timeout = get_timeout(context)
@@ -74,3 +75,7 @@ def lambda_handler(event, context):
         logger.error(f"Check status failed due to {e}")
         logger.exception(e)
         check.set_status(status)
+
+
+def lambda_handler(event, context):
+    return process_sqs_batch(event, context, handle_event)
@@ -4,6 +4,7 @@ from dqs_report import DQReport
 from dqs_logger import logger
 from org_txcfileattributes import TXCFileAttributes
 from dqs_task_results import DQTaskResults
+from query_metrics import query_metrics
 
 
 def get_report_id(revision_id: int) -> int:
@@ -32,6 +33,7 @@ def get_txc_files(revision_id: int) -> list:
 
 def lambda_handler(event, context):
     revision_id = event.get("DatasetRevisionId", "")
+    query_metrics.set_tags(revision_id=revision_id)
     try:
         if revision_id:
             report_id = get_report_id(revision_id)
@@ -47,3 +49,6 @@ def lambda_handler(event, context):
     except Exception as e:
         logger.error(f"Initiate DQS Lambda failed with: {e}")
         logger.exception(e)
+
+    finally:
+        query_metrics.log_summary()
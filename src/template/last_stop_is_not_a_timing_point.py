@@ -1,38 +1,49 @@
+import pandas as pd
 from dqs_logger import logger
 from common import Check
 from enums import DQSTaskResultStatus
-from dataframes import get_df_vehicle_journey
+from dataframes import format_time_of_day, get_df_vehicle_journey_chunks
+from stop_sequences import StopSequences
 from observation_results import ObservationResult
 from time_out_handler import TimeOutHandler, get_timeout
+from sqs_batch import process_sqs_batch
 from dqs_exception import LambdaTimeOutError
 
 # Allowed is_timing_points
 _ALLOWED_IS_TIMING_POINTS = True
 
 
+def find_last_stops_not_timing_points(sequences: StopSequences) -> pd.DataFrame:
+    """
+    Last stop of each vehicle journey that isn't a timing point
+    """
+    df = sequences.last_stops()
+    return df[~df["is_timing_point"] == _ALLOWED_IS_TIMING_POINTS]
+
+
 def lambda_worker(event, check) -> None:
     status = DQSTaskResultStatus.SUCCESS.value
     try:
         observation = ObservationResult(check)
-        df = get_df_vehicle_journey(check)
-        logger.info(f"Looking in the Dataframes: {df.size}")
-        if not df.empty:
-            df = df.loc[df.groupby("vehicle_journey_id").auto_sequence_number.idxmax()]
-            df = df[~df["is_timing_point"] == _ALLOWED_IS_TIMING_POINTS]
-            logger.info("Iterating over rows to add observations")
-
-            # Add the observation for check
-            for row in df.itertuples():
-                details = f"The last stop ({row.common_name}) on the {row.start_time} {row.direction} journey is not set as a timing point."
-                observation.add_observation(
-                    details=details,
-                    vehicle_journey_id=row.vehicle_journey_id,
-                    service_pattern_stop_id=row.service_pattern_stop_id,
-                )
-
-            logger.info("Observations added in memory")
-            # Write the observations to database
-            observation.write_observations()
+        # Chunks hold complete vehicle journeys, see get_df_vehicle_journey_chunks
+        for df in get_df_vehicle_journey_chunks(check):
+            logger.info(f"Looking in the Dataframes: {df.size}")
+            if not df.empty:
+                df = find_last_stops_not_timing_points(StopSequences(df))
+                logger.info("Iterating over rows to add observations")
+
+                # Add the observation for check
+                for row in df.itertuples():
+                    details = f"The last stop ({row.common_name}) on the {format_time_of_day(row.start_time)} {row.direction} journey is not set as a timing point."
+                    observation.add_observation(
+                        details=details,
+                        vehicle_journey_id=row.vehicle_journey_id,
+                        service_pattern_stop_id=row.service_pattern_stop_id,
+                    )
+
+                logger.info("Observations added in memory")
+                # Write the observations to database
+                observation.write_observations()
     except Exception as e:
         status = DQSTaskResultStatus.FAILED.value
         logger.error(f"Check status failed due to {e}")
@@ -44,7 +55,7 @@ def lambda_worker(event, check) -> None:
     return
 
 
-def lambda_handler(event, context):
+def handle_event(event, context):
     try:
         # Get timeout from context reduced by 15 sec
         timeout = get_timeout(context)
@@ -61,3 +72,7 @@ def lambda_handler(event, context):
         logger.error(f"Check status failed due to {e}")
         logger.exception(e)
         check.set_status(status)
+
+
+def lambda_handler(event, context):
+    return process_sqs_batch(event, context, handle_event)
@@ -1,38 +1,49 @@
+import pandas as pd
 from dqs_logger import logger
 from common import Check
 from enums import DQSTaskResultStatus
 from observation_results import ObservationResult
-from dataframes import get_df_vehicle_journey
+from dataframes import format_time_of_day, get_df_vehicle_journey_chunks
+from stop_sequences import StopSequences
 from time_out_handler import TimeOutHandler, get_timeout
+from sqs_batch import process_sqs_batch
 from dqs_exception import LambdaTimeOutError
 
 # List of allowed activities for first stop
 _ALLOWED_ACTIVITY_LAST_STOP = ["setDown", "setDownDriverRequest", "pickUpAndSetDown"]
 
 
+def find_pick_up_only_last_stops(sequences: StopSequences) -> pd.DataFrame:
+    """
+    Last stop of each vehicle journey whose activity doesn't set down passengers
+    """
+    df = sequences.last_stops()
+    return df[~df["activity"].isin(_ALLOWED_ACTIVITY_LAST_STOP)]
+
+
 def lambda_worker(event, check) -> None:
     status = DQSTaskResultStatus.SUCCESS.value
     try:
         observation = ObservationResult(check)
-        df = get_df_vehicle_journey(check)
-        logger.info(f"Looking in the Dataframes: {df.size}")
-        if not df.empty:
-            df = df.loc[df.groupby("vehicle_journey_id").auto_sequence_number.idxmax()]
-            df = df[~df["activity"].isin(_ALLOWED_ACTIVITY_LAST_STOP)]
+        # Chunks hold complete vehicle journeys, see get_df_vehicle_journey_chunks
+        for df in get_df_vehicle_journey_chunks(check):
+            logger.info(f"Looking in the Dataframes: {df.size}")
+            if not df.empty:
+                df = find_pick_up_only_last_stops(StopSequences(df))
 
-            logger.info("Iterating over rows to add observations")
+                logger.info("Iterating over rows to add observations")
 
-            # Add the observation for check
-            for row in df.itertuples():
-                details = f"The last stop ({row.common_name}) on the {row.start_time} {row.direction} journey is incorrectly set to pick up passengers."
-                observation.add_observation(
-                    details=details,
-                    vehicle_journey_id=row.vehicle_journey_id,
-                    service_pattern_stop_id=row.service_pattern_stop_id,
-                )
-            logger.info("Observations added in memory")
-            # Write the observations to database
-            observation.write_observations()
+                # Add the observation for check
+                for row in df.itertuples():
+                    details = f"The last stop ({row.common_name}) on the {format_time_of_day(row.start_time)} {row.direction} journey is incorrectly set to pick up passengers."
+                    observation.add_observation(
+                        details=details,
+                        vehicle_journey_id=row.vehicle_journey_id,
+                        service_pattern_stop_id=row.service_pattern_stop_id,
+                    )
+                logger.info("Observations added in memory")
+                # Write the observations to database
+                observation.write_observations()
     except LambdaTimeOutError as e:
         status = DQSTaskResultStatus.TIMEOUT.value
         logger.error(f"Check status timed out due to {e}")
@@ -48,7 +59,7 @@ def lambda_worker(event, check) -> None:
     return
 
 
-def lambda_handler(event, context):
+def handle_event(event, context):
     try:
         # Get timeout from context reduced by 15 sec
         timeout = get_timeout(context)
@@ -65,3 +76,7 @@ def lambda_handler(event, context):
         logger.error(f"Check status failed due to {e}")
         logger.exception(e)
         check.set_status(status)
+
+
+def lambda_handler(event, context):
+    return process_sqs_batch(event, context, handle_event)
@@ -4,6 +4,7 @@ from enums import DQSTaskResultStatus
 from dataframes import get_df_missing_bus_working_number
 from observation_results import ObservationResult
 from time_out_handler import TimeOutHandler, get_timeout
+from sqs_batch import process_sqs_batch
 from dqs_exception import LambdaTimeOutError
 from organisation_txcfileattributes import OrganisationTxcFileAttributes
 
@@ -49,7 +50,7 @@ def lambda_worker(event, check) -> None:
     return
 
 
-def lambda_handler(event, context):
+def handle_event(event, context):
     try:
         # Get timeout from context reduced by 15 sec
         timeout = get_timeout(context)
@@ -66,3 +67,7 @@ def lambda_handler(event, context):
         logger.error(f"Check status failed due to {e}")
         logger.exception(e)
         check.set_status(status)
+
+
+def lambda_handler(event, context):
+    return process_sqs_batch(event, context, handle_event)
@@ -1,10 +1,12 @@
+import pandas as pd
 from dqs_logger import logger
 from common import Check
-import numpy as np
 from enums import DQSTaskResultStatus
-from dataframes import get_df_vehicle_journey
+from dataframes import format_time_of_day, get_df_vehicle_journey_chunks
+from stop_sequences import StopSequences
 from observation_results import ObservationResult
 from time_out_handler import TimeOutHandler, get_timeout
+from sqs_batch import process_sqs_batch
 from dqs_exception import LambdaTimeOutError
 
 
@@ -13,31 +15,27 @@ def lambda_worker(event, check) -> None:
     status = DQSTaskResultStatus.SUCCESS.value
     try:
         observation = ObservationResult(check)
-        df = get_df_vehicle_journey(check)
-        df["vehicle_journey_code"] = df["vehicle_journey_code"].replace("", np.nan)
-        logger.info(f"Looking in the Dataframes: {df.size}")
-        if not df.empty:
-            null_journey_codes = df[df["vehicle_journey_code"].isnull()][
-                "vehicle_journey_id"
-            ].unique()
-            df = df[df["vehicle_journey_id"].isin(null_journey_codes)]
-            logger.info("Iterating over rows to add observations")
-            # Sort the dataframe with vehicle journey id and auto sequence number
-            df = df.sort_values(
-                ["vehicle_journey_id", "auto_sequence_number"], ascending=True
+        for df in get_df_vehicle_journey_chunks(check):
+            missing_journey_code = df["vehicle_journey_code"].isnull() | (
+                df["vehicle_journey_code"] == ""
             )
-            df = df.groupby("vehicle_journey_id").first().reset_index()
-            for row in df.itertuples():
-                details = f"The ({row.start_time}) {row.direction} journey is missing a journey code."
-                observation.add_observation(
-                    details=details,
-                    vehicle_journey_id=row.vehicle_journey_id,
-                    service_pattern_stop_id=row.service_pattern_stop_id,
+            logger.info(f"Looking in the Dataframes: {df.size}")
+            if not df.empty:
+                logger.info("Iterating over rows to add observations")
+                df = find_journeys_missing_journey_code(
+                    StopSequences(df), missing_journey_code
                 )
+                for row in df.itertuples():
+                    details = f"The ({format_time_of_day(row.start_time)}) {row.direction} journey is missing a journey code."
+                    observation.add_observation(
+                        details=details,
+                        vehicle_journey_id=row.vehicle_journey_id,
+                        service_pattern_stop_id=row.service_pattern_stop_id,
+                    )
 
-                logger.info("Observation added in memory")
+                    logger.info("Observation added in memory")
 
-            observation.write_observations()
+                observation.write_observations()
 
     except Exception as e:
         status = DQSTaskResultStatus.FAILED.value
@@ -50,7 +48,18 @@ def lambda_worker(event, check) -> None:
     return
 
 
-def lambda_handler(event, context):
+def find_journeys_missing_journey_code(
+    sequences: StopSequences, missing_journey_code: pd.Series
+) -> pd.DataFrame:
+    """
+    First stop of each vehicle journey with a stop missing its journey code,
+    given which of the frame's stops are missing one
+    """
+    missing = sequences.journeys_with(missing_journey_code)
+    return sequences.rows(sequences.first_positions[missing])
+
+
+def handle_event(event, context):
     try:
         # Get timeout from context reduced by 15 sec
         timeout = get_timeout(context)
@@ -67,3 +76,7 @@ def lambda_handler(event, context):
         logger.error(f"Check status failed due to {e}")
         logger.exception(e)
         check.set_status(status)
+
+
+def lambda_handler(event, context):
+    return process_sqs_batch(event, context, handle_event)
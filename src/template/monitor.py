@@ -7,9 +7,14 @@ from task_results import TaskResult
 from dqs_report import DQReport
 from enums import DQSTaskResultStatus, DQSReportStatus, Timeouts
 from monitor_utils import map_pipeline_status, send_sqs_messages
+from query_metrics import query_metrics
 
 
-def lambda_handler(event, context):
+def monitor_pipeline():
+    """
+    Update the status of the pending DQ reports, and of their task results
+    when they have timed out
+    """
     logger.info("Starting the monitor pipeline lambda function.")
     dq_report_instance = DQReport()
     dq_reports = dq_report_instance.get_dq_reports_by_status(
@@ -77,3 +82,10 @@ def lambda_handler(event, context):
         logger.exception(e)
 
     logger.info("Monitor pipeline function completed successfully.")
+
+
+def lambda_handler(event, context):
+    try:
+        monitor_pipeline()
+    finally:
+        query_metrics.log_summary()
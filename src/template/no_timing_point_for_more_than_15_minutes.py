@@ -1,47 +1,99 @@
 from dqs_logger import logger
 from common import Check
 from enums import DQSTaskResultStatus
-from dataframes import get_df_vehicle_journey
+from dataframes import (
+    format_times_of_day,
+    get_df_vehicle_journey_chunks,
+    time_of_day_seconds,
+)
+from stop_sequences import StopSequences
 from organisation_txcfileattributes import OrganisationTxcFileAttributes
 from observation_results import ObservationResult
+import numpy as np
 import pandas as pd
 from time_out_handler import TimeOutHandler, get_timeout
+from sqs_batch import process_sqs_batch
 from dqs_exception import LambdaTimeOutError
 from datetime import timedelta
 
 _ALLOWED_IS_TIMING_POINT = True
+_MAX_GAP_SECONDS = timedelta(minutes=15).total_seconds()
 
 
-def filter_vehicle_journey(df: pd.DataFrame, observation: ObservationResult) -> bool:
+def _text(values: pd.Series) -> pd.Series:
+    return values.astype(object).where(values.notna(), None).astype(str)
+
+
+def find_timing_point_gaps(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Filter the service pattern stop whose departure time is having a
-    gap of more than 15 mins.
+    Find the timing point stops whose departure time is more than 15 mins
+    after the previous timing point of the same vehicle journey, in one pass
+    over every journey of the dataframe. The previous stop's columns are
+    added with a previous_ prefix
     """
+    return timing_point_gaps(StopSequences(df))
 
-    df["departure_time_new"] = pd.to_datetime(df["departure_time"], format="%H:%M:%S")
-    df["time_diff"] = df["departure_time_new"].diff()
-    df["departure_time"] = df["departure_time"].apply(lambda x: x.strftime("%H:%M"))
-    df["start_time"] = df["start_time"].apply(lambda x: x.strftime("%H:%M"))
-    df = df.reset_index()
 
-    for i in range(1, len(df)):
-        if df.loc[i, "time_diff"] > timedelta(minutes=15):
+def timing_point_gaps(sequences: StopSequences) -> pd.DataFrame:
+    """
+    find_timing_point_gaps of the stops of a StopSequences, which may be
+    shared with the other stop sequence checks
+    """
+    timing_points = sequences.subset(
+        sequences.frame["is_timing_point"] == _ALLOWED_IS_TIMING_POINT
+    )
+    same_journey = timing_points.same_journey_as_previous()
+    # A stop without a departure time is taken to be no gap, as is the first
+    # timing point of each journey
+    time_diff = (
+        time_of_day_seconds(timing_points.column("departure_time"))
+        .diff()
+        .where(same_journey)
+        .fillna(0)
+    )
+    gap_positions = np.flatnonzero((time_diff > _MAX_GAP_SECONDS).to_numpy(dtype=bool))
+    gaps = timing_points.rows(gap_positions)
+    previous = timing_points.rows(gap_positions - 1).add_prefix("previous_")
+    previous.index = gaps.index
+    return pd.concat([gaps, previous], axis=1)
 
-            prev_row = df.iloc[i - 1]
-            curr_row = df.iloc[i]
-            details = (
-                f"The link between the {prev_row['departure_time']} {prev_row['common_name']} ({prev_row['atco_code']}) and"
-                f" {curr_row['departure_time']} {curr_row['common_name']} ({curr_row['atco_code']}) timing point stops"
-                f" on the {prev_row['start_time']} {prev_row['direction']} journey is more than 15 minutes apart."
-                " The Traffic Commissioner recommends services to have timing points no more than 15 minutes apart."
-            )
-            observation.add_observation(
-                details=details,
-                vehicle_journey_id=int(prev_row.vehicle_journey_id),
-                service_pattern_stop_id=int(prev_row.service_pattern_stop_id),
-            )
 
-            logger.info("Observation added in memory")
+def filter_vehicle_journey(df: pd.DataFrame, observation: ObservationResult) -> None:
+    """
+    Add an observation for every link between timing point stops whose
+    departure times are more than 15 mins apart
+    """
+    gaps = find_timing_point_gaps(df)
+    if gaps.empty:
+        return
+    details = (
+        "The link between the "
+        + format_times_of_day(gaps["previous_departure_time"])
+        + " "
+        + _text(gaps["previous_common_name"])
+        + " ("
+        + _text(gaps["previous_atco_code"])
+        + ") and "
+        + format_times_of_day(gaps["departure_time"])
+        + " "
+        + _text(gaps["common_name"])
+        + " ("
+        + _text(gaps["atco_code"])
+        + ") timing point stops on the "
+        + format_times_of_day(gaps["previous_start_time"])
+        + " "
+        + _text(gaps["previous_direction"])
+        + " journey is more than 15 minutes apart."
+        " The Traffic Commissioner recommends services to have timing points no"
+        " more than 15 minutes apart."
+    )
+    for row, row_details in zip(gaps.itertuples(), details):
+        observation.add_observation(
+            details=row_details,
+            vehicle_journey_id=int(row.previous_vehicle_journey_id),
+            service_pattern_stop_id=int(row.previous_service_pattern_stop_id),
+        )
+    logger.info(f"{len(gaps)} observations added in memory")
 
 
 def lambda_worker(event, check) -> None:
@@ -61,18 +113,13 @@ def lambda_worker(event, check) -> None:
             logger.info(f"Ignoring check, ServiceMode: {mode}")
         else:
             observation = ObservationResult(check)
-            df = get_df_vehicle_journey(check)
-            logger.info(f"Looking in the Dataframes: {df.size}")
-            if not df.empty:
-                # Filter the timing point stops
-                df = df[df["is_timing_point"] == _ALLOWED_IS_TIMING_POINT]
-                df = df.sort_values(by="auto_sequence_number")
-                df.groupby("vehicle_journey_id").apply(
-                    filter_vehicle_journey, observation
-                )
-
-                # Write the observations to database
-                observation.write_observations()
+            for df in get_df_vehicle_journey_chunks(check):
+                logger.info(f"Looking in the Dataframes: {df.size}")
+                if not df.empty:
+                    filter_vehicle_journey(df, observation)
+
+                    # Write the observations to database
+                    observation.write_observations()
 
     except Exception as e:
         status = DQSTaskResultStatus.FAILED.value
@@ -84,7 +131,7 @@ def lambda_worker(event, check) -> None:
     return
 
 
-def lambda_handler(event, context):
+def handle_event(event, context):
     try:
         # Get timeout from context reduced by 15 sec
         timeout = get_timeout(context)
@@ -101,3 +148,7 @@ def lambda_handler(event, context):
         logger.error(f"Check status failed due to {e}")
         logger.exception(e)
         check.set_status(status)
+
+
+def lambda_handler(event, context):
+    return process_sqs_batch(event, context, handle_event)
@@ -0,0 +1,21 @@
+from bods_db import BodsDB
+from dqs_logger import logger
+from naptan_reference import publish_naptan_reference
+from query_metrics import query_metrics
+
+
+def lambda_handler(event, context):
+    """
+    Scheduled build of the NaPTAN reference, so the checks read its version
+    and the reference from the persistence backend rather than each
+    querying NaPTAN for them
+    """
+    try:
+        version = publish_naptan_reference(BodsDB().read_session)
+        return {"version": version}
+    except Exception as e:
+        logger.error(f"Publish NaPTAN reference Lambda failed with: {e}")
+        logger.exception(e)
+        raise
+    finally:
+        query_metrics.log_summary()
@@ -4,6 +4,7 @@ from enums import DQSTaskResultStatus
 from observation_results import ObservationResult
 from dataframes import get_df_vehicle_journey, get_naptan_availablilty
 from time_out_handler import TimeOutHandler, get_timeout
+from sqs_batch import process_sqs_batch
 from dqs_exception import LambdaTimeOutError
 
 
@@ -12,7 +13,15 @@ def lambda_worker(event, check) -> None:
     status = DQSTaskResultStatus.SUCCESS.value
     try:
         observation = ObservationResult(check)
-        df = get_df_vehicle_journey(check)
+        df = get_df_vehicle_journey(
+            check,
+            columns=[
+                "atco_code",
+                "common_name",
+                "vehicle_journey_id",
+                "service_pattern_stop_id",
+            ],
+        )
         logger.info(f"Looking in the Dataframes: {df.size}")
         if not df.empty:
             # Set of atco codes with lower case
@@ -55,7 +64,7 @@ def lambda_worker(event, check) -> None:
     return
 
 
-def lambda_handler(event, context):
+def handle_event(event, context):
     try:
         # Get timeout from context reduced by 15 sec
         timeout = get_timeout(context)
@@ -72,3 +81,7 @@ def lambda_handler(event, context):
         logger.error(f"Check status failed due to {e}")
         logger.exception(e)
         check.set_status(status)
+
+
+def lambda_handler(event, context):
+    return process_sqs_batch(event, context, handle_event)
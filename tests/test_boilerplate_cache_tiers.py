@@ -0,0 +1,48 @@
+from os import utime
+from time import time
+
+from src.boilerplate.cache_tiers import DiskTier
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    tier = DiskTier(max_bytes=10, directory=str(tmp_path))
+    tier.put("a", b"1234")
+    tier.put("b", b"1234")
+    # Make b the more recently used whatever the file system's resolution
+    utime(tier._path("a"), (time() - 60, time() - 60))
+    tier.put("c", b"1234")
+
+    assert not tier.contains("a")
+    assert tier.get("b") == b"1234"
+    assert tier.get("c") == b"1234"
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_disk_tier_skips_values_over_budget(tmp_path):
+    tier = DiskTier(max_bytes=4, directory=str(tmp_path))
+    tier.put("a", b"12345")
+    assert not tier.contains("a")
+    assert not DiskTier(max_bytes=0, directory=str(tmp_path)).enabled
+
+
+def test_disk_tier_is_shared_between_instances(tmp_path):
+    DiskTier(max_bytes=10, directory=str(tmp_path)).put("a", b"1234")
+    tier = DiskTier(max_bytes=10, directory=str(tmp_path))
+
+    assert tier.get("a") == b"1234"
+    tier.put("a", b"5678")
+    assert tier.get("a") == b"5678"
+    tier.clear()
+    assert tier.get("a") is None
+    assert tier.stats() == {"hits": 0, "misses": 1}
+
+
+def test_disk_tier_expires_values_after_its_ttl(tmp_path):
+    tier = DiskTier(max_bytes=10, directory=str(tmp_path), ttl=60)
+    tier.put("a", b"1234")
+    tier.put("b", b"1234")
+    utime(tier._path("a"), (time(), time() - 61))
+
+    assert tier.get("a") is None
+    assert not tier.contains("a")
+    assert tier.get("b") == b"1234"
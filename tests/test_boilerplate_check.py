@@ -1,5 +1,5 @@
 from src.boilerplate.common import Check
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 from pytest import raises
 from json import dumps
 from pydantic_core import ValidationError
@@ -8,7 +8,6 @@ from src.boilerplate.observation_results import ObservationResult
 from .mock_db import MockedDB
 from sqlalchemy import select
 
-
 SAMPLE_SQS_EVENT = {
     "Records": [{"body": dumps({"file_id": 50, "check_id": 1, "result_id": 1})}]
 }
@@ -227,3 +226,97 @@ def test_add_observations():
     )
     for row in added_observations:
         print(row.__dict__)
+
+
+def _psycopg2_check():
+    check = MagicMock()
+    check.result_id = 1
+    connection = check.db.session.connection.return_value
+    connection.dialect.driver = "psycopg2"
+    cursor = connection.connection.cursor.return_value.__enter__.return_value
+    return check, cursor
+
+
+@patch("src.boilerplate.observation_results.OBSERVATION_BATCH_SIZE", 2)
+def test_observations_are_copied_in_batches():
+    check, cursor = _psycopg2_check()
+    copied = []
+    cursor.copy_expert.side_effect = lambda sql, buffer: copied.append(buffer.read())
+    observations = ObservationResult(check)
+
+    observations.add_observation(details="Tab\there", vehicle_journey_id=4.0)
+    observations.add_observation(
+        details="Line\nbreak", service_pattern_stop_id=float("nan")
+    )
+    assert observations.observations == []
+    observations.add_observation(
+        details="Last", serviced_organisation_vehicle_journey_id=9
+    )
+    observations.write_observations()
+
+    assert cursor.copy_expert.call_args.args[0].startswith(
+        "COPY dqs_observationresults (details, taskresults_id,"
+    )
+    assert copied == [
+        "Tab\\there\t1\t4\t\\N\t\\N\nLine\\nbreak\t1\t\\N\t\\N\t\\N\n",
+        "Last\t1\t\\N\t\\N\t9\n",
+    ]
+    check.validate_requested_check.assert_called_once()
+    check.db.session.commit.assert_called_once()
+
+
+@patch("src.boilerplate.observation_results.OBSERVATION_BATCH_SIZE", 1)
+@patch("src.boilerplate.observation_results.execute_values")
+def test_observations_fall_back_to_insert_values_when_copy_fails(execute_values):
+    check, cursor = _psycopg2_check()
+    cursor.copy_expert.side_effect = Exception("COPY not permitted")
+    observations = ObservationResult(check)
+
+    observations.add_observation(details="First", vehicle_journey_id=1)
+    observations.add_observation(details="Second", vehicle_journey_id=2)
+    observations.write_observations()
+
+    assert cursor.copy_expert.call_count == 1
+    assert [call.args[2] for call in execute_values.call_args_list] == [
+        [("First", 1, 1, None, None)],
+        [("Second", 1, 2, None, None)],
+    ]
+    check.db.session.commit.assert_called_once()
+
+
+def test_set_status_only_moves_on_from_pending():
+    mock_db = MockedDB()
+    test_task_result = mock_db.classes.dqs_taskresults(
+        id=1, checks_id=1, status="PENDING", transmodel_txcfileattributes_id=50
+    )
+    mock_db.session.add(test_task_result)
+    mock_db.session.flush()
+    check = Check(SAMPLE_SQS_EVENT, "")
+    with patch.object(check, "_db", new=mock_db):
+        check.set_status("SUCCESS")
+        with raises(ValueError):
+            check.set_status("TIMEOUT")
+    result = mock_db.session.scalars(
+        select(mock_db.classes.dqs_taskresults).where(
+            mock_db.classes.dqs_taskresults.id == 1
+        )
+    ).one()
+    assert result.status == "SUCCESS"
+    assert result.modified is not None
+
+
+@patch("src.boilerplate.common.check_registry")
+def test_state_machine_event_fetches_result_once(check_registry):
+    check_registry.get_check_id.return_value = 1
+    mock_db = MockedDB()
+    test_task_result = mock_db.classes.dqs_taskresults(
+        id=7, checks_id=1, status="PENDING", transmodel_txcfileattributes_id=50
+    )
+    mock_db.session.add(test_task_result)
+    mock_db.session.flush()
+    check = Check({"file_id": 50}, "missing_journey_code")
+    with patch.object(check, "_db", new=mock_db):
+        assert check.result_id == 7
+        with patch.object(mock_db.session, "scalar") as scalar:
+            assert check.validate_requested_check()
+            scalar.assert_not_called()
@@ -1,10 +1,29 @@
 import unittest
-from unittest.mock import patch
+from datetime import time
+from io import SEEK_END
+from unittest.mock import MagicMock, patch
 from boto3 import client, setup_default_session
+from fakeredis import FakeRedisConnection, FakeServer
+from redis import ConnectionPool, Redis
 from moto import mock_aws
 from pandas import DataFrame
+from pytest import fixture
 
-from src.boilerplate.data_persistence import PersistedData
+from cache_tiers import disk_tier
+from sqlalchemy import Column, Integer, MetaData, String, Table, select
+from src.boilerplate.data_persistence import (
+    PersistedData,
+    S3ObjectFile,
+    flush_persistence,
+    statement_version,
+)
+
+
+@fixture(autouse=True)
+def cache_tiers(tmp_path):
+    with patch.object(disk_tier, "_directory", str(tmp_path)):
+        disk_tier.clear()
+        yield
 
 
 class TestBoilerplateDataPersistence(unittest.TestCase):
@@ -14,6 +33,7 @@ class TestBoilerplateDataPersistence(unittest.TestCase):
         CACHE_BUCKET="MyBucket",
         AWS_ACCESS_KEY_ID="SOME_KEY",
         AWS_SECRET_ACCESS_KEY="SOME_SECRET_KEY",
+        CACHE_WRITE_BEHIND="false",
     )
     invalid_s3_environ = dict(CACHE_BACKEND="S3", S3_BUCKET="MyBucket")
 
@@ -39,11 +59,14 @@ class TestBoilerplateDataPersistence(unittest.TestCase):
         )
 
     @patch.dict("src.boilerplate.data_persistence.environ", redis_backend, clear=True)
-    def test_invalid_backend_throws_error(self):
+    def test_backend_redis_fails_with_no_url(self):
         with self.assertRaises(ValueError) as ve:
             PersistedData()
         ex: ValueError = ve.exception
-        self.assertEqual(ex.__str__(), "Redis Backend is not implemented")
+        self.assertEqual(
+            ex.__str__(),
+            "REDIS_URL is not set in environment for Redis Backend Persistence",
+        )
 
     @patch.dict("src.boilerplate.data_persistence.environ", invalid_backend, clear=True)
     def test_invalid_backend_has_no_effects(self):
@@ -111,3 +134,320 @@ class TestBoilerplateDataPersistence(unittest.TestCase):
         ldf = pd.get("MyDF")
         self.assertNotEqual(id(ldf), id(df))  # Not the same object returned
         self.assertTrue(df.equals(ldf))  # But the contents are identical
+
+    @mock_aws
+    @patch.dict(
+        "src.boilerplate.data_persistence.environ",
+        dict(valid_s3_environ, CACHE_FORMAT="PARQUET"),
+        clear=True,
+    )
+    @patch.object(disk_tier, "max_bytes", 0)
+    def test_dataframe_is_saved_as_parquet_and_projected(self):
+        setup_default_session()
+        s3 = client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="MyBucket")
+
+        df = DataFrame(
+            {
+                "vehicle_journey_id": range(100000),
+                "atco_code": [f"0100BRP{i % 50}" for i in range(100000)],
+                "departure_time": [time(8, i % 60) for i in range(100000)],
+                "naptan_stop_id": [None if i % 10 else i for i in range(100000)],
+                "common_name": [f"Stop {i}" for i in range(100000)],
+            }
+        )
+        pd = PersistedData()
+        pd.save("MyDF", df)
+        body = s3.get_object(Bucket="MyBucket", Key="MyDF")["Body"].read()
+        self.assertEqual(body[:4], b"PAR1")
+        self.assertTrue(df.equals(pd.get("MyDF")))
+
+        sources = []
+        with patch(
+            "src.boilerplate.data_persistence.S3ObjectFile",
+            side_effect=lambda *args, **kwargs: sources.append(
+                S3ObjectFile(*args, **kwargs)
+            )
+            or sources[-1],
+        ), patch("src.boilerplate.data_persistence.RANGED_GET_TAIL_SIZE", 16 * 1024):
+            ldf = pd.get("MyDF", columns=["atco_code", "departure_time"])
+        self.assertTrue(df[["atco_code", "departure_time"]].equals(ldf))
+        self.assertLess(sources[0].bytes_read, len(body))
+
+        ldf = pd.get("MyDF", columns=["atco_code"])
+        self.assertTrue(df[["atco_code"]].equals(ldf))
+
+    @mock_aws
+    @patch.dict(
+        "src.boilerplate.data_persistence.environ",
+        dict(valid_s3_environ, CACHE_FORMAT="PARQUET"),
+        clear=True,
+    )
+    def test_tiers_keep_column_projection(self):
+        setup_default_session()
+        s3 = client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="MyBucket")
+
+        df = DataFrame(
+            {
+                "vehicle_journey_id": range(100000),
+                "common_name": [f"Stop {i}" for i in range(100000)],
+            }
+        )
+        pd = PersistedData()
+        pd.save("MyDF", df)
+        body = s3.get_object(Bucket="MyBucket", Key="MyDF")["Body"].read()
+        disk_tier.clear()
+
+        sources = []
+        with patch(
+            "src.boilerplate.data_persistence.S3ObjectFile",
+            side_effect=lambda *args, **kwargs: sources.append(
+                S3ObjectFile(*args, **kwargs)
+            )
+            or sources[-1],
+        ), patch("src.boilerplate.data_persistence.RANGED_GET_TAIL_SIZE", 16 * 1024):
+            ldf = pd.get_or_miss("MyDF", columns=["vehicle_journey_id"])
+            self.assertTrue(df[["vehicle_journey_id"]].equals(ldf))
+            self.assertLess(sources[0].bytes_read, len(body))
+
+            # The projection is cached under its own key, the whole value
+            # isn't
+            ldf = pd.get_or_miss("MyDF", columns=["vehicle_journey_id"])
+            self.assertTrue(df[["vehicle_journey_id"]].equals(ldf))
+            self.assertEqual(len(sources), 1)
+            self.assertFalse(disk_tier.contains("MyDF"))
+            self.assertIsNone(pd.get_or_miss("Other-DF", columns=["common_name"]))
+
+    @mock_aws
+    @patch.dict(
+        "src.boilerplate.data_persistence.environ",
+        dict(valid_s3_environ, CACHE_FORMAT="PICKLE"),
+        clear=True,
+    )
+    def test_dataframe_is_pickled_when_configured(self):
+        setup_default_session()
+        s3 = client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="MyBucket")
+
+        df = DataFrame({"vehicle_journey_id": [1, 2], "atco_code": ["A", "B"]})
+        pd = PersistedData()
+        pd.save("MyDF", df)
+        body = s3.get_object(Bucket="MyBucket", Key="MyDF")["Body"].read()
+        self.assertNotEqual(body[:4], b"PAR1")
+        self.assertTrue(df[["atco_code"]].equals(pd.get("MyDF", columns=["atco_code"])))
+
+    @mock_aws
+    @patch.dict(
+        "src.boilerplate.data_persistence.environ", valid_s3_environ, clear=True
+    )
+    def test_get_or_miss_remembers_misses(self):
+        setup_default_session()
+        client("s3", region_name="us-east-1").create_bucket(Bucket="MyBucket")
+
+        pd = PersistedData()
+        with patch.object(
+            pd.backend, "find_value", wraps=pd.backend.find_value
+        ) as find_value:
+            self.assertIsNone(pd.get_or_miss("Some-Key"))
+            self.assertIsNone(pd.get_or_miss("Some-Key"))
+            self.assertFalse(pd.exists("Some-Key"))
+            find_value.assert_called_once_with("Some-Key")
+
+            pd.save("Some-Key", "Some-Value")
+            self.assertEqual(pd.get_or_miss("Some-Key"), "Some-Value")
+            find_value.assert_called_once()
+
+        disk_tier.clear()
+        self.assertEqual(pd.get_or_miss("Some-Key"), "Some-Value")
+
+    @mock_aws
+    @patch.object(disk_tier, "max_bytes", 0)
+    @patch.dict(
+        "src.boilerplate.data_persistence.environ", valid_s3_environ, clear=True
+    )
+    def test_get_or_miss_without_tiers(self):
+        setup_default_session()
+        client("s3", region_name="us-east-1").create_bucket(Bucket="MyBucket")
+
+        df = DataFrame({"vehicle_journey_id": [1, 2], "atco_code": ["A", "B"]})
+        pd = PersistedData()
+        s3 = pd.backend._s3._s3_client
+        with patch.object(s3, "head_object") as head_object, patch.object(
+            s3, "get_object", wraps=s3.get_object
+        ) as get_object:
+            self.assertIsNone(pd.get_or_miss("MyDF"))
+            self.assertIsNone(pd.get_or_miss("MyDF", columns=["atco_code"]))
+            pd.save("MyDF", df)
+            self.assertTrue(df.equals(pd.get_or_miss("MyDF")))
+            self.assertTrue(
+                df[["atco_code"]].equals(pd.get_or_miss("MyDF", columns=["atco_code"]))
+            )
+        # One GET each, the projected read of a small object downloading it
+        # whole with its suffix range
+        head_object.assert_not_called()
+        self.assertEqual(get_object.call_count, 4)
+        self.assertEqual(get_object.call_args.kwargs["Range"], "bytes=-1048576")
+
+    def test_statement_version_follows_query_and_schema(self):
+        stops = Table(
+            "stops",
+            MetaData(),
+            Column("id", Integer),
+            Column("atco_code", String),
+        )
+        version = statement_version(select(stops.c.id, stops.c.atco_code))
+
+        self.assertEqual(
+            version, statement_version(select(stops.c.id, stops.c.atco_code))
+        )
+        self.assertNotEqual(version, statement_version(select(stops.c.id)))
+        self.assertNotEqual(
+            version,
+            statement_version(
+                select(stops.c.id, stops.c.atco_code).where(stops.c.id > 1)
+            ),
+        )
+
+
+class TestS3ObjectFile(unittest.TestCase):
+
+    def test_reads_only_requested_ranges(self):
+        data = bytes(range(256)) * 4
+        s3 = MagicMock()
+        s3.get_object_range.side_effect = lambda bucket, key, start, end: data[
+            start : end + 1
+        ]
+        source = S3ObjectFile(s3, "MyBucket", "MyDF", len(data))
+
+        source.seek(-8, SEEK_END)
+        self.assertEqual(source.read(8), data[-8:])
+        source.seek(100)
+        self.assertEqual(source.read(10), data[100:110])
+        self.assertEqual(source.read(0), b"")
+        source.seek(len(data))
+        self.assertEqual(source.read(10), b"")
+
+        self.assertEqual(source.bytes_read, 18)
+        self.assertEqual(source.requests, 2)
+        s3.get_object_range.assert_called_with(
+            bucket="MyBucket", key="MyDF", start=100, end=109
+        )
+
+    def test_reads_from_the_tail_without_requests(self):
+        data = bytes(range(256)) * 4
+        s3 = MagicMock()
+        s3.get_object_range.side_effect = lambda bucket, key, start, end: data[
+            start : end + 1
+        ]
+        source = S3ObjectFile(s3, "MyBucket", "MyDF", len(data), tail=data[-100:])
+
+        source.seek(-8, SEEK_END)
+        self.assertEqual(source.read(8), data[-8:])
+        self.assertEqual(source.requests, 0)
+        source.seek(-110, SEEK_END)
+        self.assertEqual(source.read(20), data[-110:-90])
+        self.assertEqual(source.bytes_read, 10)
+        s3.get_object_range.assert_called_once_with(
+            bucket="MyBucket", key="MyDF", start=len(data) - 110, end=len(data) - 101
+        )
+
+
+@patch.dict(
+    "src.boilerplate.data_persistence.environ",
+    dict(
+        CACHE_BACKEND="REDIS",
+        REDIS_URL="redis://localhost:6379/0",
+        CACHE_WRITE_BEHIND="false",
+    ),
+    clear=True,
+)
+class TestBoilerplateRedisPersistence(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = ConnectionPool(
+            connection_class=FakeRedisConnection, server=FakeServer()
+        )
+        self.redis = Redis(connection_pool=self.pool)
+        patcher = patch(
+            "src.boilerplate.data_persistence.get_redis_pool", return_value=self.pool
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_save_and_load_with_ttl(self):
+        pd = PersistedData()
+        pd.save("Some-Key", "Some-Value")
+        pd.save("Short-Key", "Some-Value", ttl=60)
+        self.assertTrue(pd.exists("Some-Key"))
+        self.assertFalse(pd.exists("Some-Other-Key"))
+        self.assertEqual(pd.get("Some-Key"), "Some-Value")
+        self.assertEqual(self.redis.ttl("Some-Key"), 24 * 60 * 60)
+        self.assertEqual(self.redis.ttl("Short-Key"), 60)
+
+    def test_retrieval_of_non_existant_key(self):
+        with self.assertRaises(KeyError):
+            PersistedData().get("Some-Other-Key")
+
+    @patch("src.boilerplate.data_persistence.REDIS_CHUNK_SIZE", 1024)
+    @patch.object(disk_tier, "max_bytes", 0)
+    def test_large_dataframe_is_chunked(self):
+        df = DataFrame(
+            {
+                "vehicle_journey_id": range(1000),
+                "atco_code": [f"0100BRP{i}" for i in range(1000)],
+            }
+        )
+        pd = PersistedData()
+        pd.save("MyDF", df)
+        self.assertTrue(self.redis.get("MyDF").startswith(b"DQS-CHUNKED:"))
+        self.assertTrue(self.redis.exists("MyDF:chunk:1"))
+        self.assertTrue(pd.exists("MyDF"))
+        self.assertTrue(df.equals(pd.get("MyDF")))
+        self.assertTrue(df[["atco_code"]].equals(pd.get("MyDF", columns=["atco_code"])))
+
+        self.redis.delete("MyDF:chunk:1")
+        self.assertFalse(pd.exists("MyDF"))
+        with self.assertRaises(KeyError):
+            pd.get("MyDF")
+
+    @patch("src.boilerplate.data_persistence.REDIS_MAX_VALUE_SIZE", 10)
+    def test_value_over_size_limit_is_not_persisted(self):
+        pd = PersistedData()
+        pd.save("Some-Key", "Some-Value-Over-The-Limit")
+        self.assertFalse(self.redis.exists("Some-Key"))
+
+    @patch.dict("src.boilerplate.data_persistence.environ", CACHE_WRITE_BEHIND="true")
+    def test_write_behind_is_flushed(self):
+        df = DataFrame({"vehicle_journey_id": [1, 2], "atco_code": ["A", "B"]})
+        pd = PersistedData()
+        with patch.object(pd, "_save", wraps=pd._save) as save:
+            pd.save("MyDF", df)
+            df["atco_code_lower"] = df["atco_code"].str.lower()
+            flush_persistence()
+            save.assert_called_once()
+            # Serialised before the check carries on, not copied
+            self.assertIsInstance(save.call_args.args[1], bytes)
+        self.assertEqual(
+            pd.get("MyDF").columns.tolist(), ["vehicle_journey_id", "atco_code"]
+        )
+
+        pd.save("Some-Key", "Some-Value", wait=True)
+        self.assertEqual(self.redis.exists("Some-Key"), 1)
+
+        with patch.object(pd.backend, "save_value", side_effect=ValueError("down")):
+            pd.save("Other-Key", "Some-Value")
+            flush_persistence()
+        self.assertFalse(pd.exists("Other-Key"))
+
+    def test_reads_fill_the_tiers_above(self):
+        pd = PersistedData()
+        pd.save("Some-Key", "Some-Value")
+        disk_tier.clear()
+
+        self.assertEqual(pd.get("Some-Key"), "Some-Value")
+        self.assertEqual(PersistedData.stats(), {"disk": {"hits": 0, "misses": 1}})
+        self.redis.delete("Some-Key")
+        self.assertTrue(pd.exists("Some-Key"))
+        self.assertEqual(pd.get("Some-Key"), "Some-Value")
+        self.assertEqual(PersistedData.stats(), {"disk": {"hits": 2, "misses": 1}})
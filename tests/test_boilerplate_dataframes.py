@@ -0,0 +1,488 @@
+from datetime import time
+from unittest.mock import MagicMock, patch
+import pandas as pd
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Time,
+    create_engine,
+    select,
+)
+from sqlalchemy.dialects.postgresql.psycopg2 import PGDialect_psycopg2
+from sqlalchemy.orm import Session
+
+from src.boilerplate.data_persistence import (
+    PersistenceFormat,
+    deserialise,
+    serialise,
+)
+from src.boilerplate.naptan_reference import NaptanReference
+from query_metrics import query_metrics
+from src.boilerplate.dataframes import (
+    TransmodelSnapshot,
+    clear_snapshot,
+    compact_vehicle_journey_df,
+    format_time_of_day,
+    get_df_missing_bus_working_number,
+    get_df_stop_type,
+    get_df_vehicle_journey,
+    get_df_vehicle_journey_chunks,
+    get_operating_date_exception_df,
+    get_naptan_availablilty,
+    get_operating_profile_df,
+    get_vehicle_journey_lookups,
+    get_vj_duplicate_journey_code,
+    load_snapshot,
+    read_sql_copy,
+    stream_vehicle_journey_chunks,
+)
+
+
+def _stops_check(journey_stop_counts):
+    engine = create_engine("sqlite://")
+    metadata = MetaData()
+    stops = Table(
+        "stops",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("vehicle_journey_id", Integer),
+        Column("auto_sequence_number", Integer),
+    )
+    metadata.create_all(engine)
+    rows = [
+        {"vehicle_journey_id": journey_id, "auto_sequence_number": sequence}
+        for journey_id, count in journey_stop_counts.items()
+        for sequence in range(count)
+    ]
+    session = Session(engine)
+    if rows:
+        session.execute(stops.insert(), rows)
+    check = MagicMock()
+    check.db.read_session = session
+    statement = select(
+        stops.c.vehicle_journey_id, stops.c.auto_sequence_number
+    ).order_by(stops.c.vehicle_journey_id, stops.c.auto_sequence_number)
+    return check, statement
+
+
+def test_stream_chunks_never_split_a_vehicle_journey():
+    journey_stop_counts = {1: 3, 2: 5, 3: 1, 4: 4, 5: 2}
+    check, statement = _stops_check(journey_stop_counts)
+
+    chunks = list(stream_vehicle_journey_chunks(check, statement, 4))
+
+    assert len(chunks) > 1
+    seen = set()
+    for chunk in chunks:
+        journeys = set(chunk["vehicle_journey_id"])
+        assert not journeys & seen
+        seen |= journeys
+    df = pd.concat(chunks, ignore_index=True)
+    assert df.groupby("vehicle_journey_id").size().to_dict() == journey_stop_counts
+
+
+def test_stream_chunks_empty_result():
+    check, statement = _stops_check({})
+    assert list(stream_vehicle_journey_chunks(check, statement, 4)) == []
+
+
+@patch.dict("src.boilerplate.dataframes.environ", {}, clear=True)
+@patch("src.boilerplate.dataframes.get_df_vehicle_journey")
+def test_chunks_default_to_whole_dataframe(mock_get_df_vehicle_journey):
+    df = pd.DataFrame({"vehicle_journey_id": [1, 2]})
+    mock_get_df_vehicle_journey.return_value = df
+    check = MagicMock()
+
+    assert list(get_df_vehicle_journey_chunks(check)) == [df]
+    mock_get_df_vehicle_journey.assert_called_once_with(check)
+
+
+def test_read_sql_copy_parses_typed_columns():
+    stops = Table(
+        "stops",
+        MetaData(),
+        Column("vehicle_journey_id", Integer),
+        Column("atco_code", String),
+        Column("is_timing_point", Boolean),
+        Column("departure_time", Time),
+    )
+    statement = select(stops).where(stops.c.vehicle_journey_id > 5)
+    csv = (
+        "vehicle_journey_id,atco_code,is_timing_point,departure_time\n"
+        "6,0100,t,05:40:00\n"
+        "7,\\N,f,\\N\n"
+    )
+    connection = MagicMock()
+    connection.dialect = PGDialect_psycopg2()
+    cursor = connection.connection.cursor.return_value.__enter__.return_value
+    cursor.mogrify.return_value = b"SELECT 1"
+    cursor.copy_expert.side_effect = lambda sql, buffer: buffer.write(csv.encode())
+
+    query_metrics.reset()
+    df = read_sql_copy(statement, connection)
+    summary = query_metrics.summary()
+    query_metrics.reset()
+
+    assert [(entry["statement"][:9], entry["rows"]) for entry in summary] == [
+        ("COPY (SEL", 2)
+    ]
+    assert "vehicle_journey_id > ?" in summary[0]["statement"]
+    assert cursor.mogrify.call_args.args[1] == {"vehicle_journey_id_1": 5}
+    assert cursor.copy_expert.call_args.args[0].startswith("COPY (SELECT 1) TO STDOUT")
+    assert df["vehicle_journey_id"].tolist() == [6, 7]
+    assert df["atco_code"].iloc[0] == "0100"
+    assert pd.isna(df["atco_code"].iloc[1])
+    assert df["is_timing_point"].tolist() == [True, False]
+    assert str(df["departure_time"].iloc[0]) == "05:40:00"
+
+
+def _snapshot_frames(snapshot):
+    snapshot.service_patterns = pd.DataFrame(
+        {"service_id": [1], "servicepattern_id": [10]}
+    )
+    snapshot.stops = pd.DataFrame(
+        {
+            "id": [100, 101, 102, 103],
+            "service_pattern_id": [10, 10, 10, 10],
+            "vehicle_journey_id": [1000, 1000, 1001, None],
+            "naptan_stop_id": [7, None, 8, None],
+            "stop_activity_id": [1, 2, 1, 1],
+            "auto_sequence_number": [1, 0, 0, 0],
+            "atco_code": ["0100A", "0100B", "0100C", "0100D"],
+            "departure_time": ["08:00:00", "07:50:00", "09:00:00", None],
+            "is_timing_point": [True, False, True, False],
+            "txc_common_name": ["First", "Second", "Third", "Fourth"],
+        }
+    )
+    snapshot.stop_activities = pd.DataFrame(
+        {"id": [1, 2], "name": ["pickUp", "setDown"]}
+    )
+    snapshot.vehicle_journeys = pd.DataFrame(
+        {
+            "id": [1000, 1001],
+            "service_pattern_id": [10, 10],
+            "start_time": ["07:50:00", "09:00:00"],
+            "direction": ["inbound", "outbound"],
+            "journey_code": ["1", "2"],
+            "line_ref": ["L1", "L1"],
+            "block_number": [None, "B1"],
+        }
+    )
+    snapshot.operating_profiles = pd.DataFrame(
+        {"vehicle_journey_id": [1000, 1000, 1000], "day_of_week": [1, 0, 1]}
+    )
+    snapshot.operating_dates = pd.DataFrame(
+        {
+            "vehicle_journey_id": [1001, 1001],
+            "operating_date": pd.to_datetime(["2024-02-01", "2024-01-01"]),
+        }
+    )
+    snapshot.non_operating_dates = pd.DataFrame(
+        {"vehicle_journey_id": [], "non_operating_date": []}
+    )
+    snapshot.serviced_organisation_vehicle_journeys = pd.DataFrame(
+        {
+            "id": [1],
+            "vehicle_journey_id": [1000],
+            "serviced_organisation_id": [5],
+            "operating_on_working_days": [True],
+        }
+    )
+    snapshot.serviced_organisations = pd.DataFrame(
+        {"id": [5], "name": ["School"], "organisation_code": ["SCH"]}
+    )
+    snapshot.serviced_organisation_working_days = pd.DataFrame(
+        {
+            "serviced_organisation_vehicle_journey_id": [1],
+            "start_date": ["2024-01-01"],
+            "end_date": ["2024-07-01"],
+        }
+    )
+    snapshot.naptan_stop_points = pd.DataFrame(
+        {
+            "id": [7, 8],
+            "atco_code": ["0100A", "0100C"],
+            "common_name": ["Naptan First", None],
+            "stop_type": ["BCT", "RSE"],
+        }
+    )
+    snapshot.atco_codes = {"0100a", "0100b", "0100c", "0100d"}
+
+
+@patch.object(TransmodelSnapshot, "_load", _snapshot_frames)
+def test_snapshot_frames_match_queries():
+    check = MagicMock()
+    check.file_id = 50
+    snapshot = load_snapshot(check)
+    try:
+        df = get_df_vehicle_journey(check)
+        assert df.columns.tolist()[:3] == [
+            "is_timing_point",
+            "naptan_stop_id",
+            "auto_sequence_number",
+        ]
+        # In journey and sequence order, as the persisted dataframe is
+        assert df["service_pattern_stop_id"].tolist() == [101, 100, 102]
+        assert df["common_name"].tolist() == ["Second", "Naptan First", "Third"]
+        assert df["activity"].tolist() == ["setDown", "pickUp", "pickUp"]
+
+        df = get_df_missing_bus_working_number(check)
+        assert df["vehicle_journey_id"].tolist() == [1000]
+        assert df["service_pattern_stop_id"].tolist() == [100]
+
+        df = snapshot.stop_type_df(["BCT"])
+        assert df["service_pattern_stop_id"].tolist() == [102]
+        assert df["common_name"].tolist() == ["Third"]
+
+        df = get_operating_date_exception_df(check, [1000, 1001])
+        assert df["operating_date"].tolist() == [["2024-01-01", "2024-02-01"]]
+        assert df["vehicle_journey_id"].tolist() == [1001]
+
+        df = get_vj_duplicate_journey_code(check).set_index("vehicle_journey_id")
+        assert df.loc[1000, "service_pattern_stop_id"] == 101
+        assert df.loc[1000, "day_of_week"] == [0, 1]
+        assert df.loc[1000, "serviced_organisation_id"] == ["5"]
+        assert df.loc[1001, "day_of_week"] == "[]"
+        check.db.read_session.connection.assert_not_called()
+
+        df = snapshot.serviced_organisation_df()
+        assert df["serviced_organisation_name"].tolist() == ["School"]
+        assert df["serviced_organisation_vehicle_journey_id"].tolist() == [1]
+
+        df = snapshot.naptan_availability_df({"0100a", "0100b"})
+        assert df["atco_code"].tolist() == ["0100A"]
+        assert df["atco_code_exists"].tolist() == [False]
+    finally:
+        clear_snapshot()
+
+
+@patch.object(TransmodelSnapshot, "_load", _snapshot_frames)
+@patch("src.boilerplate.dataframes.PersistedData")
+def test_snapshot_is_reused_until_cleared(persisted_data):
+    check = MagicMock()
+    check.file_id = 50
+    vehicle_journeys = pd.DataFrame({"vehicle_journey_id": [1, 1, 2]})
+    persisted_data.return_value.get_or_miss.return_value = vehicle_journeys
+    load_snapshot(check)
+    try:
+        assert len(get_df_vehicle_journey(check)) == 3
+        assert len(list(get_df_vehicle_journey_chunks(check))) == 1
+        other = MagicMock()
+        other.file_id = 51
+        with patch.dict("src.boilerplate.dataframes.environ", {}, clear=True):
+            assert get_df_vehicle_journey(other) is vehicle_journeys
+        persisted_data.assert_called_once()
+    finally:
+        clear_snapshot()
+    persisted_data.reset_mock()
+    with patch.dict("src.boilerplate.dataframes.environ", {}, clear=True):
+        assert get_df_vehicle_journey(check) is vehicle_journeys
+    persisted_data.assert_called_once()
+
+
+def test_compact_vehicle_journey_df_survives_persistence():
+    df = pd.DataFrame(
+        {
+            "is_timing_point": [True, False, True, None],
+            "naptan_stop_id": [7.0, None, 7.0, 8.0],
+            "auto_sequence_number": [0, 1, 0, 1],
+            "atco_code": ["0100A", "0100B", "0100A", "0100B"],
+            "departure_time": [time(5, 40), time(5, 59, 30), None, time(7, 0)],
+            "service_pattern_stop_id": [100, 101, 102, 2**40],
+            "activity": ["pickUp", "setDown", "pickUp", "setDown"],
+            "start_time": [time(5, 40), time(5, 40), time(6, 50), time(6, 50)],
+            "direction": ["outbound"] * 4,
+            "vehicle_journey_id": [1, 1, 2, 2],
+        }
+    )
+
+    compact = compact_vehicle_journey_df(df)
+
+    assert compact["is_timing_point"].dtype == "boolean"
+    assert compact["naptan_stop_id"].dtype == "Int32"
+    assert compact["vehicle_journey_id"].dtype == "int32"
+    assert compact["service_pattern_stop_id"].dtype == "int64"
+    assert compact["activity"].dtype == "category"
+    assert compact["departure_time"].tolist()[:2] == [20400, 21570]
+    assert pd.isna(compact["departure_time"].iloc[2])
+    assert df["departure_time"].iloc[0] == time(5, 40)
+    assert compact.memory_usage(deep=True).sum() < df.memory_usage(deep=True).sum()
+    persisted = deserialise(serialise(compact, PersistenceFormat.PARQUET))
+    assert persisted.dtypes.equals(compact.dtypes)
+    assert persisted.equals(compact)
+
+
+@patch("src.boilerplate.dataframes.pd.read_sql_query")
+@patch("src.boilerplate.dataframes.get_vehicle_journey_query")
+@patch("src.boilerplate.dataframes.PersistedData")
+def test_vehicle_journey_df_is_persisted_in_journey_order(
+    persisted_data, _, read_sql_query
+):
+    persisted_data.return_value.get_or_miss.return_value = None
+    read_sql_query.return_value = pd.DataFrame(
+        {
+            "vehicle_journey_id": [2, 1, 1],
+            "auto_sequence_number": [0, 1, 0],
+            "service_pattern_stop_id": [20, 11, 10],
+        }
+    )
+    check = MagicMock()
+    check.file_id = 60
+
+    df = get_df_vehicle_journey(check, wait_for_save=True)
+
+    assert df["service_pattern_stop_id"].tolist() == [10, 11, 20]
+    assert df.index.tolist() == [0, 1, 2]
+    persisted_data.return_value.save.assert_called_once()
+    assert persisted_data.return_value.save.call_args.args[1] is df
+
+
+def test_format_time_of_day():
+    assert format_time_of_day(21570) == "05:59:30"
+    assert format_time_of_day(21570, "%H:%M") == "05:59"
+    assert format_time_of_day(time(5, 59, 30)) == "05:59:30"
+    assert format_time_of_day("05:40") == "05:40"
+    assert format_time_of_day(pd.NA) == "None"
+
+
+NAPTAN_REFERENCE = NaptanReference(
+    pd.DataFrame(
+        {
+            "id": [1, 2, 3],
+            "atco_code": ["0100BRP90340", "0100BRP90336", "0100BRA10724"],
+            "common_name": ["Rock Avenue", "Trinity Road", "Bus Station"],
+            "stop_type": ["BCT", "RSE", None],
+        }
+    ),
+    "3-3-0",
+)
+
+
+@patch("src.boilerplate.dataframes.get_naptan_reference", return_value=NAPTAN_REFERENCE)
+def test_naptan_availability_from_reference(_):
+    check = MagicMock()
+
+    df = get_naptan_availablilty(check, {"0100brp90340", "0100brp99999"})
+
+    assert df["atco_code"].tolist() == ["0100BRP90340"]
+    assert df["stop_type"].tolist() == ["BCT"]
+    check.db.read_session.query.assert_not_called()
+
+
+@patch("src.boilerplate.dataframes.get_naptan_reference", return_value=None)
+@patch("src.boilerplate.dataframes.get_snapshot", return_value=None)
+@patch("src.boilerplate.dataframes.pd.read_sql_query")
+def test_naptan_availability_matches_atco_codes_ignoring_case(read_sql_query, _, __):
+    read_sql_query.return_value = pd.DataFrame({"atco_code": ["0100BRP90312a"]})
+    check = MagicMock()
+    check.db.read_session = Session(create_engine("sqlite://"))
+
+    get_naptan_availablilty(check, {"0100BRP90312A", "0100brp90340"})
+
+    statement = read_sql_query.call_args.args[0].compile(
+        compile_kwargs={"literal_binds": True}
+    )
+    assert (
+        "lower(naptan_stoppoint.atco_code) IN ('0100brp90312a', '0100brp90340')"
+        in str(statement)
+    )
+
+
+@patch("src.boilerplate.dataframes.naptan_reference_enabled", return_value=True)
+@patch("src.boilerplate.dataframes.get_naptan_reference", return_value=NAPTAN_REFERENCE)
+@patch("src.boilerplate.dataframes.get_snapshot", return_value=None)
+def test_stop_type_from_reference(_, __, ___):
+    check = MagicMock()
+    query = check.db.read_session.query.return_value
+    query.join.return_value = query
+    query.where.return_value = query
+    query.with_entities.return_value = query
+    query.all.return_value = [
+        ("0100BRP90340", 10, "Rock Av", 7, 1),
+        ("0100BRP90336", 11, "Trinity Rd", 7, 2),
+        ("0100BRA10724", 12, "Station", 7, 3),
+        ("0100BRA99999", 13, "Gone", 7, 4),
+    ]
+
+    df = get_df_stop_type(check, ["BCT"])
+
+    assert df.to_dict("records") == [
+        {
+            "atco_code": "0100BRP90336",
+            "service_pattern_stop_id": 11,
+            "common_name": "Trinity Road",
+            "vehicle_journey_id": 7,
+            "stop_type": "RSE",
+        }
+    ]
+
+
+@patch("src.boilerplate.dataframes.get_naptan_reference")
+@patch("src.boilerplate.dataframes.get_naptan_reference_version")
+@patch("src.boilerplate.dataframes.get_vehicle_journey_query")
+@patch("src.boilerplate.dataframes.PersistedData")
+def test_vehicle_journey_df_loads_naptan_reference_only_when_not_persisted(
+    persisted_data, _, get_naptan_reference_version, get_naptan_reference
+):
+    get_naptan_reference_version.return_value = "3-3-0"
+    persisted = pd.DataFrame({"vehicle_journey_id": [1]})
+    persisted_data.return_value.get_or_miss.return_value = persisted
+    check = MagicMock()
+    check.file_id = 60
+
+    assert get_df_vehicle_journey(check) is persisted
+    get_naptan_reference.assert_not_called()
+    key = persisted_data.return_value.get_or_miss.call_args.args[0]
+
+    get_naptan_reference_version.return_value = "4-4-0"
+    get_df_vehicle_journey(check)
+    assert persisted_data.return_value.get_or_miss.call_args.args[0] != key
+    get_naptan_reference.assert_not_called()
+
+
+@patch("src.boilerplate.dataframes.get_snapshot", return_value=None)
+@patch("src.boilerplate.dataframes.pd.read_sql_query")
+def test_lookups_bind_journeys_as_one_array_or_join_the_file(read_sql_query, _):
+    check = MagicMock()
+    check.file_id = 50
+
+    get_operating_profile_df(check, list(range(10000)))
+    compiled = read_sql_query.call_args.args[0].compile(dialect=PGDialect_psycopg2())
+    assert "= ANY (%(vehicle_journey_ids)s::INTEGER[])" in compiled.string
+    assert len(compiled.params["vehicle_journey_ids"]) == 10000
+
+    get_operating_profile_df(check)
+    compiled = read_sql_query.call_args.args[0].compile(dialect=PGDialect_psycopg2())
+    assert "IN (SELECT transmodel_servicepatternstop.vehicle_journey_id" in (
+        compiled.string
+    )
+    assert compiled.params == {"txcfileattributes_id_1": 50}
+
+
+@patch("src.boilerplate.dataframes.get_snapshot", return_value=None)
+@patch("src.boilerplate.dataframes.pd.read_sql_query")
+def test_lookups_run_on_their_own_connections(read_sql_query, _):
+    check = MagicMock()
+    engine = check.db.read_session.get_bind.return_value
+    read_sql_query.side_effect = lambda statement, connection: pd.DataFrame(
+        {"connection": [connection]}
+    )
+
+    with patch.dict("src.boilerplate.dataframes.environ", {}, clear=True):
+        lookups = get_vehicle_journey_lookups(check, [1, 2])
+    assert len(lookups) == 4
+    assert engine.connect.call_count == 4
+    check.db.read_session.connection.assert_not_called()
+
+    with patch.dict(
+        "src.boilerplate.dataframes.environ",
+        {"DATAFRAME_CONCURRENT_LOOKUPS": "false"},
+        clear=True,
+    ):
+        get_vehicle_journey_lookups(check, [1, 2])
+    assert engine.connect.call_count == 4
+    assert check.db.read_session.connection.call_count == 4
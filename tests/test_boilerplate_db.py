@@ -1,7 +1,25 @@
-from src.boilerplate.bods_db import BodsDB
-from unittest.mock import patch
-from pytest import raises
+from multiprocessing import Array
+from src.boilerplate.bods_db import (
+    BACKEND_PID_SLOTS,
+    BodsDB,
+    MeteredQueuePool,
+    RDS_IAM_TOKEN_LIFETIME,
+    RDS_IAM_TOKEN_REFRESH_MARGIN,
+    RdsIamTokenProvider,
+    _apply_statement_timeout,
+    _provide_iam_auth_token,
+    _record_backend_pid,
+    dispose_engines,
+    get_pool_metrics,
+    record_backend_pids,
+    recorded_backend_pids,
+    set_statement_timeout,
+)
+from unittest.mock import MagicMock, patch
+from pytest import fixture, raises
 from psycopg2.errors import OperationalError
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
 
 ENVIRONMENT_INPUT_TEST_VALUES = {
     "POSTGRES_HOST": "host",
@@ -20,6 +38,13 @@ ENVIRONMENT_OUTPUT_TEST_VALUES = {
 }
 
 
+@fixture(autouse=True)
+def clear_engines():
+    dispose_engines(close=False)
+    yield
+    dispose_engines(close=False)
+
+
 @patch(
     "src.boilerplate.bods_db.BodsDB._get_connection_details",
     return_value=ENVIRONMENT_OUTPUT_TEST_VALUES,
@@ -37,7 +62,13 @@ def test_database_initialization(session, create_engine, connection_details):
         f"POSTGRES_DB={ENVIRONMENT_OUTPUT_TEST_VALUES['POSTGRES_DB']}&"
         f"POSTGRES_USER={ENVIRONMENT_OUTPUT_TEST_VALUES['POSTGRES_USER']}&"
         f"POSTGRES_PORT={ENVIRONMENT_OUTPUT_TEST_VALUES['POSTGRES_PORT']}&"
-        f"POSTGRES_PASSWORD={ENVIRONMENT_OUTPUT_TEST_VALUES['POSTGRES_PASSWORD']}"
+        f"POSTGRES_PASSWORD={ENVIRONMENT_OUTPUT_TEST_VALUES['POSTGRES_PASSWORD']}",
+        poolclass=MeteredQueuePool,
+        pool_size=5,
+        max_overflow=5,
+        pool_timeout=30,
+        pool_recycle=600,
+        pool_pre_ping=True,
     )
     session.assert_called_with(create_engine())
     assert db.session is not None
@@ -55,3 +86,229 @@ def test_database_initialisation_failed(_, __, ___, caplog):
     with raises(OperationalError):
         db._initialise_database()
     assert "Failed to connect to DB" in caplog.text
+
+
+@patch(
+    "src.boilerplate.bods_db.BodsDB._get_connection_details",
+    return_value=ENVIRONMENT_OUTPUT_TEST_VALUES,
+)
+@patch("src.boilerplate.bods_db.create_engine")
+@patch("src.boilerplate.bods_db.Session")
+def test_engine_shared_between_instances(session, create_engine, _):
+    """Test every BodsDB instance in the process reuses the same engine."""
+    BodsDB()._initialise_database()
+    BodsDB()._initialise_database()
+    assert create_engine.call_count == 1
+    assert session.call_count == 2
+
+
+@patch(
+    "src.boilerplate.bods_db.BodsDB._get_connection_details",
+    return_value=ENVIRONMENT_OUTPUT_TEST_VALUES,
+)
+@patch("src.boilerplate.bods_db.create_engine")
+@patch("src.boilerplate.bods_db.Session")
+@patch("src.boilerplate.bods_db.os.getpid")
+def test_engine_recreated_in_forked_process(getpid, session, create_engine, _):
+    """Test a child process never reuses the engine of its parent."""
+    getpid.return_value = 100
+    BodsDB()._initialise_database()
+    getpid.return_value = 200
+    BodsDB()._initialise_database()
+    assert create_engine.call_count == 2
+    create_engine.return_value.dispose.assert_called_with(close=False)
+
+
+def test_pool_checkout_rejects_connection_from_other_process():
+    """Test the checkout guard discards connections opened by another pid."""
+    engine = create_engine(
+        "sqlite://", poolclass=MeteredQueuePool, pool_size=1, max_overflow=0
+    )
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        record = connection.connection._connection_record
+        record.info["pid"] = -1
+    with engine.connect() as connection:
+        assert connection.connection._connection_record.info["pid"] != -1
+    engine.dispose()
+
+
+def test_pool_metrics():
+    """Test the pool records checkout wait, size and overflow."""
+    engine = create_engine(
+        "sqlite://", poolclass=MeteredQueuePool, pool_size=1, max_overflow=1
+    )
+    with engine.connect(), engine.connect():
+        metrics = engine.pool.metrics()
+        assert metrics["checked_out"] == 2
+        assert metrics["overflow"] == 1
+    metrics = engine.pool.metrics()
+    assert metrics["pool_size"] == 1
+    assert metrics["checkouts"] == 2
+    assert metrics["checkout_wait_max_ms"] >= metrics["checkout_wait_avg_ms"] >= 0
+    engine.dispose()
+
+
+def test_pool_metrics_empty_without_engines():
+    assert get_pool_metrics() == {}
+
+
+@patch("src.boilerplate.bods_db.boto3")
+@patch("src.boilerplate.bods_db.monotonic")
+def test_iam_token_cached_until_refresh_margin(monotonic, boto3):
+    """Test the IAM token and RDS client are reused until close to expiry."""
+    provider = RdsIamTokenProvider()
+    client = boto3.session.Session.return_value.client.return_value
+    client.generate_db_auth_token.side_effect = ["token-1", "token-2"]
+
+    monotonic.return_value = 0
+    assert provider.get_token("host", 5432, "user") == "token-1"
+    monotonic.return_value = RDS_IAM_TOKEN_LIFETIME - RDS_IAM_TOKEN_REFRESH_MARGIN - 1
+    assert provider.get_token("host", 5432, "user") == "token-1"
+    assert client.generate_db_auth_token.call_count == 1
+
+    monotonic.return_value = RDS_IAM_TOKEN_LIFETIME - RDS_IAM_TOKEN_REFRESH_MARGIN
+    assert provider.get_token("host", 5432, "user") == "token-2"
+    assert client.generate_db_auth_token.call_count == 2
+    assert boto3.session.Session.call_count == 1
+
+
+@patch.dict("src.boilerplate.bods_db.environ", {"PROJECT_ENV": "dev"})
+@patch("src.boilerplate.bods_db.rds_iam_token_provider")
+def test_iam_token_supplied_at_connect(token_provider):
+    """Test new postgres connections get the current token, not one in the URL."""
+    token_provider.get_token.return_value = "token"
+    dialect = MagicMock()
+    dialect.name = "postgresql"
+    cparams = {"host": "host", "port": 5432, "user": "user", "dbname": "db"}
+
+    _provide_iam_auth_token(dialect, None, [], cparams)
+
+    assert cparams["password"] == "token"
+    token_provider.get_token.assert_called_with("host", 5432, "user")
+
+
+@patch.dict(
+    "src.boilerplate.bods_db.environ",
+    {**ENVIRONMENT_INPUT_TEST_VALUES, "PROJECT_ENV": "dev"},
+)
+def test_connection_details_have_no_password_outside_local():
+    details = BodsDB()._get_connection_details()
+    assert "password" not in details
+    assert details["sslmode"] == "require"
+
+
+LOCAL_ENVIRONMENT = {
+    **ENVIRONMENT_INPUT_TEST_VALUES,
+    "PROJECT_ENV": "local",
+}
+
+
+@patch.dict("src.boilerplate.bods_db.environ", LOCAL_ENVIRONMENT, clear=True)
+@patch("src.boilerplate.bods_db.create_engine")
+@patch("src.boilerplate.bods_db.Session")
+def test_read_session_is_primary_without_replica(session, create_engine):
+    db = BodsDB()
+    assert db.read_session is db.session
+    assert db.fresh_read_session() is db.session
+    assert create_engine.call_count == 1
+
+
+@patch.dict(
+    "src.boilerplate.bods_db.environ",
+    {**LOCAL_ENVIRONMENT, "POSTGRES_REPLICA_HOST": "replica"},
+    clear=True,
+)
+@patch("src.boilerplate.bods_db.create_engine")
+@patch("src.boilerplate.bods_db.Session")
+def test_read_session_uses_replica(session, create_engine):
+    session.side_effect = lambda engine: MagicMock()
+    db = BodsDB()
+    assert db.read_session is not db.session
+    assert create_engine.call_count == 2
+    urls = [call.args[0] for call in create_engine.call_args_list]
+    assert any("@replica:5432/db" in url for url in urls)
+    statements = [str(call.args[0]) for call in db.read_session.execute.call_args_list]
+    assert "SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY" in statements
+
+
+@patch.dict(
+    "src.boilerplate.bods_db.environ",
+    {
+        **LOCAL_ENVIRONMENT,
+        "POSTGRES_REPLICA_HOST": "replica",
+        "POSTGRES_REPLICA_MAX_LAG_MS": "0",
+    },
+    clear=True,
+)
+@patch("src.boilerplate.bods_db.create_engine")
+@patch("src.boilerplate.bods_db.Session")
+def test_fresh_read_session_uses_replica_once_caught_up(session, create_engine):
+    session.side_effect = lambda engine: MagicMock()
+    db = BodsDB()
+    db.read_session.execute.return_value.scalar.return_value = True
+    assert db.fresh_read_session() is db.read_session
+
+    db.read_session.execute.return_value.scalar.return_value = False
+    assert db.fresh_read_session() is db.session
+
+
+@patch.dict(
+    "src.boilerplate.bods_db.environ",
+    {**LOCAL_ENVIRONMENT, "POSTGRES_REPLICA_HOST": "replica"},
+    clear=True,
+)
+@patch("src.boilerplate.bods_db.create_engine")
+@patch("src.boilerplate.bods_db.Session")
+def test_fresh_read_session_falls_back_when_lag_unknown(session, create_engine):
+    session.side_effect = lambda engine: MagicMock()
+    db = BodsDB()
+    db.read_session.execute.side_effect = OperationalError()
+    assert db.fresh_read_session() is db.session
+    db.read_session.rollback.assert_called_once()
+
+
+def test_statement_timeout_applied_to_new_connections():
+    dialect = MagicMock()
+    dialect.name = "postgresql"
+    cparams = {"options": "-c search_path=public"}
+    set_statement_timeout(42.5)
+    try:
+        _apply_statement_timeout(dialect, None, [], cparams)
+    finally:
+        set_statement_timeout(None)
+    assert cparams["options"] == "-c search_path=public -c statement_timeout=42500"
+
+    cparams = {}
+    _apply_statement_timeout(dialect, None, [], cparams)
+    assert "options" not in cparams
+
+
+def test_backend_pids_of_checked_out_connections_are_recorded(monkeypatch):
+    monkeypatch.setenv("POSTGRES_REPLICA_HOST", "replica")
+    backend_pids = Array("i", 2 * BACKEND_PID_SLOTS)
+    record_backend_pids(backend_pids)
+    try:
+        for host, pid in (("primary", 11), ("replica", 12), ("primary", 11)):
+            connection = MagicMock(**{"get_backend_pid.return_value": pid})
+            connection.info.host = host
+            _record_backend_pid(connection, None, None)
+        # Connections that can't tell their PID, e.g. SQLite's, are skipped
+        _record_backend_pid(object(), None, None)
+    finally:
+        record_backend_pids(None)
+    assert recorded_backend_pids(backend_pids) == {
+        "primary": [11],
+        "replica": [12],
+    }
+
+
+def test_cancel_backends():
+    db = BodsDB()
+    db._session = MagicMock()
+    db.cancel_backends({"primary": [1234, 1235], "replica": []})
+    assert [call.args[1] for call in db._session.execute.call_args_list] == [
+        {"pid": 1234},
+        {"pid": 1235},
+    ]
+    assert db._session.commit.call_count == 2
@@ -0,0 +1,61 @@
+from unittest.mock import patch
+from pytest import fixture
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from src.boilerplate.dqs_checks import CheckRegistry
+from src.boilerplate.models import DqsChecks
+
+
+@fixture
+def session():
+    engine = create_engine("sqlite:///:memory:")
+    DqsChecks.__table__.create(engine)
+    session = Session(engine)
+    session.add_all(
+        [
+            DqsChecks(
+                id=1,
+                observation="Missing journey code",
+                importance="Critical",
+                category="Journey",
+            ),
+            DqsChecks(
+                id=2,
+                observation="Incorrect NOC",
+                importance="Advisory",
+                category="Data set",
+                queue_name="incorrect_noc_queue",
+            ),
+        ]
+    )
+    session.commit()
+    return session
+
+
+def test_registry_maps_normalised_names(session):
+    registry = CheckRegistry()
+    assert registry.get_check_id(session, "missing_journey_code") == 1
+    assert registry.get_check_id(session, "incorrect_noc") == 2
+    assert registry.get_check_id(session, "unknown_check") == 0
+    assert registry.get_all_check_ids(session) == [1, 2]
+    check = registry.get_checks(session)["incorrect_noc"]
+    assert check.observation == "Incorrect NOC"
+    assert check.queue_name == "incorrect_noc_queue"
+
+
+@patch("src.boilerplate.dqs_checks.monotonic")
+def test_registry_reloads_after_ttl(monotonic, session):
+    registry = CheckRegistry(ttl=60)
+    monotonic.return_value = 1000.0
+    registry.get_checks(session)
+    session.add(
+        DqsChecks(
+            id=3, observation="Incorrect licence number", importance="", category=""
+        )
+    )
+    session.commit()
+
+    monotonic.return_value = 1030.0
+    assert registry.get_check_id(session, "incorrect_licence_number") == 0
+    monotonic.return_value = 1060.0
+    assert registry.get_check_id(session, "incorrect_licence_number") == 3
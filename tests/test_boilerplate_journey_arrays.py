@@ -0,0 +1,79 @@
+from datetime import time
+
+import numpy as np
+import pandas as pd
+
+from src.boilerplate.dataframes import compact_vehicle_journey_df
+from src.boilerplate.journey_arrays import JourneyArrays
+
+STOPS = compact_vehicle_journey_df(
+    pd.DataFrame(
+        {
+            "is_timing_point": [True, None, True, False, True],
+            "naptan_stop_id": [7.0, 8.0, None, 7.0, 9.0],
+            "auto_sequence_number": [1, 0, 0, 2, 1],
+            "atco_code": ["0100B", "0100A", "0100C", "0100A", "0100B"],
+            "departure_time": [time(6, 5), time(6, 0), time(7, 0), None, time(7, 9)],
+            "common_name": ["Second", "First", "Third", "First", "Second"],
+            "service_pattern_stop_id": [101, 100, 200, 102, 201],
+            "activity": ["pickUp", "pickUp", "setDown", "setDown", "pickUp"],
+            "start_time": [time(6, 0), time(6, 0), time(7, 0), time(6, 0), time(7, 0)],
+            "direction": ["outbound", "outbound", "inbound", "outbound", "inbound"],
+            "vehicle_journey_id": [1, 1, 2, 1, 2],
+            "vehicle_journey_code": ["A1", "A1", "B1", "A1", "B1"],
+        }
+    )
+)
+
+
+def _values(values: pd.Series) -> list:
+    return values.astype(object).where(values.notna(), None).tolist()
+
+
+def test_journey_arrays_hold_journeys_as_slices_of_interned_stops():
+    arrays = JourneyArrays.from_frame(STOPS)
+
+    assert len(arrays) == 2
+    assert arrays.journey_offsets.tolist() == [0, 3, 5]
+    assert sorted(arrays.journeys) == [
+        "direction",
+        "start_time",
+        "vehicle_journey_code",
+        "vehicle_journey_id",
+    ]
+    journey = arrays.journey(0)
+    assert journey["service_pattern_stop_id"].tolist() == [100, 101, 102]
+    assert np.shares_memory(journey["atco_code"], arrays.stops["atco_code"])
+    set_down = arrays.codes("activity", ["setDown", "other"])
+    assert set_down[1] == -1
+    assert (journey["activity"] == set_down[0]).tolist() == [False, False, True]
+
+
+def test_journey_arrays_convert_back_to_the_frame():
+    arrays = JourneyArrays.from_frame(STOPS)
+
+    df = arrays.to_frame()
+    expected = STOPS.sort_values(["vehicle_journey_id", "auto_sequence_number"])
+    assert df["service_pattern_stop_id"].tolist() == [100, 101, 102, 200, 201]
+    assert df["is_timing_point"].dtype == "boolean"
+    assert df["departure_time"].dtype == "Int32"
+    assert df["atco_code"].dtype == "category"
+    for column in STOPS.columns:
+        assert _values(df[column]) == _values(expected[column])
+
+    first_stops = arrays.to_frame(arrays.journey_offsets[:-1])
+    assert first_stops["common_name"].tolist() == ["First", "Third"]
+    assert first_stops["direction"].tolist() == ["outbound", "inbound"]
+
+
+def test_journey_arrays_are_memory_mapped_when_loaded(tmp_path):
+    arrays = JourneyArrays.from_frame(STOPS)
+    arrays.save(str(tmp_path / "arrays"))
+    arrays.save(str(tmp_path / "arrays"))
+
+    loaded = JourneyArrays.load(str(tmp_path / "arrays"))
+
+    assert isinstance(loaded.stops["atco_code"], np.memmap)
+    assert loaded.journey(1)["service_pattern_stop_id"].tolist() == [200, 201]
+    assert loaded.to_frame().equals(arrays.to_frame())
+    assert [path.name for path in tmp_path.iterdir()] == ["arrays"]
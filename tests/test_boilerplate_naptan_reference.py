@@ -0,0 +1,130 @@
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pandas as pd
+
+from src.boilerplate.naptan_reference import (
+    BloomFilter,
+    NaptanReference,
+    NaptanReferenceLoader,
+    publish_naptan_reference,
+)
+
+STOPS = pd.DataFrame(
+    {
+        "id": [30, 10, 20],
+        "atco_code": ["0100BRP90340", "0100BRA10724", "0100brp90336"],
+        "common_name": ["Rock Avenue", "Bristol Bus Station", "Trinity Road"],
+        "stop_type": ["BCT", "BCS", None],
+    }
+)
+
+
+def test_bloom_filter_has_no_false_negatives():
+    members = np.array([f"0100BRP{i}" for i in range(10000)], dtype=object)
+    others = np.array([f"2900A{i}" for i in range(10000)], dtype=object)
+    bloom = BloomFilter.build(members, false_positive_rate=0.01)
+
+    assert bloom.might_contain(members).all()
+    assert bloom.might_contain(others).mean() < 0.02
+    assert len(bloom.bits) < len(members) * 2
+
+
+def test_reference_looks_up_atco_codes_ignoring_case():
+    reference = NaptanReference(STOPS, "1")
+
+    assert reference.contains(["0100brp90340", "0100BRP90336", "missing"]).tolist() == [
+        True,
+        True,
+        False,
+    ]
+    assert reference.stops_by_atco_code({"0100brp90340", "missing"})[
+        "common_name"
+    ].tolist() == ["Rock Avenue"]
+    assert reference.contains([]).tolist() == []
+
+
+def test_reference_looks_up_ids():
+    reference = NaptanReference(STOPS, "1")
+
+    stops = reference.stops_by_id([20.0, np.nan, 30, 40, 20])
+    assert sorted(stops["id"]) == [20, 30]
+    assert reference.stops_by_id([]).empty
+
+    df = pd.DataFrame(
+        {
+            "naptan_stop_id": [10.0, np.nan, 40.0],
+            "common_name": ["Bus Station", "Unregistered", "Removed"],
+        }
+    )
+    assert reference.with_common_names(df)["common_name"].tolist() == [
+        "Bristol Bus Station",
+        "Unregistered",
+        "Removed",
+    ]
+
+
+@patch("src.boilerplate.naptan_reference.PersistedData")
+@patch("src.boilerplate.naptan_reference.get_naptan_version")
+def test_loader_checks_version_and_shares_reference_through_tmp(
+    get_naptan_version, persisted_data, tmp_path
+):
+    persisted_data.return_value.backend = None
+    get_naptan_version.return_value = "3-30-0"
+    loader = NaptanReferenceLoader(check_interval=0, directory=str(tmp_path))
+    with patch.object(NaptanReferenceLoader, "_build", return_value=STOPS) as build:
+        reference = loader.get(MagicMock())
+        assert loader.get(MagicMock()) is reference
+        assert get_naptan_version.call_count == 2
+        assert build.call_count == 1
+
+        # Another process of the container reads the version and the
+        # reference from /tmp
+        other = NaptanReferenceLoader(directory=str(tmp_path)).get(MagicMock())
+        assert other.version == "3-30-0"
+        assert build.call_count == 1
+        assert get_naptan_version.call_count == 2
+
+        get_naptan_version.return_value = "4-40-0"
+        assert loader.get(MagicMock()).version == "4-40-0"
+        assert build.call_count == 2
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "naptan_reference-4-40-0",
+        "version",
+    ]
+
+
+@patch("src.boilerplate.naptan_reference.PersistedData")
+@patch("src.boilerplate.naptan_reference.get_naptan_version", return_value="3-30-0")
+def test_loader_reloads_reference_past_its_max_age(_, persisted_data, tmp_path):
+    persisted_data.return_value.backend = None
+    loader = NaptanReferenceLoader(directory=str(tmp_path), max_age=0)
+    with patch.object(NaptanReferenceLoader, "_build", return_value=STOPS) as build:
+        loader.get(MagicMock())
+        loader.get(MagicMock())
+    assert build.call_count == 2
+
+
+@patch("src.boilerplate.naptan_reference.PersistedData")
+@patch("src.boilerplate.naptan_reference.get_naptan_version")
+def test_loader_reads_version_and_reference_published(
+    get_naptan_version, persisted_data, tmp_path
+):
+    get_naptan_version.return_value = "3-30-0"
+    backend = persisted_data.return_value.backend
+    values = {}
+    backend.save_value.side_effect = values.__setitem__
+    backend.find_value.side_effect = values.get
+    with patch(
+        "src.boilerplate.naptan_reference._build_naptan_reference", return_value=STOPS
+    ):
+        assert publish_naptan_reference(MagicMock()) == "3-30-0"
+    assert sorted(values) == ["naptan_reference-3-30-0", "naptan_reference-version"]
+
+    get_naptan_version.reset_mock()
+    with patch.object(NaptanReferenceLoader, "_build") as build:
+        reference = NaptanReferenceLoader(directory=str(tmp_path)).get(MagicMock())
+    build.assert_not_called()
+    get_naptan_version.assert_not_called()
+    assert reference.version == "3-30-0"
+    assert len(reference) == 3
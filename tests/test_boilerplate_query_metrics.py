@@ -0,0 +1,103 @@
+from json import loads
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from src.boilerplate.bods_db import query_metrics
+from src.boilerplate.query_metrics import (
+    QueryMetrics,
+    fingerprint_statement,
+    normalise_statement,
+)
+from query_metrics import record_cursor_query
+
+
+def test_normalise_statement_collapses_values():
+    statement = (
+        "SELECT id FROM stops\n  WHERE id IN (%(id_1_1)s, %(id_1_2)s, %(id_1_3)s)"
+        " AND sequence > 10 LIMIT %(param_1)s"
+    )
+    assert normalise_statement(statement) == (
+        "SELECT id FROM stops WHERE id IN (?...) AND sequence > ? LIMIT ?"
+    )
+
+
+def test_fingerprint_ignores_parameter_count():
+    assert fingerprint_statement(
+        "SELECT 1 FROM t WHERE id IN (?, ?)"
+    ) == fingerprint_statement("SELECT 1 FROM t WHERE id IN (?, ?, ?, ?)")
+    assert fingerprint_statement("SELECT a::text FROM t") != fingerprint_statement(
+        "SELECT b::text FROM t"
+    )
+
+
+def test_record_emits_emf_and_aggregates(capsys):
+    metrics = QueryMetrics()
+    metrics.set_tags(check_id=3, file_id=7)
+    metrics.record("SELECT * FROM t WHERE id = %(id)s", "get_df_x", 12.5, 4)
+    metrics.record("SELECT * FROM t WHERE id = %(id)s", "get_df_x", 7.5, 6)
+    metrics.record("UPDATE t SET a = %(a)s", "common.set_status", 1.0, None)
+
+    lines = [loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert len(lines) == 3
+    assert lines[0]["CheckId"] == 3
+    assert lines[0]["FileId"] == 7
+    assert lines[0]["Caller"] == "get_df_x"
+    assert lines[0]["QueryDuration"] == 12.5
+    assert lines[0]["QueryRows"] == 4
+    assert lines[0]["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [
+        ["FunctionName", "Caller"]
+    ]
+    assert "QueryRows" not in lines[2]
+
+    summary = metrics.summary()
+    assert summary[0]["caller"] == "get_df_x"
+    assert summary[0]["count"] == 2
+    assert summary[0]["total_ms"] == 20.0
+    assert summary[0]["max_ms"] == 12.5
+    assert summary[0]["rows"] == 10
+
+    metrics.log_summary()
+    assert metrics.summary() == []
+
+
+def test_engine_queries_are_recorded():
+    engine = create_engine("sqlite:///:memory:")
+    query_metrics.reset()
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    summary = query_metrics.summary()
+    query_metrics.reset()
+    assert [entry["statement"] for entry in summary] == ["SELECT ?"]
+    assert (
+        summary[0]["caller"]
+        == "test_boilerplate_query_metrics.test_engine_queries_are_recorded"
+    )
+
+
+def test_failed_queries_leave_no_start_time():
+    engine = create_engine("sqlite:///:memory:")
+    query_metrics.reset()
+    with engine.connect() as connection:
+        with pytest.raises(OperationalError):
+            connection.execute(text("SELECT * FROM missing"))
+        assert not connection.info.get("query_start_time")
+        connection.execute(text("SELECT 1"))
+        assert not connection.info.get("query_start_time")
+    summary = query_metrics.summary()
+    query_metrics.reset()
+    assert [entry["statement"] for entry in summary] == ["SELECT ?"]
+
+
+def test_cursor_queries_are_recorded():
+    def copy_rows():
+        record_cursor_query("COPY t (a, b) FROM STDIN", 4.0, 3)
+
+    query_metrics.reset()
+    copy_rows()
+    record_cursor_query("COPY t (a, b) FROM STDIN", 2.0, 2, "get_df_x")
+    summary = query_metrics.summary()
+    query_metrics.reset()
+    assert [(entry["caller"], entry["rows"]) for entry in summary] == [
+        ("test_boilerplate_query_metrics.copy_rows", 3),
+        ("get_df_x", 2),
+    ]
@@ -0,0 +1,77 @@
+from json import dumps, loads
+from unittest.mock import MagicMock, patch
+from common import Check
+from src.boilerplate.sqs_batch import process_sqs_batch
+from src.boilerplate.time_out_handler import get_timeout
+from tests.fixtures.context import mocked_context  # noqa
+
+
+def sqs_record(message_id, file_id):
+    return {
+        "messageId": message_id,
+        "body": dumps({"file_id": file_id, "check_id": 1, "result_id": 1}),
+    }
+
+
+def test_batch_reports_only_failed_records(mocked_context):
+    processed = []
+
+    def handler(event, context):
+        assert len(event["Records"]) == 1
+        body = loads(event["Records"][0]["body"])
+        processed.append(event["Records"][0]["messageId"])
+        if body["file_id"] == 2:
+            raise ValueError("Failed to set result status")
+
+    event = {"Records": [sqs_record("a", 3), sqs_record("b", 2), sqs_record("c", 3)]}
+    response = process_sqs_batch(event, mocked_context, handler)
+    assert processed == ["b", "a", "c"]
+    assert response == {"batchItemFailures": [{"itemIdentifier": "b"}]}
+
+
+def test_batch_returns_records_without_time_left():
+    context = MagicMock()
+    context.get_remaining_time_in_millis.return_value = 10000
+    handler = MagicMock()
+    response = process_sqs_batch({"Records": [sqs_record("a", 1)]}, context, handler)
+    handler.assert_not_called()
+    assert response == {"batchItemFailures": [{"itemIdentifier": "a"}]}
+
+
+def test_state_machine_event_passed_to_handler(mocked_context):
+    handler = MagicMock(return_value="result")
+    assert process_sqs_batch({"file_id": 1}, mocked_context, handler) == "result"
+    handler.assert_called_once_with({"file_id": 1}, mocked_context)
+
+
+def test_batch_shares_remaining_time_between_records():
+    context = MagicMock()
+    context.get_remaining_time_in_millis.return_value = 135000
+    timeouts = []
+
+    def handler(event, record_context):
+        timeouts.append(get_timeout(record_context))
+
+    event = {"Records": [sqs_record("a", 1), sqs_record("b", 2), sqs_record("c", 3)]}
+    process_sqs_batch(event, context, handler)
+    assert timeouts == [40, 60, 120]
+
+
+@patch("src.boilerplate.sqs_batch.OrganisationTxcFileAttributes")
+@patch("src.boilerplate.sqs_batch.BodsDB")
+def test_batch_shares_db_between_records_of_a_file(
+    bods_db, org_txc_attributes, mocked_context
+):
+    dbs = []
+
+    def handler(event, context):
+        dbs.append(Check(event, "").db)
+
+    event = {"Records": [sqs_record("a", 3), sqs_record("b", 2), sqs_record("c", 3)]}
+    process_sqs_batch(event, mocked_context, handler)
+    assert dbs[1] is dbs[2] is bods_db.return_value
+    assert dbs[0] is not bods_db.return_value
+    org_txc_attributes.share.assert_called_once()
+    assert org_txc_attributes.share.call_args.args[0].file_id == 3
+    org_txc_attributes.clear_shared.assert_called_once()
+    assert Check(event, "").db is not bods_db.return_value
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from src.boilerplate.stop_sequences import StopSequences
+
+STOPS = pd.DataFrame(
+    {
+        "vehicle_journey_id": [2, 1, 2, 1, 1, 3, 2],
+        "auto_sequence_number": [1, 2, 0, 0, 2, np.nan, np.nan],
+        "service_pattern_stop_id": [21, 12, 20, 10, 13, 30, 22],
+    },
+    index=[10, 11, 12, 13, 14, 15, 16],
+)
+
+
+def test_stop_sequences_find_first_and_last_stops_as_idxmin_and_idxmax():
+    sequences = StopSequences(STOPS)
+    numbered = STOPS[STOPS["auto_sequence_number"].notna()]
+    grouped = numbered.groupby("vehicle_journey_id").auto_sequence_number
+
+    assert sequences.journey_ids.tolist() == [1, 2, 3]
+    assert sequences.offsets.tolist() == [0, 3, 6, 7]
+    assert sequences.first_stops().index.tolist()[:2] == grouped.idxmin().tolist()
+    assert sequences.last_stops().index.tolist()[:2] == grouped.idxmax().tolist()
+    # A journey without sequence numbers has its first stop for both
+    assert sequences.first_stops().index[2] == sequences.last_stops().index[2] == 15
+    assert sequences.segment(1)["service_pattern_stop_id"].tolist() == [20, 21, 22]
+
+
+def test_stop_sequences_map_masks_of_the_frame_to_journeys():
+    sequences = StopSequences(STOPS)
+
+    missing = STOPS["service_pattern_stop_id"] == 21
+    assert sequences.journeys_with(missing).tolist() == [False, True, False]
+    assert sequences.same_journey_as_previous().tolist() == [
+        False,
+        True,
+        True,
+        False,
+        True,
+        True,
+        False,
+    ]
+
+    subset = sequences.subset(STOPS["service_pattern_stop_id"] % 10 == 0)
+    assert subset.journey_ids.tolist() == [1, 2, 3]
+    assert subset.frame is STOPS
+    assert subset.df.index.tolist() == [13, 12, 15]
+    assert subset.column("service_pattern_stop_id").tolist() == [10, 20, 30]
+
+    ordered = StopSequences(sequences.df)
+    assert ordered.df is ordered.frame
+
+
+def test_stop_sequences_of_no_stops():
+    sequences = StopSequences(STOPS.iloc[:0])
+
+    assert len(sequences) == 0
+    assert sequences.first_stops().empty
+    assert sequences.last_stops().empty
+    assert sequences.journeys_with([]).tolist() == []
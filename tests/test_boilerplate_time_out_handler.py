@@ -0,0 +1,27 @@
+from time import sleep
+from unittest.mock import MagicMock
+from pytest import raises
+from src.boilerplate.time_out_handler import TimeOutHandler
+from bods_db import _record_backend_pid
+from dqs_exception import LambdaTimeOutError
+
+
+def slow_worker(event, check):
+    # Connections checked out by the worker, e.g. a session's and a lookup
+    # thread's, record their backend PIDs
+    for pid in (4321, 4322, 4321):
+        _record_backend_pid(
+            MagicMock(**{"get_backend_pid.return_value": pid}), None, None
+        )
+    sleep(10)
+
+
+def test_timed_out_worker_queries_are_cancelled():
+    check = MagicMock()
+    handler = TimeOutHandler({}, check, 1)
+    with raises(LambdaTimeOutError):
+        handler.run(slow_worker)
+    check.db.release_connection.assert_called_once()
+    check.db.cancel_backends.assert_called_once_with(
+        {"primary": [4321, 4322], "replica": []}
+    )
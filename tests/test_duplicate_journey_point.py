@@ -1,7 +1,11 @@
 from os.path import dirname
 from unittest.mock import MagicMock, patch
 import pandas as pd
-from src.template.duplicate_journey_code import lambda_worker, lambda_handler
+from src.template.duplicate_journey_code import (
+    calendar_keys,
+    lambda_worker,
+    lambda_handler,
+)
 from tests.test_templates import lambda_invalid_check
 from tests.fixtures.context import mocked_context  # noqa
 
@@ -140,3 +144,48 @@ def test_lambda_handler_different_operating_profile(
 @patch("src.template.duplicate_journey_code.Check")
 def test_lambda_handler_invalid_check(mock_check, mocked_context):
     lambda_invalid_check(lambda_handler, mock_check, mocked_context)
+
+
+def test_calendar_keys_collide_for_equivalent_calendars():
+    df = pd.DataFrame(
+        {
+            "day_of_week": [
+                ["Friday", "Tuesday"],
+                ["Tuesday", "Friday"],
+                ["Tuesday", "Friday"],
+                ["Tuesday", "Friday"],
+                ["Monday"],
+            ],
+            "operating_date": [
+                ["2022-06-10", "2022-06-03"],
+                ["2022-06-03", "2022-06-10"],
+                "[]",
+                ["2022-06-03", "2022-06-10"],
+                "[]",
+            ],
+            "non_operating_date": [
+                "[]",
+                "[]",
+                ["2022-06-03", "2022-06-10"],
+                [],
+                "[]",
+            ],
+            "serviced_organisation_id": [
+                ["2", "1"],
+                ["1", "2"],
+                ["1", "2"],
+                ["1", "2"],
+                [],
+            ],
+        },
+        index=[10, 11, 12, 13, 14],
+    )
+    keys = calendar_keys(df)
+
+    # The lists are pooled, so dates that swap between operating and non
+    # operating still collide, and a "[]" counts as its two brackets
+    assert keys[10] == keys[11] == keys[12]
+    assert keys[11] != keys[13]
+    assert keys[13] != keys[14]
+    # Keys are the same whichever frame a journey's calendar is in
+    assert calendar_keys(df.loc[[14, 11]]).equals(keys.loc[[14, 11]])
@@ -0,0 +1,100 @@
+from unittest.mock import MagicMock, patch
+from src.template import app, missing_journey_code
+from src.template.file_executor import (
+    get_check_timeout,
+    get_check_worker,
+    lambda_handler,
+    run_check,
+)
+from tests.fixtures.context import mocked_context  # noqa
+
+
+def test_get_check_worker():
+    assert (
+        get_check_worker("missing_journey_code") is missing_journey_code.lambda_worker
+    )
+    assert get_check_worker("check_without_module") is app.lambda_worker
+
+
+@patch("src.template.file_executor.BodsDB")
+@patch("src.template.file_executor.get_pending_checks")
+@patch("src.template.file_executor.get_naptan_reference")
+@patch("src.template.file_executor.load_snapshot")
+@patch("src.template.file_executor.clear_snapshot")
+@patch("src.template.file_executor.OrganisationTxcFileAttributes")
+@patch("src.template.file_executor.run_check")
+def test_lambda_handler_runs_every_check_once_with_shared_inputs(
+    run_check,
+    org_txc_attributes,
+    clear_snapshot,
+    load_snapshot,
+    get_naptan_reference,
+    get_pending_checks,
+    _,
+    mocked_context,
+):
+    first_check, second_check = MagicMock(), MagicMock()
+    get_pending_checks.return_value = [
+        ("missing_journey_code", {"Records": []}, first_check),
+        ("incorrect_noc", {"Records": []}, second_check),
+    ]
+    run_check.side_effect = [ValueError("Failed to set result status"), None]
+
+    response = lambda_handler({"file_id": 50}, mocked_context)
+
+    assert response == {
+        "file_id": 50,
+        "checks": ["missing_journey_code", "incorrect_noc"],
+        "pending": [],
+    }
+    get_naptan_reference.assert_called_once_with(first_check)
+    load_snapshot.assert_called_once_with(first_check)
+    org_txc_attributes.share.assert_called_once_with(first_check)
+    assert run_check.call_count == 2
+    clear_snapshot.assert_called_once()
+    org_txc_attributes.clear_shared.assert_called_once()
+
+
+@patch("src.template.file_executor.TimeOutHandler")
+def test_run_check_sets_failed_status(timeout_handler, mocked_context):
+    timeout_handler.return_value.run.side_effect = ValueError("Broken check")
+    check = MagicMock()
+    run_check("missing_journey_code", {}, check, 60)
+    check.set_status.assert_called_once_with("FAILED")
+
+
+def test_check_timeout_is_a_share_of_the_remaining_time():
+    context = MagicMock()
+    context.get_remaining_time_in_millis.return_value = 615000
+    assert get_check_timeout(context, 15) == 40
+    assert get_check_timeout(context, 2) == 120
+
+
+@patch("src.template.file_executor.BodsDB")
+@patch("src.template.file_executor.get_pending_checks")
+@patch("src.template.file_executor.get_naptan_reference")
+@patch("src.template.file_executor.load_snapshot")
+@patch("src.template.file_executor.clear_snapshot")
+@patch("src.template.file_executor.OrganisationTxcFileAttributes")
+@patch("src.template.file_executor.run_check")
+def test_lambda_handler_leaves_checks_pending_without_time(
+    run_check, _, __, ___, ____, get_pending_checks, _____
+):
+    context = MagicMock()
+    context.get_remaining_time_in_millis.side_effect = [100000, 30000]
+    checks = [MagicMock(), MagicMock(), MagicMock()]
+    get_pending_checks.return_value = [
+        ("missing_journey_code", {"Records": []}, checks[0]),
+        ("incorrect_noc", {"Records": []}, checks[1]),
+        ("missing_bus_working_number", {"Records": []}, checks[2]),
+    ]
+
+    response = lambda_handler({"file_id": 50}, context)
+
+    assert response["checks"] == ["missing_journey_code"]
+    assert response["pending"] == ["incorrect_noc", "missing_bus_working_number"]
+    run_check.assert_called_once_with(
+        "missing_journey_code", {"Records": []}, checks[0], 28
+    )
+    for check in checks[1:]:
+        check.set_status.assert_not_called()
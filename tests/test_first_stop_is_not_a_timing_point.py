@@ -11,7 +11,7 @@ logger.setLevel(logging.DEBUG)
 
 @patch("src.template.first_stop_is_not_a_timing_point.Check")
 @patch("src.template.first_stop_is_not_a_timing_point.ObservationResult")
-@patch("src.template.first_stop_is_not_a_timing_point.get_df_vehicle_journey")
+@patch("src.template.first_stop_is_not_a_timing_point.get_df_vehicle_journey_chunks")
 def test_lambda_handler_valid_check(
     mock_get_df_vehicle_journey, mock_observation, mocked_check, mocked_context
 ):
@@ -22,18 +22,20 @@ def test_lambda_handler_valid_check(
     mocked_observations.add_observation = MagicMock()
     mocked_observations.write_observations = MagicMock()
     mocked_observations.observations = [1, 3, 4]
-    mock_get_df_vehicle_journey.return_value = pd.DataFrame(
-        {
-            "is_timing_point": [False, True, True],
-            "vehicle_journey_id": [1, 2, 3],
-            "auto_sequence_number": [1, 2, 3],
-            "activity": ["setDown", "pickUp", "setDownDriverRequest"],
-            "common_name": ["Stop A", "Stop B", "Stop C"],
-            "start_time": ["10:00", "11:00", "12:00"],
-            "direction": ["North", "South", "East"],
-            "service_pattern_stop_id": [101, 102, 103],
-        }
-    )
+    mock_get_df_vehicle_journey.return_value = [
+        pd.DataFrame(
+            {
+                "is_timing_point": [False, True, True],
+                "vehicle_journey_id": [1, 2, 3],
+                "auto_sequence_number": [1, 2, 3],
+                "activity": ["setDown", "pickUp", "setDownDriverRequest"],
+                "common_name": ["Stop A", "Stop B", "Stop C"],
+                "start_time": ["10:00", "11:00", "12:00"],
+                "direction": ["North", "South", "East"],
+                "service_pattern_stop_id": [101, 102, 103],
+            }
+        )
+    ]
     lambda_worker(None, mocked_check)
 
     assert mock_get_df_vehicle_journey.called
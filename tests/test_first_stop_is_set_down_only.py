@@ -11,7 +11,7 @@ logger.setLevel(logging.DEBUG)
 
 @patch("src.template.first_stop_is_set_down_only.Check")
 @patch("src.template.first_stop_is_set_down_only.ObservationResult")
-@patch("src.template.first_stop_is_set_down_only.get_df_vehicle_journey")
+@patch("src.template.first_stop_is_set_down_only.get_df_vehicle_journey_chunks")
 def test_lambda_handler_valid_check(
     mock_get_df_vehicle_journey, mock_observation, mock_check, mocked_context
 ):
@@ -22,17 +22,19 @@ def test_lambda_handler_valid_check(
     mocked_observations.add_observation = MagicMock()
     mocked_observations.write_observations = MagicMock()
     mocked_observations.observations = [1, 3, 4]
-    mock_get_df_vehicle_journey.return_value = pd.DataFrame(
-        {
-            "vehicle_journey_id": [1, 2, 3],
-            "auto_sequence_number": [1, 2, 3],
-            "activity": ["setDown", "pickUp", "pickUpDriverRequest"],
-            "common_name": ["Stop A", "Stop B", "Stop C"],
-            "start_time": ["10:00", "11:00", "12:00"],
-            "direction": ["North", "South", "East"],
-            "service_pattern_stop_id": [101, 102, 103],
-        }
-    )
+    mock_get_df_vehicle_journey.return_value = [
+        pd.DataFrame(
+            {
+                "vehicle_journey_id": [1, 2, 3],
+                "auto_sequence_number": [1, 2, 3],
+                "activity": ["setDown", "pickUp", "pickUpDriverRequest"],
+                "common_name": ["Stop A", "Stop B", "Stop C"],
+                "start_time": ["10:00", "11:00", "12:00"],
+                "direction": ["North", "South", "East"],
+                "service_pattern_stop_id": [101, 102, 103],
+            }
+        )
+    ]
     lambda_worker(None, mocked_check)
 
     assert mock_get_df_vehicle_journey.called
@@ -5,7 +5,7 @@ from tests.test_templates import lambda_invalid_check
 from tests.fixtures.context import mocked_context  # noqa
 
 
-@patch("src.template.last_stop_is_pick_up_only.get_df_vehicle_journey")
+@patch("src.template.last_stop_is_pick_up_only.get_df_vehicle_journey_chunks")
 @patch("src.template.last_stop_is_pick_up_only.ObservationResult")
 @patch("src.template.last_stop_is_pick_up_only.Check")
 def test_lambda_handler_valid_check(
@@ -18,18 +18,20 @@ def test_lambda_handler_valid_check(
     mocked_observations.write_observations = MagicMock()
     mocked_check.set_status = MagicMock()
     mocked_observations.observations = [1, 3, 4]
-    mock_get_df_vehicle_journey.return_value = pd.DataFrame(
-        {
-            "vehicle_journey_id": [1, 2, 3],
-            "sequence_number": [1, 2, 3],
-            "activity": ["setDown", "pickUp", "setDownDriverRequest"],
-            "common_name": ["Stop A", "Stop B", "Stop C"],
-            "start_time": ["10:00", "11:00", "12:00"],
-            "direction": ["North", "South", "East"],
-            "service_pattern_stop_id": [101, 102, 103],
-            "auto_sequence_number": [1, 2, 3],
-        }
-    )
+    mock_get_df_vehicle_journey.return_value = [
+        pd.DataFrame(
+            {
+                "vehicle_journey_id": [1, 2, 3],
+                "sequence_number": [1, 2, 3],
+                "activity": ["setDown", "pickUp", "setDownDriverRequest"],
+                "common_name": ["Stop A", "Stop B", "Stop C"],
+                "start_time": ["10:00", "11:00", "12:00"],
+                "direction": ["North", "South", "East"],
+                "service_pattern_stop_id": [101, 102, 103],
+                "auto_sequence_number": [1, 2, 3],
+            }
+        )
+    ]
     lambda_worker(None, mocked_check)
 
     assert mock_get_df_vehicle_journey.called
@@ -8,7 +8,7 @@ from tests.test_templates import lambda_invalid_check
 
 class TestMissingJourneyCode:
 
-    @patch("src.template.missing_journey_code.get_df_vehicle_journey")
+    @patch("src.template.missing_journey_code.get_df_vehicle_journey_chunks")
     @patch("src.template.missing_journey_code.ObservationResult")
     @patch("src.template.missing_journey_code.Check")
     def test_lambda_handler_success(
@@ -40,7 +40,7 @@ class TestMissingJourneyCode:
             }
         )
 
-        mock_get_df_vehicle_journey.return_value = mock_df
+        mock_get_df_vehicle_journey.return_value = [mock_df]
 
         lambda_worker(None, mocked_check)
 
@@ -51,7 +51,7 @@ class TestMissingJourneyCode:
             DQSTaskResultStatus.SUCCESS.value
         )
 
-    @patch("src.template.missing_journey_code.get_df_vehicle_journey")
+    @patch("src.template.missing_journey_code.get_df_vehicle_journey_chunks")
     @patch("src.template.missing_journey_code.ObservationResult")
     @patch("src.template.missing_journey_code.Check")
     @patch("src.template.missing_journey_code.logger")
@@ -79,7 +79,7 @@ class TestMissingJourneyCode:
             }
         )
 
-        mock_get_df_vehicle_journey.return_value = mock_df
+        mock_get_df_vehicle_journey.return_value = [mock_df]
 
         lambda_worker(None, mocked_check)
 
@@ -92,7 +92,7 @@ class TestMissingJourneyCode:
 
         mock_logger.info.assert_any_call("Check status updated in DB")
 
-    @patch("src.template.missing_journey_code.get_df_vehicle_journey")
+    @patch("src.template.missing_journey_code.get_df_vehicle_journey_chunks")
     @patch("src.template.missing_journey_code.ObservationResult")
     @patch("src.template.missing_journey_code.Check")
     @patch("src.template.missing_journey_code.logger")
@@ -109,7 +109,7 @@ class TestMissingJourneyCode:
         mocked_observation = mock_observation.return_value
         mocked_check.set_status = MagicMock()
 
-        mock_get_df_vehicle_journey.return_value = pd.DataFrame()
+        mock_get_df_vehicle_journey.return_value = [pd.DataFrame()]
 
         lambda_worker(None, mocked_check)
 
@@ -120,7 +120,7 @@ class TestMissingJourneyCode:
             DQSTaskResultStatus.FAILED.value
         )
 
-    @patch("src.template.missing_journey_code.get_df_vehicle_journey")
+    @patch("src.template.missing_journey_code.get_df_vehicle_journey_chunks")
     @patch("src.template.missing_journey_code.ObservationResult")
     @patch("src.template.missing_journey_code.Check")
     @patch("src.template.missing_journey_code.logger")
@@ -2,6 +2,7 @@ from os.path import dirname
 from unittest.mock import MagicMock, patch
 import pandas as pd
 from src.template.no_timing_point_for_more_than_15_minutes import (
+    find_timing_point_gaps,
     lambda_worker,
     lambda_handler,
 )
@@ -14,7 +15,9 @@ from tests.fixtures.context import mocked_context  # noqa
 @patch(
     "src.template.no_timing_point_for_more_than_15_minutes.OrganisationTxcFileAttributes"
 )
-@patch("src.template.no_timing_point_for_more_than_15_minutes.get_df_vehicle_journey")
+@patch(
+    "src.template.no_timing_point_for_more_than_15_minutes.get_df_vehicle_journey_chunks"
+)
 def test_lambda_handler_valid_check(
     mock_get_df_vehicle_journey,
     mock_txc_file_attributes,
@@ -39,7 +42,7 @@ def test_lambda_handler_valid_check(
         df["departure_time"], format="%H:%M:%S"
     ).dt.time
     df["start_time"] = pd.to_datetime(df["start_time"], format="%H:%M:%S").dt.time
-    mock_get_df_vehicle_journey.return_value = df
+    mock_get_df_vehicle_journey.return_value = [df]
 
     lambda_worker(event, mocked_check)
 
@@ -58,3 +61,32 @@ def test_lambda_handler_valid_check(
 @patch("src.template.no_timing_point_for_more_than_15_minutes.Check")
 def test_lambda_handler_invalid_check(mock_check, mocked_context):
     lambda_invalid_check(lambda_handler, mock_check, mocked_context)
+
+
+def test_find_timing_point_gaps_within_each_journey():
+    df = pd.DataFrame(
+        {
+            "vehicle_journey_id": [2, 1, 1, 1, 1, 2, 2, 3],
+            "auto_sequence_number": [0, 3, 0, 1, 2, 1, 2, 0],
+            "is_timing_point": [True, True, True, False, True, True, True, True],
+            "departure_time": [
+                "07:00",
+                "06:40",
+                "06:00",
+                "06:10",
+                "06:20",
+                None,
+                "07:30",
+                "08:00",
+            ],
+            "service_pattern_stop_id": [20, 13, 10, 11, 12, 21, 22, 30],
+        }
+    )
+
+    gaps = find_timing_point_gaps(df)
+
+    # Journey 1 is 06:00, 06:20 (the 06:10 isn't a timing point), 06:40 and
+    # journey 2 has no time between 07:00 and 07:30, nor is journey 3's first
+    # stop compared with journey 2's last
+    assert gaps["service_pattern_stop_id"].tolist() == [12, 13]
+    assert gaps["previous_service_pattern_stop_id"].tolist() == [10, 12]